@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Micro-benchmark of the cpuFreq getters against a fake sysfs tree,
+    comparing open/read/close with the persistent fds (pread) mode.
+
+    python3 benchmarks/bench_read.py --cpus 192 --repeat 200
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from cpufreq import cpuFreq, SysfsBackend, write_fake_sysfs
+
+
+def bench(cpu, repeat):
+    res = {}
+    for name in ("get_frequencies", "get_governors", "get_max_freq"):
+        fn = getattr(cpu, name)
+        fn()
+        res[name] = min(timeit.repeat(fn, number=repeat, repeat=3))/repeat
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cpuFreq reads "
+                                                 "on a fake sysfs tree")
+    parser.add_argument("--cpus", type=int, default=192)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="cpufreq-bench-")
+    try:
+        write_fake_sysfs(root, args.cpus)
+        cpu = cpuFreq(backend=SysfsBackend(root))
+        plain = bench(cpu, args.repeat)
+        cpu = cpuFreq(backend=SysfsBackend(root), persistent_fds=True)
+        pread = bench(cpu, args.repeat)
+        cpu.close_fds()
+    finally:
+        shutil.rmtree(root)
+
+    print("{} cpus, {} calls".format(args.cpus, args.repeat))
+    print("{:^16} - {:^12} - {:^12} - {:^7}".format("Method", "open (us)",
+                                                  "pread (us)", "Speedup"))
+    for name in plain:
+        print("{:>16} - {:12.1f} - {:12.1f} - {:6.2f}x".format(
+            name, plain[name]*1e6, pread[name]*1e6, plain[name]/pread[name]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+    Throughput benchmarks of the cpuFreq getters and setters on fake
+    sysfs trees, run with pytest-benchmark:
+
+    python3 -m pytest benchmarks --benchmark-group-by=func
+"""
+import shutil
+import tempfile
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import cpufreq
+
+
+CPUS = [8, 64, 512]
+
+
+@pytest.fixture(params=["memory", "sysfs", "sysfs-pread"])
+def make_cpu(request):
+    roots = []
+
+    def make(ncpus, **kwargs):
+        if request.param == "memory":
+            backend = cpufreq.MemoryBackend.fake(ncpus, **kwargs)
+        else:
+            root = tempfile.mkdtemp(prefix="cpufreq-bench-")
+            roots.append(root)
+            cpufreq.write_fake_sysfs(root, ncpus, **kwargs)
+            backend = cpufreq.SysfsBackend(
+                root, persistent_fds=request.param == "sysfs-pread")
+        return cpufreq.cpuFreq(backend=backend)
+
+    yield make
+    for root in roots:
+        shutil.rmtree(root)
+
+
+@pytest.mark.parametrize("ncpus", CPUS)
+def test_get_frequencies(benchmark, make_cpu, ncpus):
+    cpu = make_cpu(ncpus)
+    res = benchmark(cpu.get_frequencies)
+    assert len(res) == ncpus
+
+
+@pytest.mark.parametrize("ncpus", CPUS)
+def test_get_frequencies_array(benchmark, make_cpu, ncpus):
+    cpu = make_cpu(ncpus)
+    out = cpu.get_frequencies(as_array=True)
+    res = benchmark(cpu.get_frequencies, out=out)
+    assert res is out
+
+
+@pytest.mark.parametrize("ncpus", CPUS)
+def test_get_governors(benchmark, make_cpu, ncpus):
+    cpu = make_cpu(ncpus)
+    res = benchmark(cpu.get_governors)
+    assert len(res) == ncpus
+
+
+@pytest.mark.parametrize("ncpus", CPUS)
+def test_snapshot(benchmark, make_cpu, ncpus):
+    cpu = make_cpu(ncpus)
+    res = benchmark(cpu.snapshot)
+    assert len(res) == ncpus
+
+
+@pytest.mark.parametrize("ncpus", CPUS)
+def test_set_max_frequencies(benchmark, make_cpu, ncpus):
+    cpu = make_cpu(ncpus, policy_size=2)
+    freq = cpu.available_frequencies[1]
+    res = benchmark(cpu.set_max_frequencies, freq)
+    assert len(res) == ncpus
+
+
+@pytest.mark.parametrize("ncpus", CPUS)
+def test_set_governors(benchmark, make_cpu, ncpus):
+    cpu = make_cpu(ncpus, policy_size=2)
+    res = benchmark(cpu.set_governors, "performance")
+    assert len(res) == ncpus
+
+
+@pytest.mark.parametrize("ncpus", CPUS)
+def test_reset(benchmark, make_cpu, ncpus):
+    cpu = make_cpu(ncpus, policy_size=2)
+    benchmark(cpu.reset)
+
+
+@pytest.mark.parametrize("ncpus", CPUS)
+def test_export_sweep(benchmark, make_cpu, ncpus):
+    from cpufreq.exporter import MetricsCollector
+    collector = MetricsCollector(make_cpu(ncpus, policy_size=2), ttl=0)
+    body = benchmark(collector.render)
+    assert body.count(b"cpufreq_governor{") == ncpus
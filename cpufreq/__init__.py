@@ -1,2 +1,57 @@
-from .cpufreq import cpuFreq, CPUFreqErrorInit, CPUFreqBaseError
+import importlib
+import sys
+
+from .cpufreq import cpuFreq, CPUFreqErrorInit, CPUFreqBaseError, CPUState
+from .state import CPUStateArray
+from .cpuset import CpuSet
+from .capabilities import Capabilities, CapabilityCache
+from .backend import (Backend, SysfsBackend, MemoryBackend, fake_sysfs,
+                      write_fake_sysfs, fake_powercap, write_fake_powercap)
+from .topology import Topology
 from . import run
+
+# name -> module, imported on first access so import cpufreq only loads
+# the core (asyncio, thread pools, http.server come with their users)
+_LAZY = {"HotplugWatcher": "watch",
+         "WatchEvent": "watch",
+         "FrequencySampler": "sampler",
+         "ResidencyTracker": "residency",
+         "EnergyMeter": "energy",
+         "Measurement": "energy",
+         "Sweep": "sweep",
+         "TransitionLatency": "latency",
+         "Batch": "batch",
+         "BatchWrite": "batch",
+         "Pinned": "pinning",
+         "pinned": "pinning",
+         "AsyncCPUFreq": "aio",
+         "AsyncSampler": "aio",
+         "SharedPublisher": "shared",
+         "SharedState": "shared",
+         "Placement": "placement",
+         "PlacementDecision": "placement",
+         "Controller": "controller",
+         "Policy": "controller",
+         "OndemandPolicy": "controller",
+         "TargetUtilizationPolicy": "controller",
+         "BudgetPolicy": "controller"}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(
+            __name__, name))
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
+if sys.version_info < (3, 7):
+    # no module __getattr__ before 3.7
+    for _name in _LAZY:
+        __getattr__(_name)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with AsyncCPUFreq class, the asyncio counterpart of cpuFreq:
+    the sysfs accesses run on a bounded thread pool so they never block
+    the event loop.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .cpufreq import cpuFreq
+
+
+def _running_loop():
+    # get_running_loop is 3.7+, get_event_loop returns the running loop
+    # when called from a coroutine on older versions
+    if hasattr(asyncio, "get_running_loop"):
+        return asyncio.get_running_loop()
+    return asyncio.get_event_loop()
+
+
+class AsyncSampler:
+    """
+    Async iterator over periodic snapshots of the cpus, see
+    AsyncCPUFreq.sample(). The ticks are scheduled from the start time so
+    they do not drift; ticks missed by a slow consumer are skipped.
+    """
+
+    def __init__(self, acpu, interval, rg=None, fields=("frequency",),
+                 count=None):
+        self.__acpu = acpu
+        self.interval = interval
+        self.rg = rg
+        self.fields = fields
+        self.count = count
+        self.__next = None
+        self.__done = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.count is not None and self.__done >= self.count:
+            raise StopAsyncIteration
+        loop = _running_loop()
+        now = loop.time()
+        if self.__next is None:
+            self.__next = now
+        elif now < self.__next:
+            await asyncio.sleep(self.__next - now)
+        else:
+            # late, realign on the next tick instead of bursting
+            missed = int((now - self.__next) / self.interval)
+            self.__next += missed*self.interval
+        stamp = self.__next
+        self.__next += self.interval
+        self.__done += 1
+        data = await self.__acpu.snapshot(self.rg, fields=self.fields)
+        return stamp, data
+
+
+class AsyncCPUFreq:
+    """
+    Awaitable versions of the cpuFreq getters, setters, reset and
+    snapshot. The calls run on a bounded thread pool; cpuFreq runs them
+    one at a time, and the setters write the policies concurrently with
+    max_workers threads (the workers argument of the cpuFreq setters).
+        Attributes
+            cpu
+            max_workers
+        Methods
+            get_online_cpus()
+            get_governors()
+            get_frequencies()
+            get_max_freq()
+            get_min_freq()
+            snapshot()
+            set_governors()
+            set_frequencies()
+            set_max_frequencies()
+            set_min_frequencies()
+            set_frequency_limits()
+            reset()
+            sample()
+            aclose()
+            close()
+    """
+
+    def __init__(self, cpu=None, max_workers=4):
+        """
+        cpu: cpuFreq instance, default the shared instance
+        max_workers: threads doing the sysfs accesses
+        """
+        self.cpu = cpu if cpu is not None else cpuFreq()
+        self.max_workers = max_workers
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    # private
+    def __run(self, fn, *args, **kwargs):
+        loop = _running_loop()
+        return loop.run_in_executor(self.__executor,
+                                    partial(fn, *args, **kwargs))
+
+    async def __set(self, setter, value, rg):
+        return await self.__run(setter, value, rg=rg,
+                                workers=self.max_workers)
+
+    # interfaces
+    async def get_online_cpus(self):
+        return await self.__run(self.cpu.get_online_cpus)
+
+    async def get_governors(self):
+        return await self.__run(self.cpu.get_governors)
+
+    async def get_frequencies(self, rg=None, as_array=False):
+        return await self.__run(self.cpu.get_frequencies, rg, as_array)
+
+    async def get_max_freq(self, rg=None, as_array=False):
+        return await self.__run(self.cpu.get_max_freq, rg, as_array)
+
+    async def get_min_freq(self, rg=None, as_array=False):
+        return await self.__run(self.cpu.get_min_freq, rg, as_array)
+
+    async def snapshot(self, rg=None, fields=None):
+        if fields is None:
+            return await self.__run(self.cpu.snapshot, rg)
+        return await self.__run(self.cpu.snapshot, rg, fields=fields)
+
+    async def set_governors(self, gov, rg=None):
+        return await self.__set(self.cpu.set_governors, gov, rg)
+
+    async def set_frequencies(self, freq, rg=None):
+        return await self.__set(self.cpu.set_frequencies, freq, rg)
+
+    async def set_max_frequencies(self, freq, rg=None):
+        return await self.__set(self.cpu.set_max_frequencies, freq, rg)
+
+    async def set_min_frequencies(self, freq, rg=None):
+        return await self.__set(self.cpu.set_min_frequencies, freq, rg)
+
+    async def set_frequency_limits(self, limits, rg=None):
+        return await self.__set(self.cpu.set_frequency_limits, limits, rg)
+
+    async def reset(self, rg=None):
+        await self.__run(self.cpu.reset, rg)
+
+    def sample(self, interval, rg=None, fields=("frequency",), count=None):
+        """
+        Snapshot the cpus every interval seconds:
+            async for stamp, states in acpu.sample(0.1):
+                ...
+
+        interval: seconds between the samples
+        rg: list of range of cores
+        fields: CPUState fields to read
+        count: number of samples, default endless
+        return: AsyncSampler yielding (loop time, dict cpu -> CPUState)
+        """
+        return AsyncSampler(self, interval, rg, fields, count)
+
+    async def aclose(self):
+        """
+        Stop the thread pool, waiting for the pending calls without
+        blocking the event loop
+        """
+        await _running_loop().run_in_executor(None, self.__executor.shutdown)
+
+    def close(self):
+        """
+        Stop the thread pool, the pending calls finish in the background
+        """
+        self.__executor.shutdown(wait=False)
@@ -0,0 +1,552 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with the backends used by cpuFreq to access the cpu sysfs
+    directory (and EnergyMeter the powercap one), and generators of fake
+    cpu sysfs and powercap trees.
+"""
+from os import path
+import errno
+import os
+import threading
+
+from .cpuset import CpuSet
+
+
+SYSFS_CPU = "/sys/devices/system/cpu"
+SYSFS_POWERCAP = "/sys/class/powercap"
+
+
+def user_hz():
+    """
+    Clock ticks per second (USER_HZ) of the /proc times and of the
+    cpufreq time_in_state counters
+    """
+    try:
+        return float(os.sysconf("SC_CLK_TCK"))
+    except (AttributeError, ValueError, OSError):
+        return 100.0
+
+
+class Backend:
+    """
+    Access to a cpu sysfs directory, file names are relative to it
+        Attributes
+            persistent_fds
+        Methods
+            read()
+            write()
+            isfile()
+            listdir()
+            open()
+            drop()
+            close()
+    """
+
+    persistent_fds = False
+
+    def read(self, fname):
+        """
+        Read the content of a file
+        """
+        raise NotImplementedError
+
+    def write(self, fname, data):
+        """
+        Write bytes data to a file
+        """
+        raise NotImplementedError
+
+    def isfile(self, fname):
+        """
+        Check if a file exists
+        """
+        raise NotImplementedError
+
+    def listdir(self, fname):
+        """
+        List the entries of a directory
+        """
+        raise NotImplementedError
+
+    def open(self, fname):
+        """
+        Open a file to be read many times, the returned object has read()
+        and close() methods
+        """
+        raise NotImplementedError
+
+    def drop(self, prefixes):
+        """
+        Forget cached state of files under the directories prefixes
+        """
+        pass
+
+    def close(self):
+        """
+        Release every resource kept by the backend
+        """
+        pass
+
+
+class SysfsFile:
+    """
+    File kept open and re-read with pread into a reusable buffer, the
+    buffer grows on demand up to the sysfs attribute limit (one page)
+    """
+
+    def __init__(self, fpath, size=64):
+        self.fd = os.open(fpath, os.O_RDONLY)
+        self.__buf = bytearray(size)
+        self.__view = memoryview(self.__buf)
+
+    def read(self):
+        while True:
+            if hasattr(os, "preadv"):
+                n = os.preadv(self.fd, [self.__buf], 0)
+            else:
+                data = os.pread(self.fd, len(self.__buf), 0)
+                n = len(data)
+                self.__view[:n] = data
+            if n < len(self.__buf):
+                return str(self.__view[:n], "utf-8")
+            # the attribute did not fit, grow the buffer and read again
+            self.__view.release()
+            self.__buf = bytearray(2*len(self.__buf))
+            self.__view = memoryview(self.__buf)
+
+    def close(self):
+        self.__view.release()
+        os.close(self.fd)
+
+
+class SysfsBackend(Backend):
+    """
+    Backend reading the real sysfs, or any directory with the same
+    layout. With persistent_fds the files read are kept open and re-read
+    with pread instead of open/read/close on every access; the threads
+    share them under a lock.
+    """
+
+    # initial size of the buffers used by the persistent fds
+    PREAD_SIZE = 64
+
+    def __init__(self, basedir=SYSFS_CPU, persistent_fds=False):
+        self.basedir = basedir
+        self.persistent_fds = persistent_fds
+        self.__fds = {}
+        # an fd closed by a thread while another reads it could be reused
+        # by an unrelated file
+        self.__lock = threading.RLock()
+
+    # private
+    def __reopen(self, fname):
+        self.__close(fname)
+        entry = SysfsFile(path.join(self.basedir, fname),
+                          SysfsBackend.PREAD_SIZE)
+        self.__fds[fname] = entry
+        return entry
+
+    def __close(self, fname):
+        entry = self.__fds.pop(fname, None)
+        if entry is not None:
+            entry.close()
+
+    # interfaces
+    def read(self, fname):
+        if self.persistent_fds:
+            with self.__lock:
+                entry = self.__fds.get(fname)
+                if entry is None:
+                    entry = self.__reopen(fname)
+                try:
+                    return entry.read()
+                except OSError:
+                    # the kernel removed the attribute under the open fd
+                    # (cpu hot-plugged, policy recreated), reopen it by
+                    # path once
+                    return self.__reopen(fname).read()
+        fpath = path.join(self.basedir, fname)
+        with open(fpath, "rb") as f:
+            data = f.read().decode("utf-8")
+        return data
+
+    def write(self, fname, data):
+        fpath = path.join(self.basedir, fname)
+        with open(fpath, "wb") as f:
+            f.write(data)
+
+    def isfile(self, fname):
+        return path.isfile(path.join(self.basedir, fname))
+
+    def listdir(self, fname):
+        return os.listdir(path.join(self.basedir, fname))
+
+    def open(self, fname):
+        return SysfsFile(path.join(self.basedir, fname),
+                         SysfsBackend.PREAD_SIZE)
+
+    def drop(self, prefixes):
+        prefixes = set(prefixes)
+        with self.__lock:
+            for fname in list(self.__fds):
+                if fname.split(path.sep, 1)[0] in prefixes:
+                    self.__close(fname)
+
+    def close(self):
+        with self.__lock:
+            for fname in list(self.__fds):
+                self.__close(fname)
+
+
+class MemoryFile:
+    """
+    File of a MemoryBackend opened to be read many times
+    """
+
+    def __init__(self, backend, fname):
+        self.__backend = backend
+        self.__fname = fname
+
+    def read(self):
+        return self.__backend.read(self.__fname)
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(Backend):
+    """
+    Backend keeping a fake cpu sysfs tree in memory. Writes emulate the
+    kernel: cpu hotplug updates the online and offline masks, governors
+    and limits are validated and move scaling_cur_freq.
+        Attributes
+            files
+            links
+            writes
+    """
+
+    def __init__(self, files=None, links=None):
+        """
+        files: dict file name -> content
+        links: dict directory name -> directory it points to, like the
+            cpuN/cpufreq -> cpufreq/policyN symlinks
+        """
+        self.files = dict(files or {})
+        self.links = dict(links or {})
+        self.writes = 0
+        self.__trans = {}
+        self.__lock = threading.RLock()
+
+    @classmethod
+    def fake(cls, ncpus, **kwargs):
+        """
+        Build a backend with a fake tree, see fake_sysfs()
+        """
+        return cls(*fake_sysfs(ncpus, **kwargs))
+
+    # private
+    def __resolve(self, fname):
+        parts = fname.strip("/").split("/")
+        i = 1
+        while i <= len(parts):
+            target = self.links.get("/".join(parts[:i]))
+            if target is not None:
+                parts = target.split("/") + parts[i:]
+                i = 1
+                continue
+            i += 1
+        return "/".join(parts)
+
+    def __get(self, fname):
+        return self.files[fname].strip()
+
+    def __set(self, fname, value):
+        self.files[fname] = "%s\n" % value
+
+    def __hotplug(self, cpu, online):
+        cpus = CpuSet.from_list(self.__get("online"))
+        cpus = cpus | [cpu] if online else cpus - [cpu]
+        present = CpuSet.from_list(self.__get("present"))
+        self.__set("online", cpus)
+        self.__set("offline", present - cpus)
+        self.__set("cpu%i/online" % cpu, int(online))
+
+    def __emulate(self, real, value):
+        """
+        Apply a write to the attribute real (resolved name) as the
+        cpufreq core would
+        """
+        pdir, _, var = real.rpartition("/")
+
+        def attr(name):
+            return self.__get(pdir + "/" + name)
+
+        def setattr_(name, v):
+            self.__set(pdir + "/" + name, v)
+
+        def move(freq):
+            self.__transition(pdir, int(attr("scaling_cur_freq")), int(freq))
+
+        def invalid():
+            return OSError(errno.EINVAL, os.strerror(errno.EINVAL), real)
+
+        if var == "scaling_governor":
+            if value not in attr("scaling_available_governors").split():
+                raise invalid()
+            setattr_(var, value)
+            if value == "performance":
+                move(attr("scaling_max_freq"))
+            elif value == "powersave":
+                move(attr("scaling_min_freq"))
+            if value == "userspace":
+                setattr_("scaling_setspeed", attr("scaling_cur_freq"))
+            else:
+                setattr_("scaling_setspeed", "<unsupported>")
+            return
+        if var not in ("scaling_setspeed", "scaling_max_freq",
+                       "scaling_min_freq"):
+            setattr_(var, value)
+            return
+        try:
+            freq = int(value)
+        except ValueError:
+            raise invalid()
+        cmin = int(attr("cpuinfo_min_freq"))
+        cmax = int(attr("cpuinfo_max_freq"))
+        fmin = int(attr("scaling_min_freq"))
+        fmax = int(attr("scaling_max_freq"))
+        if var == "scaling_setspeed":
+            if attr("scaling_governor") != "userspace":
+                raise invalid()
+            freq = max(fmin, min(fmax, freq))
+            setattr_(var, freq)
+        elif var == "scaling_max_freq":
+            fmax = max(cmin, min(cmax, freq))
+            setattr_(var, fmax)
+            setattr_("scaling_min_freq", min(fmin, fmax))
+            freq = min(int(attr("scaling_cur_freq")), fmax)
+        else:
+            fmin = max(cmin, min(cmax, freq, fmax))
+            setattr_(var, fmin)
+            freq = max(int(attr("scaling_cur_freq")), fmin)
+        move(freq)
+
+    def __transition(self, pdir, old, new):
+        """
+        Move scaling_cur_freq of a policy and count the transition in its
+        stats like cpufreq_stats does
+        """
+        self.__set(pdir + "/scaling_cur_freq", new)
+        if old == new or pdir + "/stats/total_trans" not in self.files:
+            return
+        self.__set(pdir + "/stats/total_trans",
+                   int(self.__get(pdir + "/stats/total_trans")) + 1)
+        table = self.__trans.setdefault(pdir, {})
+        table[(old, new)] = table.get((old, new), 0) + 1
+        freqs = [int(line.split()[0]) for line in
+                 self.files[pdir + "/stats/time_in_state"].splitlines()]
+        self.files[pdir + "/stats/trans_table"] = format_trans_table(
+            freqs, table)
+
+    # interfaces
+    def read(self, fname):
+        with self.__lock:
+            try:
+                return self.files[self.__resolve(fname)]
+            except KeyError:
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), fname)
+
+    def write(self, fname, data):
+        with self.__lock:
+            real = self.__resolve(fname)
+            if real not in self.files:
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), fname)
+            value = data.decode("utf-8").strip()
+            self.writes += 1
+            parts = real.split("/")
+            if len(parts) == 2 and parts[1] == "online" and \
+               parts[0].startswith("cpu"):
+                self.__hotplug(int(parts[0][3:]), value == "1")
+            elif real.startswith("cpufreq/"):
+                self.__emulate(real, value)
+            else:
+                self.__set(real, value)
+
+    def isfile(self, fname):
+        with self.__lock:
+            return self.__resolve(fname) in self.files
+
+    def listdir(self, fname):
+        with self.__lock:
+            prefix = self.__resolve(fname).strip("/")
+            prefix = prefix + "/" if prefix else ""
+            names = set()
+            for name in list(self.files) + list(self.links):
+                if name.startswith(prefix):
+                    names.add(name[len(prefix):].split("/", 1)[0])
+            if not names:
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), fname)
+            return sorted(names)
+
+    def open(self, fname):
+        if not self.isfile(fname):
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), fname)
+        return MemoryFile(self, fname)
+
+
+FAKE_FREQUENCIES = [3000000, 2600000, 2200000, 1800000, 1400000, 1000000]
+FAKE_GOVERNORS = ["conservative", "ondemand", "userspace", "powersave",
+                  "performance", "schedutil"]
+
+
+def format_trans_table(freqs, table):
+    """
+    Format a cpufreq stats trans_table
+
+    freqs: frequencies in the table order
+    table: dict (from, to) -> number of transitions
+    """
+    lines = ["   From  :    To",
+             "         : " + "".join("%10i" % f for f in freqs)]
+    for f in freqs:
+        lines.append("%9i: " % f + "".join(
+            "%10i" % table.get((f, t), 0) for t in freqs))
+    return "\n".join(lines) + "\n"
+
+
+def fake_sysfs(ncpus, driver="acpi-cpufreq", governors=FAKE_GOVERNORS,
+               frequencies=FAKE_FREQUENCIES, policy_size=1, smt=1,
+               packages=1, available_frequencies=True, stats=True):
+    """
+    Generate the files of a fake cpu sysfs tree
+
+    ncpus: number of cpus, all online
+    driver: scaling driver name
+    governors: available governors, the first is the current one
+    frequencies: available frequencies in KHz
+    policy_size: number of consecutive cpus sharing a cpufreq policy
+    smt: threads per core, numbered like Linux (siblings of cpu c are
+        c + k*ncpus/smt)
+    packages: number of packages (and NUMA nodes)
+    available_frequencies: provide scaling_available_frequencies, drivers
+        like intel_pstate do not
+    stats: provide the cpufreq stats (time_in_state, total_trans and
+        trans_table), all zero
+    return: (files, links) for MemoryBackend or write_fake_sysfs
+    """
+    files = {}
+    links = {}
+    cpus = CpuSet(range(ncpus))
+    for name, value in (("online", cpus), ("present", cpus),
+                        ("possible", cpus), ("offline", ""),
+                        ("kernel_max", ncpus - 1)):
+        files[name] = "%s\n" % value
+    fmax = max(frequencies)
+    fmin = min(frequencies)
+    ncores = max(1, ncpus // smt)
+    per_package = max(1, -(-ncores // packages))
+    for cpu in range(ncpus):
+        base = "cpu%i" % cpu
+        core = cpu % ncores
+        package = core // per_package
+        siblings = range(core, ncpus, ncores)
+        if cpu:
+            files[base + "/online"] = "1\n"
+        files[base + "/topology/core_id"] = "%i\n" % (core % per_package)
+        files[base + "/topology/physical_package_id"] = "%i\n" % package
+        files[base + "/topology/thread_siblings_list"] = \
+            "%s\n" % CpuSet(siblings)
+        links[base + "/node%i" % package] = "node/node%i" % package
+        policy = cpu - cpu % policy_size
+        links[base + "/cpufreq"] = "cpufreq/policy%i" % policy
+    for policy in range(0, ncpus, policy_size):
+        pdir = "cpufreq/policy%i/" % policy
+        related = " ".join(str(c) for c in
+                           range(policy, min(ncpus, policy + policy_size)))
+        for name, value in (("scaling_driver", driver),
+                            ("scaling_available_governors",
+                             " ".join(governors)),
+                            ("scaling_governor", governors[0]),
+                            ("scaling_cur_freq", fmax),
+                            ("scaling_max_freq", fmax),
+                            ("scaling_min_freq", fmin),
+                            ("scaling_setspeed", "<unsupported>"),
+                            ("cpuinfo_max_freq", fmax),
+                            ("cpuinfo_min_freq", fmin),
+                            ("cpuinfo_transition_latency", 10000),
+                            ("related_cpus", related),
+                            ("affected_cpus", related)):
+            files[pdir + name] = "%s\n" % value
+        if available_frequencies:
+            files[pdir + "scaling_available_frequencies"] = \
+                "%s\n" % " ".join(str(f) for f in frequencies)
+        if stats:
+            files[pdir + "stats/time_in_state"] = "".join(
+                "%i 0\n" % f for f in frequencies)
+            files[pdir + "stats/total_trans"] = "0\n"
+            files[pdir + "stats/trans_table"] = format_trans_table(
+                frequencies, {})
+    return files, links
+
+
+def write_fake_sysfs(root, ncpus, **kwargs):
+    """
+    Write a fake cpu sysfs tree under root, the links are symlinks so
+    the layout matches the real sysfs. Arguments as fake_sysfs().
+    """
+    return write_tree(root, *fake_sysfs(ncpus, **kwargs))
+
+
+def fake_powercap(packages=1, core=True, dram=True,
+                  max_energy_range_uj=262143328850):
+    """
+    Generate the files of a fake powercap tree with the intel-rapl
+    zones, counters start at zero
+
+    packages: number of package zones
+    core: add a core subzone to each package
+    dram: add a dram subzone to each package
+    max_energy_range_uj: value where the energy counters wrap
+    return: (files, links) for MemoryBackend or write_tree
+    """
+    files = {"intel-rapl/enabled": "1\n"}
+    for package in range(packages):
+        zones = [("intel-rapl:%i" % package, "package-%i" % package)]
+        subzones = [name for name, on in (("core", core), ("dram", dram))
+                    if on]
+        for i, name in enumerate(subzones):
+            zones.append(("intel-rapl:%i:%i" % (package, i), name))
+        for zone, name in zones:
+            files[zone + "/name"] = "%s\n" % name
+            files[zone + "/energy_uj"] = "0\n"
+            files[zone + "/max_energy_range_uj"] = \
+                "%i\n" % max_energy_range_uj
+            files[zone + "/enabled"] = "1\n"
+    return files, {}
+
+
+def write_fake_powercap(root, **kwargs):
+    """
+    Write a fake powercap tree under root. Arguments as fake_powercap().
+    """
+    return write_tree(root, *fake_powercap(**kwargs))
+
+
+def write_tree(root, files, links):
+    """
+    Write the files of a fake tree under root, the links are symlinks
+    so the layout matches the real sysfs
+    """
+    for name, value in files.items():
+        fpath = path.join(root, name)
+        if not path.isdir(path.dirname(fpath)):
+            os.makedirs(path.dirname(fpath))
+        with open(fpath, "w") as f:
+            f.write(value)
+    for name, target in links.items():
+        fpath = path.join(root, name)
+        if not path.isdir(path.join(root, target)):
+            os.makedirs(path.join(root, target))
+        os.symlink(path.relpath(path.join(root, target),
+                                path.dirname(fpath)), fpath)
+    return root
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with Batch class that applies a sequence of operations read
+    from JSON or a line format as one validated, coalesced set of writes.
+
+    Line format, one operation per line, "#" starts a comment:
+        governor userspace 0-7
+        frequency 2200000 0-3
+        max 3000000
+        min 0-3=1400000 4-7=1000000
+        enable all
+        disable package:1
+    CPUS is a cpu list, a selector or "all", default the online cpus.
+    JSON format, a list of objects:
+        [{"op": "governor", "value": "userspace", "cpus": "0-7"},
+         {"op": "min", "values": {"0-3": 1400000, "4-7": 1000000}}]
+"""
+from collections import namedtuple
+import json
+
+from .cpufreq import CPUFreqBaseError
+from .cpuset import CpuSet
+
+
+BatchWrite = namedtuple("BatchWrite", ["attr", "value", "cpus"])
+BatchWrite.__doc__ = """Write of value to attr on the cpufreq policies of
+cpus (attr "online" enables or disables the cpus)."""
+
+# operation -> cpufreq attribute
+ATTRS = {"governor": "scaling_governor",
+         "frequency": "scaling_setspeed",
+         "setspeed": "scaling_setspeed",
+         "max": "scaling_max_freq",
+         "min": "scaling_min_freq"}
+HOTPLUG = ("enable", "disable")
+
+
+class Batch:
+    """
+    Operations on a cpuFreq instance validated up front, then coalesced:
+    the last value of each attribute wins for each policy, writes that
+    would not change anything are dropped, and the writes are ordered
+    (enable, governors, limits in a safe order, frequencies, disable).
+        Attributes
+            ops
+        Methods
+            parse()
+            load()
+            add()
+            validate()
+            plan()
+            apply()
+    """
+
+    def __init__(self, cpu, ops=()):
+        """
+        cpu: cpuFreq instance
+        ops: operations as (op, value, cpus) tuples, value is a dict cpus
+            -> value for per cpu values
+        """
+        self.__cpu = cpu
+        self.ops = []
+        for op in ops:
+            self.add(*op)
+
+    # private
+    @staticmethod
+    def __parse_line(line, lineno):
+        fields = line.split()
+        op = fields[0]
+        try:
+            if op in HOTPLUG:
+                if len(fields) > 2:
+                    raise ValueError
+                return op, None, fields[1] if len(fields) > 1 else None
+            if op not in ATTRS:
+                raise ValueError
+            args = fields[1:]
+            if args and all("=" in a for a in args):
+                return op, dict(a.split("=", 1) for a in args), None
+            if len(args) not in (1, 2):
+                raise ValueError
+            return op, args[0], args[1] if len(args) > 1 else None
+        except ValueError:
+            raise CPUFreqBaseError("ERROR: line {}: cannot parse "
+                                   "{!r}".format(lineno, line))
+
+    def __cpus(self, cpus, default):
+        """
+        Resolve the cpus of an operation
+        """
+        if cpus is None:
+            return default
+        if cpus == "all":
+            return self.__present
+        if isinstance(cpus, str) and cpus.strip()[:1].isdigit():
+            return CpuSet.parse(cpus)
+        if isinstance(cpus, str):
+            return CpuSet(self.__cpu.get_topology().select(cpus))
+        if isinstance(cpus, int):
+            return CpuSet([cpus])
+        return CpuSet(cpus)
+
+    def __check(self, op, value, cpu):
+        """
+        Validate a value against the capabilities of the policy of cpu,
+        policies may differ (big.LITTLE, hybrid cpus)
+        """
+        try:
+            if op == "governor":
+                governors = self.__cpu.get_available_governors(cpu)
+            else:
+                caps = self.__cpu.get_capabilities(cpu)
+        except CPUFreqBaseError:
+            # unreadable while offline, the write reports the error
+            return
+        if op == "governor":
+            if value not in governors:
+                raise ValueError("governor {} not available on cpu "
+                                 "{}".format(value, cpu))
+            return
+        freqs = caps.frequencies or [f for f in (caps.min_freq, caps.max_freq)
+                                     if f is not None]
+        if freqs and not min(freqs) <= value <= max(freqs):
+            raise ValueError("frequency {} out of {} - {} on cpu {}".format(
+                value, min(freqs), max(freqs), cpu))
+
+    def __desired(self):
+        """
+        Validate every operation and compute the final online cpus and
+        attribute values per cpu
+
+        return: (online CpuSet, dict attr -> dict cpu -> value, errors)
+        """
+        online = CpuSet(self.__cpu.get_online_cpus())
+        self.__present = online | self.__present_cpus()
+        desired = {}
+        errors = []
+        # (op, value, policy leader) validated, once per policy
+        checked = set()
+        for i, (op, value, cpus) in enumerate(self.ops):
+            where = "operation {} ({})".format(i + 1, op)
+            try:
+                if op in HOTPLUG:
+                    rg = self.__cpus(cpus, None)
+                    if rg is None:
+                        raise ValueError("cpus are required")
+                    if not rg.issubset(self.__present):
+                        raise ValueError("cpus {} not present".format(
+                            rg - self.__present))
+                    online = online | rg if op == "enable" else online - rg
+                    continue
+                if op not in ATTRS:
+                    raise ValueError("unknown operation")
+                items = value.items() if isinstance(value, dict) else \
+                    [(cpus, value)]
+                values = desired.setdefault(ATTRS[op], {})
+                for key, v in items:
+                    if op != "governor":
+                        v = int(v)
+                    cpus = self.__cpus(key, online)
+                    for leader in self.__policies(cpus):
+                        if (op, v, leader) not in checked:
+                            self.__check(op, v, leader)
+                            checked.add((op, v, leader))
+                    for c in cpus:
+                        values[c] = v
+            except (ValueError, TypeError) as e:
+                errors.append("{}: {}".format(where, e))
+        return online, desired, errors
+
+    def __present_cpus(self):
+        try:
+            return CpuSet.parse(self.__cpu.backend.read("present"))
+        except (IOError, OSError):
+            return CpuSet(self.__cpu.get_online_cpus())
+
+    def __policies(self, cpus):
+        """
+        Group cpus by cpufreq policy
+
+        return: dict leader -> CpuSet of the policy members in cpus
+        """
+        topology = self.__cpu.get_topology()
+        groups = {}
+        for c in cpus:
+            p = topology.policy_of(c)
+            key = ("cpu", c) if p is None else ("policy", p)
+            groups.setdefault(key, []).append(c)
+        return {members[0]: CpuSet(members) for members in groups.values()}
+
+    def __build(self):
+        online, desired, errors = self.__desired()
+        current_online = CpuSet(self.__cpu.get_online_cpus())
+        current = self.__cpu.snapshot(fields=("governor", "min_freq",
+                                              "max_freq"))
+        # per policy value of each attribute, on the cpus online at the end
+        per_policy = {}
+        policies = self.__policies(online & current_online)
+        for c in online - current_online:
+            # enabled by the batch, the policy is not known until then
+            policies[c] = CpuSet([c])
+        for attr, values in desired.items():
+            for leader, members in policies.items():
+                vals = {values[c] for c in members if c in values}
+                if len(vals) > 1:
+                    errors.append("cpus {} share a policy but get different "
+                                  "{} values".format(members, attr))
+                elif vals:
+                    per_policy.setdefault(attr, {})[leader] = vals.pop()
+        for leader, members in policies.items():
+            state = current.get(leader)
+            cur_min = state.min_freq if state else None
+            cur_max = state.max_freq if state else None
+            new_min = per_policy.get("scaling_min_freq", {}).get(leader)
+            new_max = per_policy.get("scaling_max_freq", {}).get(leader)
+            low = new_min if new_min is not None else cur_min
+            high = new_max if new_max is not None else cur_max
+            if low is not None and high is not None and low > high:
+                errors.append("cpus {}: min frequency {} above max frequency "
+                              "{}".format(members, low, high))
+        if errors:
+            raise CPUFreqBaseError("ERROR: invalid batch:\n  " +
+                                   "\n  ".join(errors))
+        return online, current_online, current, policies, per_policy
+
+    @staticmethod
+    def __group(entries):
+        """
+        Merge (attr, value, members) entries with the same attr and value
+        """
+        merged = {}
+        for attr, value, members in entries:
+            key = (attr, value)
+            merged[key] = merged.get(key, CpuSet()) | members
+        return [BatchWrite(attr, value, cpus)
+                for (attr, value), cpus in merged.items()]
+
+    # interfaces
+    @classmethod
+    def parse(cls, cpu, text):
+        """
+        Build a batch from JSON or the line format
+        """
+        stripped = text.lstrip()
+        ops = []
+        if stripped[:1] in ("[", "{"):
+            try:
+                data = json.loads(text)
+            except ValueError as e:
+                raise CPUFreqBaseError("ERROR: invalid JSON: {}".format(e))
+            for item in data if isinstance(data, list) else [data]:
+                if not isinstance(item, dict) or "op" not in item:
+                    raise CPUFreqBaseError("ERROR: operation without op: "
+                                           "{!r}".format(item))
+                ops.append((item["op"], item.get("values",
+                                                 item.get("value")),
+                            item.get("cpus")))
+            return cls(cpu, ops)
+        for lineno, line in enumerate(text.splitlines(), 1):
+            line = line.split("#", 1)[0].strip()
+            if line:
+                ops.append(cls.__parse_line(line, lineno))
+        return cls(cpu, ops)
+
+    @classmethod
+    def load(cls, cpu, fobj):
+        """
+        Build a batch from a file object, see parse()
+        """
+        return cls.parse(cpu, fobj.read())
+
+    def add(self, op, value=None, cpus=None):
+        """
+        Append an operation
+
+        op: "governor", "frequency" (or "setspeed"), "max", "min",
+            "enable" or "disable"
+        value: value of the operation, or dict cpus -> value
+        cpus: cpu list, selector, "all", CpuSet or cpus, default the
+            online cpus
+        """
+        self.ops.append((op, value, cpus))
+
+    def validate(self):
+        """
+        Check every operation against the available governors and
+        frequencies, the cpus and the policies, CPUFreqBaseError listing
+        all the problems otherwise
+        """
+        self.__build()
+
+    def plan(self):
+        """
+        Get the minimal writes performing the batch, in execution order
+
+        return: list of BatchWrite
+        """
+        online, current_online, current, policies, per_policy = \
+            self.__build()
+        writes = []
+        enable = online - current_online
+        if enable:
+            writes.append(BatchWrite("online", 1, enable))
+        changed = {}
+        for attr, values in per_policy.items():
+            changed[attr] = {}
+            for leader, value in values.items():
+                state = current.get(leader)
+                field = {"scaling_governor": "governor",
+                         "scaling_min_freq": "min_freq",
+                         "scaling_max_freq": "max_freq"}.get(attr)
+                if state is not None and field is not None and \
+                   getattr(state, field) == value:
+                    continue
+                changed[attr][leader] = value
+        writes += self.__group(
+            ("scaling_governor", v, policies[leader])
+            for leader, v in changed.get("scaling_governor", {}).items())
+        # a min above the current max needs the max written first, a max
+        # below the current min needs the min first, so min <= max holds
+        # after each write
+        first, second = [], []
+        new_mins = changed.get("scaling_min_freq", {})
+        new_maxs = changed.get("scaling_max_freq", {})
+        for leader in sorted(set(new_mins) | set(new_maxs)):
+            state = current.get(leader)
+            members = policies[leader]
+            new_min = new_mins.get(leader)
+            new_max = new_maxs.get(leader)
+            if new_max is not None:
+                entry = ("scaling_max_freq", new_max, members)
+                if new_min is not None and state is not None and \
+                   new_max < state.min_freq:
+                    second.append(entry)
+                else:
+                    first.append(entry)
+            if new_min is not None:
+                entry = ("scaling_min_freq", new_min, members)
+                if new_max is not None and (state is None or
+                                            new_min > state.max_freq):
+                    second.append(entry)
+                else:
+                    first.append(entry)
+        writes += self.__group(first) + self.__group(second)
+        writes += self.__group(
+            ("scaling_setspeed", v, policies[leader])
+            for leader, v in changed.get("scaling_setspeed", {}).items())
+        disable = current_online - online
+        if disable:
+            writes.append(BatchWrite("online", 0, disable))
+        return writes
+
+    def apply(self, dry_run=False):
+        """
+        Validate and run the batch
+
+        dry_run: only compute the writes
+        return: dict with "writes" (list of BatchWrite) and "errors"
+            (dict cpu -> CPUFreqBaseError of the failed writes)
+        """
+        writes = self.plan()
+        errors = {}
+        if dry_run:
+            return {"writes": writes, "errors": errors}
+        cpu = self.__cpu
+        setters = {"scaling_governor": cpu.set_governors,
+                   "scaling_max_freq": cpu.set_max_frequencies,
+                   "scaling_min_freq": cpu.set_min_frequencies,
+                   "scaling_setspeed": cpu.set_frequencies}
+        for w in writes:
+            if w.attr == "online":
+                (cpu.enable_cpu if w.value else cpu.disable_cpu)(w.cpus)
+                continue
+            res = setters[w.attr](w.value, rg=w.cpus)
+            errors.update((c, e) for c, e in res.items() if e is not None)
+        return {"writes": writes, "errors": errors}
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with CapabilityCache class, the lazily discovered and
+    persisted capabilities of the cpufreq policies.
+"""
+from collections import namedtuple
+import os
+from os import path
+
+from .cpuset import CpuSet
+
+
+Capabilities = namedtuple("Capabilities", ["cpus", "driver", "governors",
+                                           "frequencies", "min_freq",
+                                           "max_freq"])
+Capabilities.__doc__ = """Capabilities of a cpufreq policy: its cpus, the
+scaling driver, the available governors, the available frequencies in KHz
+(empty when the driver does not list them, like intel_pstate and
+amd-pstate) and the cpuinfo_min_freq/cpuinfo_max_freq hardware limits."""
+
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+
+
+def default_cache_path():
+    """
+    CPUFREQ_CACHE, or capabilities.json in the user cache directory, ""
+    disables the cache
+    """
+    if "CPUFREQ_CACHE" in os.environ:
+        return os.environ["CPUFREQ_CACHE"]
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        path.join(path.expanduser("~"), ".cache")
+    return path.join(base, "cpufreq", "capabilities.json")
+
+
+class CapabilityCache:
+    """
+    Capabilities of the cpufreq policies, read the first time a cpu of
+    the policy is asked for. With a cache file they are kept on disk for
+    the next processes, valid while the boot id, the kernel release and
+    the scaling driver stay the same: the first miss reads every policy
+    and writes the file once. The governors can change without a reboot
+    (modules loaded later), governors() reads them live.
+        Attributes
+            path
+        Methods
+            get()
+            governors()
+            clear()
+    """
+
+    def __init__(self, backend, cache_path=None, boot_id=BOOT_ID):
+        """
+        backend: Backend of the cpu sysfs directory
+        cache_path: file persisting the capabilities, None or "" to keep
+            them in memory only
+        boot_id: file with the id of the current boot
+        """
+        self.__backend = backend
+        self.path = cache_path or None
+        self.__boot_id = boot_id
+        # cpu -> Capabilities
+        self.__caps = {}
+        self.__key = None
+        self.__loaded = False
+
+    # private
+    def __read(self, cpu, name):
+        return self.__backend.read(path.join("cpu%i" % cpu, "cpufreq",
+                                             name)).strip()
+
+    def __discover(self, cpu):
+        try:
+            cpus = list(CpuSet.parse(self.__read(cpu, "related_cpus").replace(
+                " ", ",")))
+        except (IOError, OSError, ValueError):
+            cpus = [cpu]
+        if cpu not in cpus:
+            cpus = [cpu]
+        try:
+            freqs = [int(f) for f in
+                     self.__read(cpu, "scaling_available_frequencies").split()]
+        except (IOError, OSError):
+            freqs = []
+        try:
+            low = int(self.__read(cpu, "cpuinfo_min_freq"))
+            high = int(self.__read(cpu, "cpuinfo_max_freq"))
+        except (IOError, OSError):
+            low = min(freqs) if freqs else None
+            high = max(freqs) if freqs else None
+        return Capabilities(cpus, self.__read(cpu, "scaling_driver"),
+                            self.__read(cpu,
+                                        "scaling_available_governors").split(),
+                            freqs, low, high)
+
+    def __cpus(self):
+        try:
+            names = self.__backend.listdir("")
+        except (IOError, OSError):
+            return []
+        return sorted(int(n[3:]) for n in names
+                      if n.startswith("cpu") and n[3:].isdigit())
+
+    def __store(self, caps):
+        for c in caps.cpus:
+            self.__caps[c] = caps
+
+    def __cache_key(self, cpu):
+        try:
+            with open(self.__boot_id) as f:
+                boot_id = f.read().strip()
+        except (IOError, OSError):
+            return None
+        return {"boot_id": boot_id, "release": os.uname().release,
+                "basedir": getattr(self.__backend, "basedir", None),
+                "driver": self.__read(cpu, "scaling_driver")}
+
+    def __load(self, cpu):
+        """
+        Read the cache file, its entries are used if its key matches
+        """
+        self.__loaded = True
+        self.__key = self.__cache_key(cpu)
+        if self.__key is None:
+            return
+        # json is imported when a cache is used, import cpufreq skips it
+        import json
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("key") != self.__key:
+            return
+        try:
+            for entry in data.get("policies", []):
+                caps = Capabilities(**entry)
+                for c in caps.cpus:
+                    self.__caps.setdefault(c, caps)
+        except TypeError:
+            self.__caps.clear()
+
+    def __save(self):
+        import json
+        policies = {id(caps): caps for caps in self.__caps.values()}
+        data = {"key": self.__key,
+                "policies": [caps._asdict() for caps in policies.values()]}
+        tmp = "%s.%i.tmp" % (self.path, os.getpid())
+        try:
+            os.makedirs(path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except (IOError, OSError):
+            # the cache is an optimization, a read only home is fine
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    # interfaces
+    def get(self, cpu=0):
+        """
+        Get the Capabilities of the policy of cpu
+        """
+        caps = self.__caps.get(cpu)
+        if caps is not None:
+            return caps
+        if self.path is not None and not self.__loaded:
+            self.__load(cpu)
+            caps = self.__caps.get(cpu)
+            if caps is not None:
+                return caps
+        caps = self.__discover(cpu)
+        self.__store(caps)
+        if self.path is not None and self.__key is not None:
+            # one pass over the other policies, for one write of the file
+            for other in self.__cpus():
+                if other in self.__caps:
+                    continue
+                try:
+                    self.__store(self.__discover(other))
+                except (IOError, OSError):
+                    # offline cpus have no cpufreq directory
+                    continue
+            self.__save()
+        return caps
+
+    def governors(self, cpu=0):
+        """
+        Get the available governors of the policy of cpu, read live, the
+        cached Capabilities are updated when they changed
+        """
+        caps = self.get(cpu)
+        live = self.__read(cpu, "scaling_available_governors").split()
+        if live != caps.governors:
+            self.__store(caps._replace(governors=live))
+            if self.path is not None and self.__key is not None:
+                self.__save()
+        return live
+
+    def clear(self):
+        """
+        Forget the capabilities, in memory and on disk
+        """
+        self.__caps.clear()
+        self.__loaded = False
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with the userspace DVFS Controller, which runs a frequency
+    policy in closed loop from the cpu utilization, and the built-in
+    policies.
+"""
+from array import array
+import os
+import threading
+import time
+
+from .backend import user_hz
+from .cpufreq import cpuFreq, CPUFreqBaseError
+from .stats import OperationStats
+
+
+# KHz between the frequencies controlled when the driver lists none
+FREQ_STEP = 100000
+
+
+def _snap(freqs, target):
+    """
+    Lowest frequency of freqs (sorted ascending) at or above target
+    """
+    for f in freqs:
+        if f >= target:
+            return f
+    return freqs[-1]
+
+
+class Policy:
+    """
+    Base class of the controller policies. decide() is called on every
+    tick for each cpufreq policy driven by the controller.
+    """
+
+    def reset(self, groups):
+        """
+        Called when the controller starts
+
+        groups: number of cpufreq policies driven
+        """
+
+    def decide(self, group, util, freq, freqs):
+        """
+        Choose the next frequency of a cpufreq policy
+
+        group: index of the cpufreq policy
+        util: utilization over the last period, between 0 and 1
+        freq: frequency currently set in KHz
+        freqs: available frequencies in KHz, ascending
+        return: frequency in KHz
+        """
+        raise NotImplementedError
+
+
+class OndemandPolicy(Policy):
+    """
+    Jump to the highest frequency above up_threshold, otherwise scale the
+    frequency with the utilization, like the ondemand governor
+    """
+
+    def __init__(self, up_threshold=0.8):
+        self.up_threshold = up_threshold
+
+    def decide(self, group, util, freq, freqs):
+        if util >= self.up_threshold:
+            return freqs[-1]
+        return _snap(freqs, freqs[0] + util*(freqs[-1] - freqs[0]))
+
+
+class TargetUtilizationPolicy(Policy):
+    """
+    Proportional-integral control of the frequency to keep the
+    utilization at target
+    """
+
+    def __init__(self, target=0.7, kp=0.6, ki=0.2):
+        self.target = target
+        self.kp = kp
+        self.ki = ki
+        self.__integral = array("d")
+
+    def reset(self, groups):
+        self.__integral = array("d", [0.0])*groups
+
+    def decide(self, group, util, freq, freqs):
+        error = util - self.target
+        integral = self.__integral[group] + error
+        # anti windup, the integral cannot push beyond the table
+        integral = max(-1.0/self.ki, min(1.0/self.ki, integral)) \
+            if self.ki else 0.0
+        self.__integral[group] = integral
+        target = freq*(1.0 + self.kp*error + self.ki*integral)
+        target = max(freqs[0], min(freqs[-1], target))
+        return min(freqs, key=lambda f: abs(f - target))
+
+
+class BudgetPolicy(Policy):
+    """
+    Run at the lowest frequency that completes the work of the last
+    period within budget (fraction of the period). Raising the frequency
+    is immediate to meet latency, lowering it waits hold periods so
+    short idle gaps do not cost throughput.
+    """
+
+    def __init__(self, budget=0.9, hold=3):
+        self.budget = budget
+        self.hold = hold
+        self.__below = array("i")
+
+    def reset(self, groups):
+        self.__below = array("i", [0])*groups
+
+    def decide(self, group, util, freq, freqs):
+        target = _snap(freqs, util*freq/self.budget)
+        if target >= freq:
+            self.__below[group] = 0
+            return target
+        self.__below[group] += 1
+        if self.__below[group] < self.hold:
+            return freq
+        self.__below[group] = 0
+        return target
+
+
+class CpuTimes:
+    """
+    Reader of the busy and total times of the cpus in /proc/stat, and of
+    a process in /proc/PID/stat. The files are kept open and read with
+    pread.
+    """
+
+    def __init__(self, cpus, pid=None, proc="/proc"):
+        self.cpus = list(cpus)
+        self.__index = {"cpu%i" % c: i for i, c in enumerate(self.cpus)}
+        self.busy = array("Q", [0])*len(self.cpus)
+        self.total = array("Q", [0])*len(self.cpus)
+        self.task = 0
+        self.task_cpu = None
+        self.__fd = os.open(os.path.join(proc, "stat"), os.O_RDONLY)
+        self.__task_fd = None
+        if pid is not None:
+            self.__task_fd = os.open(os.path.join(proc, str(pid), "stat"),
+                                     os.O_RDONLY)
+
+    @staticmethod
+    def __read(fd):
+        chunks = []
+        offset = 0
+        while True:
+            chunk = os.pread(fd, 65536, offset)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+            offset += len(chunk)
+
+    def read(self):
+        """
+        Update busy and total (ticks) of each cpu, and task (ticks) and
+        task_cpu of the process
+        """
+        index = self.__index
+        for line in self.__read(self.__fd).split(b"\n"):
+            # the cpu lines come first
+            if not line.startswith(b"cpu"):
+                break
+            fields = line.split()
+            i = index.get(fields[0].decode())
+            if i is None:
+                continue
+            # user nice system idle iowait irq softirq steal, guest
+            # time is already counted in user
+            times = [int(f) for f in fields[1:9]]
+            idle = times[3] + times[4]
+            self.total[i] = sum(times)
+            self.busy[i] = self.total[i] - idle
+        if self.__task_fd is not None:
+            data = self.__read(self.__task_fd)
+            # the command name may contain spaces, fields start after it
+            fields = data[data.rindex(b")")+2:].split()
+            self.task = int(fields[11]) + int(fields[12])
+            self.task_cpu = int(fields[36])
+
+    def close(self):
+        os.close(self.__fd)
+        if self.__task_fd is not None:
+            os.close(self.__task_fd)
+
+
+class Controller:
+    """
+    Closed loop userspace governor: every period, read the utilization
+    of the cpus, run the policy for each cpufreq policy and write the
+    frequency with set_frequencies when it changes. The utilization of a
+    cpufreq policy is the highest of its cpus, and of the target process
+    when it last ran there. Each cpufreq policy is controlled over its own
+    frequency table (big.LITTLE, hybrid cpus).
+        Attributes
+            policy
+            period
+            cpus
+            ladders
+            ticks
+            writes
+            overruns
+            error
+        Methods
+            start()
+            stop()
+            tick()
+            frequencies()
+            overhead()
+            close()
+    """
+
+    def __init__(self, policy, rg=None, period=0.1, cpu=None, pid=None,
+                 proc="/proc", max_overhead=0.1):
+        """
+        policy: Policy instance
+        rg: list of range of cores, default all online cpus
+        period: control period in seconds
+        cpu: cpuFreq instance, default the shared instance
+        pid: process whose utilization is also followed
+        proc: procfs mount point
+        max_overhead: fraction of the period a tick may take, longer
+            ticks are counted as errors in overhead()
+        """
+        if period <= 0:
+            raise CPUFreqBaseError("ERROR: period should be a positive "
+                                   "value")
+        self.__cpu = cpu if cpu is not None else cpuFreq()
+        self.policy = policy
+        self.period = period
+        self.max_overhead = max_overhead
+        self.cpus = self.__cpu.select_cpus(rg)
+        topology = self.__cpu.get_topology()
+        groups = {}
+        for c in self.cpus:
+            p = topology.policy_of(c)
+            groups.setdefault(("cpu", c) if p is None else ("policy", p),
+                              []).append(c)
+        self.__groups = list(groups.values())
+        # frequencies of each cpufreq policy, ascending
+        self.ladders = [self.__ladder(members[0])
+                        for members in self.__groups]
+        self.__slots = [[self.cpus.index(c) for c in members]
+                        for members in self.__groups]
+        self.__group_of = {c: g for g, members in enumerate(self.__groups)
+                           for c in members}
+        self.__times = CpuTimes(self.cpus, pid, proc)
+        self.__hz = user_hz()
+        self.__last_busy = array("Q", [0])*len(self.cpus)
+        self.__last_total = array("Q", [0])*len(self.cpus)
+        self.__last_task = 0
+        self.__last_time = 0.0
+        self.__current = array("q", [0])*len(self.__groups)
+        self.__governors = None
+        self.__overhead = OperationStats()
+        self.ticks = 0
+        self.writes = 0
+        self.overruns = 0
+        # exception that ended the background loop
+        self.error = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # private
+    def __ladder(self, cpu):
+        """
+        Frequencies controlled on the policy of cpu
+        """
+        caps = self.__cpu.get_capabilities(cpu)
+        freqs = sorted(caps.frequencies)
+        if not freqs and caps.min_freq is not None and \
+                caps.max_freq is not None:
+            # drivers without a frequency table take any value in the
+            # hardware limits, control in steps of FREQ_STEP
+            freqs = list(range(caps.min_freq, caps.max_freq,
+                               FREQ_STEP)) + [caps.max_freq]
+        if not freqs:
+            raise CPUFreqBaseError("ERROR: no available frequencies to "
+                                   "control on cpu {}".format(cpu))
+        return freqs
+
+    def __commit(self, now):
+        """
+        Keep the last readings as the start of the next period
+        """
+        times = self.__times
+        self.__last_busy[:] = times.busy
+        self.__last_total[:] = times.total
+        self.__last_task = times.task
+        self.__last_time = now
+
+    def __apply(self, targets):
+        """
+        Write the frequencies that changed, one set_frequencies per value
+        """
+        by_freq = {}
+        for g, f in enumerate(targets):
+            if f != self.__current[g]:
+                by_freq.setdefault(f, []).append(self.__groups[g][0])
+        for f, leaders in by_freq.items():
+            res = self.__cpu.set_frequencies(f, rg=leaders)
+            for c, err in res.items():
+                if err is None:
+                    self.__current[self.__group_of[c]] = f
+            self.writes += 1
+
+    def __run(self):
+        clock = time.monotonic
+        start = clock()
+        tick = 1
+        while not self.__stop.is_set():
+            deadline = start + tick*self.period
+            now = clock()
+            if now < deadline:
+                if self.__stop.wait(deadline - now):
+                    break
+            try:
+                self.tick()
+            except Exception as e:
+                # kept for the caller, the governors are restored by stop()
+                self.error = e
+                break
+            late = int((clock() - start)/self.period)
+            if late > tick:
+                self.overruns += 1
+                tick = late + 1
+            else:
+                tick += 1
+
+    # interfaces
+    def start(self, background=True):
+        """
+        Switch the cpus to the userspace governor, saving the previous
+        governors, and run the loop on a background thread
+
+        background: start the loop, otherwise the caller runs tick() at
+            its own pace
+        """
+        if self.__governors is not None:
+            return
+        governors = self.__cpu.get_governors()
+        self.__governors = {c: governors[c] for c in self.cpus
+                            if c in governors}
+        res = self.__cpu.set_governors("userspace", rg=self.cpus)
+        for err in res.values():
+            if err is not None:
+                raise err
+        freqs = self.__cpu.get_frequencies(self.cpus)
+        for g, members in enumerate(self.__groups):
+            self.__current[g] = freqs.get(members[0], self.ladders[g][-1])
+        self.policy.reset(len(self.__groups))
+        self.error = None
+        self.__times.read()
+        self.__commit(time.monotonic())
+        if not background:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="Controller", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop the loop and restore the previous governors, error keeps
+        the exception that ended the loop early, if any
+        """
+        if self.__governors is None:
+            return
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
+        by_gov = {}
+        for c, gov in self.__governors.items():
+            by_gov.setdefault(gov, []).append(c)
+        for gov, cpus in by_gov.items():
+            self.__cpu.set_governors(gov, rg=cpus)
+        self.__governors = None
+
+    def tick(self):
+        """
+        Run one control step, called by the loop on every period
+
+        return: list of the frequencies chosen for each cpufreq policy
+        """
+        if self.__governors is None:
+            raise CPUFreqBaseError("ERROR: Controller not started")
+        begin = time.perf_counter()
+        times = self.__times
+        times.read()
+        now = time.monotonic()
+        last_busy = self.__last_busy
+        last_total = self.__last_total
+        util = [0.0]*len(self.cpus)
+        for i in range(len(self.cpus)):
+            total = times.total[i] - last_total[i]
+            if total > 0:
+                util[i] = (times.busy[i] - last_busy[i])/total
+        task_group = self.__group_of.get(times.task_cpu)
+        task_util = 0.0
+        if task_group is not None:
+            ticks = (now - self.__last_time)*self.__hz
+            if ticks > 0:
+                task_util = min(1.0, (times.task - self.__last_task)/ticks)
+        self.__commit(now)
+        targets = []
+        for g, slots in enumerate(self.__slots):
+            u = max(util[i] for i in slots)
+            if g == task_group:
+                u = max(u, task_util)
+            targets.append(self.policy.decide(g, u, self.__current[g],
+                                              self.ladders[g]))
+        self.__apply(targets)
+        self.ticks += 1
+        elapsed = time.perf_counter() - begin
+        self.__overhead.add(elapsed, error=elapsed >
+                            self.max_overhead*self.period)
+        return targets
+
+    def frequencies(self):
+        """
+        Get the frequency set on each controlled cpu
+
+        return: dict cpu -> frequency in KHz
+        """
+        return {c: self.__current[g] for c, g in self.__group_of.items()}
+
+    def overhead(self):
+        """
+        Get the cost of the ticks, see OperationStats.summary(); errors
+        counts the ticks longer than max_overhead of the period
+        """
+        return self.__overhead.summary()
+
+    def close(self):
+        """
+        Stop the loop and close the procfs files
+        """
+        self.stop()
+        self.__times.close()
+
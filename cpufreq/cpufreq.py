@@ -2,8 +2,20 @@
 """
     Module with CPUFreq class that manage the CPU frequency.
 """
+from collections import namedtuple
+from collections.abc import Mapping
+from functools import wraps
 from os import path
 import sys
+import threading
+import time
+
+from .backend import SysfsBackend, SYSFS_CPU
+from .capabilities import CapabilityCache, default_cache_path
+from .cpuset import CpuSet
+from .state import CPUStateArray
+from .stats import Stats, InstrumentedBackend
+from .topology import Topology
 
 
 class CPUFreqBaseError(Exception):
@@ -22,6 +34,11 @@ class CPUFreqErrorInit(CPUFreqBaseError):
         self.message = message
 
 
+CPUState = namedtuple("CPUState", ["governor", "frequency",
+                                   "min_freq", "max_freq"])
+CPUState.__doc__ = """State of one cpu, fields not loaded are None."""
+
+
 class cpuFreq:
     """
     Class that manage cpus frequencies
@@ -29,6 +46,8 @@ class cpuFreq:
             driver
             available_governors
             available_frequencies
+            elided_writes
+            backend
         Methods
             enable_all_cpu()
             reset()
@@ -38,304 +57,985 @@ class cpuFreq:
             set_frequencies()
             set_min_frequencies()
             set_max_frequencies()
+            set_frequency_limits()
             set_governors()
             get_online_cpus()
+            select_cpus()
+            get_topology()
+            get_capabilities()
+            get_available_governors()
             get_governors()
             get_frequencies()
+            get_setspeed()
+            snapshot()
+            measure()
+            measure_transition_latency()
+            pinned()
+            attach_shared()
+            close_fds()
+            invalidate_cache()
+            watch()
+            unwatch()
+            subscribe()
+            enable_stats()
+            disable_stats()
+            stats()
+
+    Methods taking rg accept a cpu, a list of cpus, a CpuSet, a cpu list
+    string ("0-3,8" or "0xff"), a Topology selector ("primary",
+    "package:1", "node:0", "policy:4") or a list mixing them. The setters
+    also take a dict of such keys -> value to set different values in one
+    call, e.g. {"package:0": 3000000, "package:1": 1800000}.
     """
 
-    BASEDIR = "/sys/devices/system/cpu"
+    BASEDIR = SYSFS_CPU
+    # governors restored by reset(), the first available of each policy,
+    # ondemand is missing on intel_pstate and amd-pstate
+    RESET_GOVERNORS = ("ondemand", "schedutil", "powersave")
+    # attributes whose cached values are invalid after writing the key
+    DEPENDENT_VARS = {"scaling_governor": ("scaling_setspeed",),
+                      "scaling_max_freq": ("scaling_setspeed",),
+                      "scaling_min_freq": ("scaling_setspeed",)}
+    # snapshot field -> (sysfs attribute, parser)
+    SNAPSHOT_FIELDS = {"governor": ("scaling_governor", str),
+                       "frequency": ("scaling_cur_freq", int),
+                       "min_freq": ("scaling_min_freq", int),
+                       "max_freq": ("scaling_max_freq", int)}
     __instance = None
 
-    def __new__(cls, *args, **kwargs):
+    def __new__(cls, *args, backend=None, **kwargs):
+        if backend is not None:
+            return cls.__create(backend)
         if cpuFreq.__instance == None:
             LINUX = sys.platform.startswith("linux")
-            DRIVERFREQ = path.isfile(path.join(cpuFreq.BASEDIR,
-                                               "cpu0",
-                                               "cpufreq",
-                                               "scaling_driver"))
             if not LINUX:
                 raise CPUFreqErrorInit("ERROR: %s Class should be used only "
                                        "on Linux Systems." % cls.__name__)
-            elif not DRIVERFREQ:
-                raise CPUFreqErrorInit("ERROR: %s Class should be used only "
-                                       "with OS CPU Power driver activated (Linux ACPI "
-                                       "module, for example)." % cls.__name__)
-            else:
-                cpuFreq.__instance = super().__new__(cls)
-                fpath = path.join("cpu0", "cpufreq", "scaling_driver")
-                datad = cpuFreq.__instance.__read_cpu_file(fpath)
-                datad = datad.rstrip("\n").split()[0]
-
-                fpath = path.join("cpu0", "cpufreq",
-                                  "scaling_available_governors")
-                datag = cpuFreq.__instance.__read_cpu_file(fpath)
-                datag = datag.rstrip("\n").split()
-
-                fpath = path.join("cpu0", "cpufreq",
-                                  "scaling_available_frequencies")
-                dataf = cpuFreq.__instance.__read_cpu_file(fpath)
-                dataf = dataf.rstrip("\n").split()
-
-                cpuFreq.__instance.driver = datad
-                cpuFreq.__instance.available_governors = datag
-                cpuFreq.__instance.available_frequencies = list(
-                    map(int, dataf))
-
+            cpuFreq.__instance = cls.__create(SysfsBackend(cpuFreq.BASEDIR))
         return cpuFreq.__instance
 
+    @classmethod
+    def __create(cls, backend):
+        DRIVERFREQ = backend.isfile(path.join("cpu0", "cpufreq",
+                                              "scaling_driver"))
+        if not DRIVERFREQ:
+            raise CPUFreqErrorInit("ERROR: %s Class should be used only "
+                                   "with OS CPU Power driver activated (Linux ACPI "
+                                   "module, for example)." % cls.__name__)
+        self = super().__new__(cls)
+        self.backend = backend
+        self.__online = None
+        self.__topology = None
+        self.__write_cache = False
+        self.__read_compare = False
+        self.__state = {}
+        self.__stats = None
+        self.__watcher = None
+        # thread pool of the parallel policy writes, and its size
+        self.__pool = None
+        self.__pool_size = 0
+        # public methods run one at a time, the caches below are shared by
+        # the threads using the instance (aio, watcher, daemon, exporter)
+        self.__lock = threading.RLock()
+        # file name -> (content, CpuSet) of the cpu masks read last
+        self.__masks = {}
+        self.elided_writes = 0
+        # capabilities are read when first used, and kept on disk between
+        # processes for the real sysfs
+        cache_path = None
+        if getattr(backend, "basedir", None) == cls.BASEDIR:
+            cache_path = default_cache_path()
+        self.__capabilities = CapabilityCache(backend, cache_path)
+        return self
+
+    def __init__(self, persistent_fds=None, write_cache=None,
+                 read_compare=None, backend=None):
+        """
+        persistent_fds: keep the sysfs attributes open and re-read them
+            with pread instead of open/read/close on every access.
+        write_cache: remember the last value written to each cpu and skip
+            writes of the same value. The cache is cleared when the online
+            cpus change; use invalidate_cache() after external changes.
+        read_compare: read the current value before writing and skip the
+            write if it already matches.
+        None keeps the current mode of the instance.
+        backend: Backend to access the cpu sysfs directory. By default the
+            instance is shared and reads BASEDIR; with a backend a new
+            independent instance is built.
+        """
+        if persistent_fds is not None:
+            if not persistent_fds:
+                self.close_fds()
+            self.backend.persistent_fds = bool(persistent_fds)
+        if write_cache is not None:
+            if not write_cache:
+                self.invalidate_cache()
+            self.__write_cache = bool(write_cache)
+        if read_compare is not None:
+            self.__read_compare = bool(read_compare)
+
+    @property
+    def driver(self):
+        """
+        Scaling driver of the first online cpu
+        """
+        return self.get_capabilities().driver
+
+    @property
+    def available_governors(self):
+        """
+        Available governors of the first online cpu, read live
+        """
+        return self.get_available_governors()
+
+    @property
+    def available_frequencies(self):
+        """
+        Available frequencies of the first online cpu, empty when the
+        driver does not list them (intel_pstate, amd-pstate)
+        """
+        return self.get_capabilities().frequencies
+
     # private
+    def __instrumented(fn):
+        """
+        Serialize a public method on the instance lock and record its
+        calls when the stats are enabled
+        """
+        name = fn.__name__
+
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.__lock:
+                stats = self.__stats
+                if stats is None:
+                    return fn(self, *args, **kwargs)
+                for hook in stats.pre_hooks:
+                    hook("call", name)
+                error = None
+                start = time.perf_counter()
+                try:
+                    return fn(self, *args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - start
+                    stats.record_call(name, elapsed, error)
+                    for hook in stats.post_hooks:
+                        hook("call", name, elapsed, error)
+        return wrapper
+
     def __read_cpu_file(self, fname):
-        fpath = path.join(cpuFreq.BASEDIR, fname)
-        with open(fpath, "rb") as f:
-            data = f.read().decode("utf-8")
-        return data
+        return self.backend.read(fname)
+
+    def __drop_cpu_fds(self, cpus):
+        self.backend.drop(["cpu%i" % cpu for cpu in cpus])
+
+    def __hotplugged(self, cpus):
+        """
+        Update what is kept about cpus after writing their online file
+        """
+        self.__drop_cpu_fds(cpus)
+        self.invalidate_cache(cpus)
+        if self.__watcher is not None:
+            self.__watcher.refresh()
+
+    def __check_hotplug(self, str_range):
+        if self.__online is not None:
+            old = CpuSet.from_list(self.__online)
+            new = CpuSet.from_list(str_range)
+            self.__drop_cpu_fds(old ^ new)
+            # policies are reinitialized when cpus come and go
+            self.__state.clear()
+        self.__online = str_range
+
+    def __unchanged(self, var, data, members):
+        """
+        Check if the policy of members already has data in var
+        """
+        if self.__write_cache:
+            for cpu in members:
+                if self.__state.get((cpu, var)) != data:
+                    break
+            else:
+                return True
+        if self.__read_compare:
+            fpath = path.join("cpu%i" % members[0], "cpufreq", var)
+            try:
+                current = self.__read_cpu_file(fpath).strip().encode()
+            except (IOError, OSError):
+                return False
+            if current == data:
+                self.__remember(var, data, members)
+                return True
+        return False
+
+    def __remember(self, var, data, members):
+        if not self.__write_cache:
+            return
+        for cpu in members:
+            if data is None:
+                self.__state.pop((cpu, var), None)
+            else:
+                self.__state[(cpu, var)] = data
+            # writes that change what the kernel reports for other files
+            for dep in cpuFreq.DEPENDENT_VARS.get(var, ()):
+                self.__state.pop((cpu, dep), None)
 
     def __write_cpu_file(self, fname, data):
-        fpath = path.join(cpuFreq.BASEDIR, fname)
-        with open(fpath, "wb") as f:
-            f.write(data)
+        self.backend.write(fname, data)
 
     def __get_cpu_variable(self, var):
         data = {}
-        for cpu in self.__get_ranges("online"):
+        for cpu in self.__get_mask("online"):
             fpath = path.join("cpu%i" % cpu, "cpufreq", var)
             data[int(cpu)] = self.__read_cpu_file(
                 fpath).rstrip("\n").split()[0]
         return data
 
-    def __get_ranges(self, fname):
-        str_range = self.__read_cpu_file(fname).strip("\n").strip()
-        l = []
-        if not str_range:
-            return l
-        for r in str_range.split(","):
-            mr = r.split("-")
-            if len(mr) == 2:
-                l += list(range(int(mr[0]),  int(mr[1])+1))
+    def __read_ints(self, var, cpus, out=None):
+        """
+        Parse an integer attribute of cpus into the arrays of out, a new
+        CPUStateArray when out does not hold these cpus
+        """
+        if out is None or not out.matches(cpus):
+            out = CPUStateArray(cpus)
+        data = out.data
+        read = self.__read_cpu_file
+        for i, cpu in enumerate(cpus):
+            data[i] = int(read("cpu%i/cpufreq/%s" % (cpu, var)))
+        return out
+
+    def __int_getter(self, var, rg, as_array, out):
+        online = self.__get_mask("online")
+        rg = self.__resolve(rg)
+        to_load = list(rg & online if rg else online)
+        res = self.__read_ints(var, to_load, out)
+        if as_array or out is not None:
+            return res
+        return res.to_dict()
+
+    def __current_topology(self):
+        """
+        Topology of the online cpus read last, rebuilt on hotplug
+        """
+        if self.__topology is None or self.__topology.key != self.__online:
+            self.__topology = Topology(self.__get_mask("present"),
+                                       self.__read_cpu_file,
+                                       self.backend.listdir,
+                                       key=self.__online)
+        return self.__topology
+
+    def __resolve(self, rg):
+        """
+        Expand rg (cpu, list of cpus, CpuSet, cpu list string, topology
+        selector or list mixing them) into a CpuSet
+        """
+        if rg is None or isinstance(rg, CpuSet):
+            return rg
+        if isinstance(rg, (int, str)):
+            rg = [rg]
+        mask = 0
+        try:
+            for item in rg:
+                if isinstance(item, CpuSet):
+                    mask |= item.mask
+                elif not isinstance(item, str):
+                    mask |= 1 << item
+                elif item.strip()[:1].isdigit():
+                    mask |= CpuSet.parse(item).mask
+                else:
+                    mask |= CpuSet(self.get_topology().select(item)).mask
+        except ValueError as e:
+            raise CPUFreqBaseError("ERROR: {}".format(e))
+        return CpuSet.from_bits(mask)
+
+    def __executor(self, workers):
+        """
+        Thread pool of the parallel writes, one per instance, grown to
+        the largest workers asked
+        """
+        if self.__pool_size < workers:
+            from concurrent.futures import ThreadPoolExecutor
+            if self.__pool is not None:
+                self.__pool.shutdown(wait=False)
+            self.__pool = ThreadPoolExecutor(max_workers=workers)
+            self.__pool_size = workers
+        return self.__pool
+
+    def __write_policies(self, var, data, cpus, workers=None, online=None):
+        """
+        Write a cpufreq attribute once per policy of cpus
+
+        data: bytes to write, or dict cpu -> bytes
+        online: online cpus if already loaded by the caller
+        return: dict cpu -> None or the exception raised writing its policy
+        """
+        if online is None:
+            online = self.__get_mask("online")
+        topology = self.__current_topology()
+        groups_by_policy = {}
+        for cpu in sorted(cpus):
+            policy = topology.policy_of(cpu)
+            key = ("cpu", cpu) if policy is None else ("policy", policy)
+            groups_by_policy.setdefault(key, []).append(cpu)
+        res = dict.fromkeys(cpus)
+        groups = []
+        for members in groups_by_policy.values():
+            value = data
+            if isinstance(data, dict):
+                value = data[members[0]]
+                if any(data[cpu] != value for cpu in members):
+                    err = CPUFreqBaseError(
+                        "ERROR: cpus {} share a cpufreq policy but get "
+                        "different values".format(CpuSet(members)))
+                    res.update(dict.fromkeys(members, err))
+                    continue
+            if self.__unchanged(var, value, members):
+                self.elided_writes += 1
             else:
-                l += [int(mr[0])]
-        return l
+                groups.append((members, value))
+
+        def write(group):
+            members, value = group
+            fpath = path.join("cpu%i" % members[0], "cpufreq", var)
+            try:
+                self.__write_cpu_file(fpath, value)
+            except Exception as e:
+                return e
+            return None
+
+        if workers and workers > 1 and len(groups) > 1:
+            errors = list(self.__executor(workers).map(write, groups))
+        else:
+            errors = [write(group) for group in groups]
+        for (members, value), err in zip(groups, errors):
+            self.__remember(var, value if err is None else None, members)
+            for cpu in members:
+                res[cpu] = err
+        return res
+
+    def __per_cpu(self, value, rg, online, check=None):
+        """
+        Expand the value of a setter, one value or a mapping cpus (cpu,
+        CpuSet, cpu list string or selector) -> value, over the online cpus
+        of rg, later keys winning
+
+        check: function validating each value
+        return: dict cpu -> value
+        """
+        rg = self.__resolve(rg)
+        to_change = rg & online if rg else online
+        if not isinstance(value, Mapping):
+            if check is not None:
+                check(value)
+            return dict.fromkeys(to_change, value)
+        values = {}
+        for key, v in value.items():
+            if check is not None:
+                check(v)
+            for cpu in self.__resolve(key) & to_change:
+                values[cpu] = v
+        return values
+
+    @staticmethod
+    def __check_freq(freq):
+        if not isinstance(freq, int):
+            raise CPUFreqBaseError(
+                "ERROR: Frequency should be a Integer value")
+
+    @staticmethod
+    def __encode(values):
+        return {cpu: str(v).encode() for cpu, v in values.items()}
+
+    def __get_mask(self, fname):
+        """
+        Get the cpus of the online, offline or present file as a CpuSet,
+        parsed again only when the content changed
+        """
+        if self.__watcher is not None and fname in self.__watcher.MASKS:
+            str_range = self.__watcher.mask(fname)
+        else:
+            str_range = self.__read_cpu_file(fname).strip("\n").strip()
+        if fname == "online" and str_range != self.__online:
+            self.__check_hotplug(str_range)
+        cached = self.__masks.get(fname)
+        if cached is None or cached[0] != str_range:
+            cached = self.__masks[fname] = (str_range,
+                                            CpuSet.from_list(str_range))
+        return cached[1]
 
     # interfaces
+    def close_fds(self):
+        """
+        Close the sysfs attributes kept open by the persistent fds mode
+        """
+        with self.__lock:
+            self.backend.close()
+
+    def watch(self, poll_interval=1.0, netlink=True, watch_attrs=True):
+        """
+        Keep the online, offline and present cpus in memory, updated by a
+        HotplugWatcher from kernel uevents (or polling), instead of
+        reading them on every call
+
+        poll_interval: seconds between polls of the masks (without
+            netlink) and of the governors and limits
+        netlink: listen to kernel uevents for hotplug
+        watch_attrs: poll governors and limits to notify their changes
+        return: the HotplugWatcher
+        """
+        with self.__lock:
+            if self.__watcher is None:
+                from .watch import HotplugWatcher
+                watcher = HotplugWatcher(self, poll_interval, netlink,
+                                         watch_attrs)
+                watcher.start()
+                self.__watcher = watcher
+            return self.__watcher
+
+    def unwatch(self):
+        """
+        Stop the HotplugWatcher, the cpu masks are read from sysfs again
+        """
+        with self.__lock:
+            watcher, self.__watcher = self.__watcher, None
+        # stopped unlocked, the watcher thread may be waiting for the lock
+        if watcher is not None:
+            watcher.stop()
+
+    def subscribe(self, callback, kinds=None):
+        """
+        Call callback(WatchEvent) on cpu hotplug, governor or limits
+        changes, starting the watcher if needed
+
+        kinds: event kinds to receive ("hotplug", "governor", "limits"),
+            default all
+        """
+        self.watch().subscribe(callback, kinds)
+
+    def enable_stats(self, pre=None, post=None):
+        """
+        Start recording call counts, bytes and latencies of the sysfs
+        accesses and public methods
+
+        pre: hook called as pre(op, name) before each operation
+        post: hook called as post(op, name, elapsed, error) after it
+        return: the Stats collector
+        """
+        with self.__lock:
+            if self.__stats is None:
+                self.__stats = Stats()
+                self.backend = InstrumentedBackend(self.backend, self.__stats)
+            self.__stats.add_hooks(pre, post)
+            return self.__stats
+
+    def disable_stats(self):
+        """
+        Stop recording, the counters are dropped
+        """
+        with self.__lock:
+            if self.__stats is not None:
+                self.backend = self.backend.inner
+                self.__stats = None
+
+    def stats(self, clear=False):
+        """
+        Get the recorded counters, see Stats.summary(). Empty when the
+        stats are not enabled.
+
+        clear: reset the counters after reading them
+        """
+        if self.__stats is None:
+            return {}
+        summary = self.__stats.summary()
+        if clear:
+            self.__stats.clear()
+        return summary
+
+    def invalidate_cache(self, rg=None):
+        """
+        Forget the values remembered by the write cache, needed after
+        changes made outside this instance
+
+        rg: list of range of cores, default all
+        """
+        with self.__lock:
+            rg = self.__resolve(rg)
+            if rg is None:
+                self.__state.clear()
+                return
+            for key in list(self.__state):
+                if key[0] in rg:
+                    del self.__state[key]
+
+    @__instrumented
     def enable_all_cpu(self):
         """
         Enable all offline cpus
         """
-        to_enable = set(self.__get_ranges("present"))
-        to_enable = to_enable & set(self.__get_ranges("offline"))
+        to_enable = self.__get_mask("present") & self.__get_mask("offline")
         for cpu in to_enable:
             fpath = path.join("cpu%i" % cpu, "online")
             self.__write_cpu_file(fpath, b"1")
+        self.__hotplugged(to_enable)
 
+    @__instrumented
     def reset(self, rg=None):
         """
-        Enable all offline cpus, and reset max and min frequencies files
+        Enable all offline cpus, and reset governors (the first available
+        of RESET_GOVERNORS), max and min frequencies files
 
         rg: range or list of threads to reset
         """
-        if isinstance(rg, int):
-            rg = [rg]
-        to_reset = rg if rg else self.__get_ranges("present")
+        rg = self.__resolve(rg)
+        to_reset = rg if rg else self.__get_mask("present")
         self.enable_cpu(to_reset)
-        self.set_governors("ondemand", rg=rg)
+        govs = {}
         for cpu in to_reset:
-            fpath = path.join("cpu%i" % cpu, "cpufreq", "scaling_max_freq")
-            max_f = str(max(self.available_frequencies)).encode()
-            self.__write_cpu_file(fpath, max_f)
-            fpath = path.join("cpu%i" % cpu, "cpufreq", "scaling_min_freq")
-            min_f = str(min(self.available_frequencies)).encode()
-            self.__write_cpu_file(fpath, min_f)
+            if cpu in govs:
+                continue
+            available = self.get_available_governors(cpu)
+            gov = next((g for g in cpuFreq.RESET_GOVERNORS
+                        if g in available), available[0])
+            for c in self.get_capabilities(cpu).cpus:
+                govs[c] = gov
+        res = self.set_governors(govs, rg=to_reset)
+        for err in res.values():
+            if err is not None:
+                raise err
+        max_f = {}
+        min_f = {}
+        for cpu in to_reset:
+            caps = self.get_capabilities(cpu)
+            freqs = caps.frequencies or [caps.min_freq, caps.max_freq]
+            max_f[cpu] = str(max(freqs)).encode()
+            min_f[cpu] = str(min(freqs)).encode()
+        for var, data in (("scaling_max_freq", max_f),
+                          ("scaling_min_freq", min_f)):
+            res = self.__write_policies(var, data, to_reset)
+            for err in res.values():
+                if err is not None:
+                    raise err
 
+    @__instrumented
     def disable_hyperthread(self):
         """
         Disable all threads attached to the same core
         """
-        to_disable = []
-        online_cpus = self.__get_ranges("online")
-        for cpu in online_cpus:
-            fpath = path.join("cpu%i" % cpu, "topology",
-                              "thread_siblings_list")
-            to_disable += self.__get_ranges(fpath)[1:]
-        to_disable = set(to_disable) & set(online_cpus)
+        online = self.__get_mask("online")
+        topology = self.__current_topology()
+        to_disable = online & topology.secondary_threads()
 
         for cpu in to_disable:
             fpath = path.join("cpu%i" % cpu, "online")
             self.__write_cpu_file(fpath, b"0")
+        self.__hotplugged(to_disable)
 
+    @__instrumented
     def disable_cpu(self, rg):
         """
         Disable cpus
 
         rg: range or list of threads to disable
         """
-        if isinstance(rg, int):
-            rg = [rg]
-        to_disable = set(rg) & set(self.__get_ranges("online"))
+        rg = self.__resolve(rg)
+        to_disable = rg & self.__get_mask("online")
         for cpu in to_disable:
             fpath = path.join("cpu%i" % cpu, "online")
             self.__write_cpu_file(fpath, b"0")
+        self.__hotplugged(to_disable)
 
+    @__instrumented
     def enable_cpu(self, rg):
         """
         Enable cpus
 
         rg: range or list of threads to enable
         """
-        if isinstance(rg, int):
-            rg = [rg]
-        to_disable = set(rg) & set(self.__get_ranges("offline"))
+        rg = self.__resolve(rg)
+        to_disable = rg & self.__get_mask("offline")
         for cpu in to_disable:
             fpath = path.join("cpu%i" % cpu, "online")
             self.__write_cpu_file(fpath, b"1")
+        self.__hotplugged(to_disable)
 
-    def set_frequencies(self, freq, rg=None):
+    @__instrumented
+    def set_frequencies(self, freq, rg=None, workers=None):
         """
         Set cores frequencies
 
-        freq: int frequency in KHz
+        freq: int frequency in KHz, or dict cpus -> frequency
         rg: list of range of cores
+        workers: number of threads writing the policies in parallel
+        return: dict cpu -> None or CPUFreqBaseError of the failed write
         """
 
-        if not isinstance(freq, int):
-            raise CPUFreqBaseError(
-                "ERROR: Frequency should be a Integer value")
-        to_change = self.__get_ranges("online")
-        if isinstance(rg, int):
-            rg = [rg]
-        if rg:
-            to_change = set(rg) & set(self.__get_ranges("online"))
-        max_freqs = self.get_max_freq()
-        min_freqs = self.get_min_freq()
-        for cpu in to_change:
-            fpath = path.join("cpu%i" % cpu, "cpufreq", "scaling_setspeed")
-            try:
-                self.__write_cpu_file(fpath, str(freq).encode())
-            except Exception as e:
-                print(e, freq, "{} - {}.".format(min_freqs[cpu], max_freqs[cpu]))
-                raise CPUFreqBaseError(("ERROR: Frequency should be between"
-                                        "min and max frequencies interval: "
-                                        "{} - {}.".format(min_freqs[cpu], max_freqs[cpu])))
+        online = self.__get_mask("online")
+        freqs = self.__per_cpu(freq, rg, online, self.__check_freq)
+        res = self.__write_policies("scaling_setspeed", self.__encode(freqs),
+                                    freqs, workers, online)
+        failed = [cpu for cpu in res
+                  if res[cpu] is not None and
+                  not isinstance(res[cpu], CPUFreqBaseError)]
+        if failed:
+            limits = self.snapshot(failed, fields=("min_freq", "max_freq"))
+            for cpu in failed:
+                state = limits.get(cpu)
+                res[cpu] = CPUFreqBaseError(
+                    "ERROR: Frequency should be between min and max "
+                    "frequencies interval: {} - {}.".format(
+                        state and state.min_freq, state and state.max_freq))
+        return res
 
-    def set_max_frequencies(self, freq, rg=None):
+    @__instrumented
+    def set_max_frequencies(self, freq, rg=None, workers=None):
         """
         Set cores max frequencies
 
-        freq: int frequency in KHz
+        freq: int frequency in KHz, or dict cpus -> frequency
         rg: list of range of cores
+        workers: number of threads writing the policies in parallel
+        return: dict cpu -> None or CPUFreqBaseError of the failed write
         """
 
-        if not isinstance(freq, int):
-            raise CPUFreqBaseError(
-                "ERROR: Frequency should be a Integer value")
-        to_change = self.__get_ranges("online")
-        if isinstance(rg, int):
-            rg = [rg]
-        if rg:
-            to_change = set(rg) & set(self.__get_ranges("online"))
-        min_freqs = self.get_min_freq()
-        for cpu in to_change:
-            fpath = path.join("cpu%i" % cpu, "cpufreq", "scaling_max_freq")
-            try:
-                self.__write_cpu_file(fpath, str(freq).encode())
-            except Exception as e:
-                print(e, freq, "{}".format(min_freqs[cpu]))
-                raise CPUFreqBaseError(("ERROR: Frequency should be gt min "
-                                        "freq: {}".format(min_freqs[cpu])))
+        online = self.__get_mask("online")
+        freqs = self.__per_cpu(freq, rg, online, self.__check_freq)
+        res = self.__write_policies("scaling_max_freq", self.__encode(freqs),
+                                    freqs, workers, online)
+        failed = [cpu for cpu in res if res[cpu] is not None and
+                  not isinstance(res[cpu], CPUFreqBaseError)]
+        if failed:
+            min_freqs = self.get_min_freq(failed)
+            for cpu in failed:
+                res[cpu] = CPUFreqBaseError(
+                    "ERROR: Frequency should be gt min freq: {}".format(
+                        min_freqs.get(cpu)))
+        return res
 
-    def set_min_frequencies(self, freq, rg=None):
+    @__instrumented
+    def set_min_frequencies(self, freq, rg=None, workers=None):
         """
         Set cores min frequencies
 
-        freq: int frequency in KHz
+        freq: int frequency in KHz, or dict cpus -> frequency
         rg: list of range of cores
+        workers: number of threads writing the policies in parallel
+        return: dict cpu -> None or CPUFreqBaseError of the failed write
         """
-        if not isinstance(freq, int):
-            raise CPUFreqBaseError(
-                "ERROR: Frequency should be a Integer value")
-        to_change = self.__get_ranges("online")
-        if isinstance(rg, int):
-            rg = [rg]
-        if rg:
-            to_change = set(rg) & set(self.__get_ranges("online"))
-        max_freqs = self.get_max_freq()
-        for cpu in to_change:
-            fpath = path.join("cpu%i" % cpu, "cpufreq", "scaling_min_freq")
-            try:
-                self.__write_cpu_file(fpath, str(freq).encode())
-            except Exception as e:
-                print(e, freq, "{}.".format(max_freqs[cpu]))
-                raise CPUFreqBaseError(("ERROR: Frequency should be lt max "
-                                        "freq: {}".format(max_freqs[cpu])))
+        online = self.__get_mask("online")
+        freqs = self.__per_cpu(freq, rg, online, self.__check_freq)
+        res = self.__write_policies("scaling_min_freq", self.__encode(freqs),
+                                    freqs, workers, online)
+        failed = [cpu for cpu in res if res[cpu] is not None and
+                  not isinstance(res[cpu], CPUFreqBaseError)]
+        if failed:
+            max_freqs = self.get_max_freq(failed)
+            for cpu in failed:
+                res[cpu] = CPUFreqBaseError(
+                    "ERROR: Frequency should be lt max freq: {}".format(
+                        max_freqs.get(cpu)))
+        return res
 
-    def set_governors(self, gov, rg=None):
+    @__instrumented
+    def set_governors(self, gov, rg=None, workers=None):
         """
         Set governors
 
-        gov: str name of the governor
+        gov: str name of the governor, or dict cpus -> name
         rg: list of range of cores
+        workers: number of threads writing the policies in parallel
+        return: dict cpu -> None or CPUFreqBaseError of the failed write
         """
-        to_change = self.__get_ranges("online")
-        if isinstance(rg, int):
-            rg = [rg]
-        if rg:
-            to_change = set(rg) & set(self.__get_ranges("online"))
-        for cpu in to_change:
-            fpath = path.join("cpu%i" % cpu, "cpufreq", "scaling_governor")
-            self.__write_cpu_file(fpath, gov.encode())
+        online = self.__get_mask("online")
+        govs = self.__per_cpu(gov, rg, online)
+        res = self.__write_policies("scaling_governor",
+                                    {c: g.encode() for c, g in govs.items()},
+                                    govs, workers, online)
+        for cpu in res:
+            if res[cpu] is not None and \
+               not isinstance(res[cpu], CPUFreqBaseError):
+                res[cpu] = CPUFreqBaseError(
+                    "ERROR: Could not set governor {}: {}".format(
+                        govs[cpu], res[cpu]))
+        return res
+
+    @__instrumented
+    def set_frequency_limits(self, limits, rg=None, workers=None):
+        """
+        Set cores min and max frequencies together, reading the current
+        limits once and ordering the writes of each policy so min <= max
+        always holds: max first when the new min is above the current max,
+        min first otherwise
 
+        limits: (min, max) in KHz, either may be None to keep it, or dict
+            cpus -> (min, max)
+        rg: list of range of cores
+        workers: number of threads writing the policies in parallel
+        return: dict cpu -> None or CPUFreqBaseError of the failed write
+        """
+        def check(limit):
+            low, high = limit
+            for freq in limit:
+                if freq is not None:
+                    self.__check_freq(freq)
+            if low is not None and high is not None and low > high:
+                raise CPUFreqBaseError(
+                    "ERROR: Min frequency {} above max frequency {}".format(
+                        low, high))
+
+        online = self.__get_mask("online")
+        values = self.__per_cpu(limits, rg, online, check)
+        current = self.snapshot(CpuSet(values), fields=("max_freq",))
+        max_first = {c for c, (low, high) in values.items()
+                     if low is not None and c in current and
+                     low > current[c].max_freq}
+        res = dict.fromkeys(values)
+        for first in (True, False):
+            for var, pos in (("scaling_max_freq", 1), ("scaling_min_freq", 0)):
+                # max goes in the first pass of the max_first cpus and in
+                # the second pass of the others, min the other way round
+                freqs = {c: v[pos] for c, v in values.items()
+                         if v[pos] is not None and res[c] is None and
+                         (c in max_first) == (first == (pos == 1))}
+                if not freqs:
+                    continue
+                done = self.__write_policies(var, self.__encode(freqs),
+                                             freqs, workers, online)
+                for cpu, err in done.items():
+                    if err is not None and \
+                       not isinstance(err, CPUFreqBaseError):
+                        err = CPUFreqBaseError(
+                            "ERROR: Could not set {} to {}: {}".format(
+                                var, freqs[cpu], err))
+                    res[cpu] = err
+        return res
+
+    @__instrumented
+    def get_capabilities(self, cpu=None):
+        """
+        Get the capabilities of the cpufreq policy of cpu (driver,
+        governors, frequencies and hardware limits), read once per
+        policy
+
+        cpu: cpu number, default the first online cpu
+        return: Capabilities
+        """
+        if cpu is None:
+            cpu = self.__get_mask("online").min()
+        try:
+            return self.__capabilities.get(cpu)
+        except (IOError, OSError) as e:
+            raise CPUFreqBaseError("ERROR: Could not read the cpufreq "
+                                   "capabilities of cpu {}: {}".format(cpu, e))
+
+    @__instrumented
+    def get_available_governors(self, cpu=None):
+        """
+        Get the available governors of the policy of cpu, read from sysfs
+        on each call: governor modules may be loaded after the
+        capabilities were cached
+
+        cpu: cpu number, default the first online cpu
+        return: list of governor names
+        """
+        if cpu is None:
+            cpu = self.__get_mask("online").min()
+        try:
+            return self.__capabilities.governors(cpu)
+        except (IOError, OSError) as e:
+            raise CPUFreqBaseError("ERROR: Could not read the available "
+                                   "governors of cpu {}: {}".format(cpu, e))
+
+    @__instrumented
+    def get_topology(self):
+        """
+        Get the Topology of the cpus, rebuilt when the online cpus change
+        """
+        self.__get_mask("online")
+        return self.__current_topology()
+
+    def select_cpus(self, rg=None):
+        """
+        Get the online cpus selected by rg, all online cpus by default
+
+        rg: list of range of cores
+        """
+        with self.__lock:
+            online = self.__get_mask("online")
+            rg = self.__resolve(rg)
+            return list(rg & online if rg else online)
+
+    @__instrumented
     def get_online_cpus(self):
         """
         Get current online cpus
         """
-        return self.__get_ranges("online")
+        return list(self.__get_mask("online"))
 
+    @__instrumented
     def get_governors(self):
         """
         Get current governors
         """
         return self.__get_cpu_variable("scaling_governor")
 
-    def get_frequencies(self):
+    @__instrumented
+    def get_frequencies(self, rg=None, as_array=False, out=None):
         """
         Get current frequency speed
+
+        rg: list of range of cores
+        as_array: return a CPUStateArray instead of a dict
+        out: CPUStateArray of a previous call to fill again
         """
-        freqs = self.__get_cpu_variable("scaling_cur_freq")
-        for i in freqs:
-            freqs[i] = int(freqs[i])
-        return freqs
+        return self.__int_getter("scaling_cur_freq", rg, as_array, out)
 
-    def get_max_freq(self, rg=None):
+    @__instrumented
+    def get_max_freq(self, rg=None, as_array=False, out=None):
         """
         Get max frequency possible
 
         rg: list of range of cores
+        as_array: return a CPUStateArray instead of a dict
+        out: CPUStateArray of a previous call to fill again
         """
-        to_load = self.__get_ranges("online")
-        if isinstance(rg, int):
-            rg = [rg]
-        if rg:
-            to_load = set(rg) & set(self.__get_ranges("online"))
+        return self.__int_getter("scaling_max_freq", rg, as_array, out)
+
+    @__instrumented
+    def get_min_freq(self, rg=None, as_array=False, out=None):
+        """
+        Get min frequency possible
+
+        rg: list of range of cores
+        as_array: return a CPUStateArray instead of a dict
+        out: CPUStateArray of a previous call to fill again
+        """
+        return self.__int_getter("scaling_min_freq", rg, as_array, out)
+
+    @__instrumented
+    def get_setspeed(self, rg=None):
+        """
+        Get the frequency requested with the userspace governor, which
+        scaling_cur_freq only approximates on drivers reading it from the
+        hardware (APERF/MPERF on x86)
+
+        rg: list of range of cores
+        return: dict cpu -> frequency in KHz, None for the cpus not using
+            the userspace governor
+        """
+        online = self.__get_mask("online")
+        rg = self.__resolve(rg)
         data = {}
-        for cpu in to_load:
-            fpath = path.join("cpu%i" % cpu, "cpufreq", "scaling_max_freq")
-            data[int(cpu)] = int(self.__read_cpu_file(
-                fpath).rstrip("\n").split()[0])
+        for cpu in (rg & online if rg else online):
+            value = self.__read_cpu_file(path.join(
+                "cpu%i" % cpu, "cpufreq", "scaling_setspeed")).strip()
+            data[cpu] = int(value) if value.isdigit() else None
         return data
 
-    def get_min_freq(self, rg=None):
+    @__instrumented
+    def snapshot(self, rg=None, fields=CPUState._fields):
         """
-        Get min frequency possible
+        Get the state of the cpus in a single sweep, reading the online
+        cpus only once
+
         rg: list of range of cores
+        fields: CPUState fields to load, the others are None
+        return: dict cpu -> CPUState
         """
-        to_load = self.__get_ranges("online")
-        if isinstance(rg, int):
-            rg = [rg]
-        if rg:
-            to_load = set(rg) & set(self.__get_ranges("online"))
+        for field in fields:
+            if field not in cpuFreq.SNAPSHOT_FIELDS:
+                raise CPUFreqBaseError("ERROR: Unknown snapshot field "
+                                       "{}".format(field))
+        online = self.__get_mask("online")
+        rg = self.__resolve(rg)
+        to_load = rg & online if rg else online
+        attrs = [(field, cpuFreq.SNAPSHOT_FIELDS[field]) for field in fields]
+        empty = CPUState(None, None, None, None)
         data = {}
         for cpu in to_load:
-            fpath = path.join("cpu%i" % cpu, "cpufreq", "scaling_min_freq")
-            data[int(cpu)] = int(self.__read_cpu_file(
-                fpath).rstrip("\n").split()[0])
+            state = {}
+            for field, (var, parse) in attrs:
+                fpath = path.join("cpu%i" % cpu, "cpufreq", var)
+                state[field] = parse(self.__read_cpu_file(
+                    fpath).rstrip("\n").split()[0])
+            data[cpu] = empty._replace(**state)
         return data
+
+    def measure(self, rg=None, meter=None, interval=1.0):
+        """
+        Measure the energy and the frequency residency of a window, use
+        as a context manager:
+            with cpu.measure() as m:
+                work()
+            print(m.joules, m.watts, m.mean_frequency)
+
+        rg: list of range of cores for the residency
+        meter: EnergyMeter, default one reading every RAPL zone, False
+            to only measure the residency
+        interval: seconds between the background samples of the energy
+            counters
+        return: Measurement, filled when the window ends
+        """
+        # the energy module builds on this one, import it when used
+        from .energy import Measurement
+        return Measurement(self, rg, meter, interval)
+
+    def measure_transition_latency(self, from_f=None, to_f=None, rg=None,
+                                   repetitions=10, timeout=0.05, msr=None):
+        """
+        Measure how long the frequency takes to reach to_f after being
+        written from from_f, on one cpu of each policy of rg
+
+        from_f: frequency or list of frequencies in KHz, default all
+            available
+        to_f: frequency or list of frequencies in KHz, default all
+            available
+        rg: list of range of cores
+        repetitions: measures of each pair on each cpu
+        timeout: seconds to wait for a frequency to be reached
+        msr: read APERF/MPERF instead of scaling_cur_freq, default when
+            available
+        return: TransitionLatency, see its summary()
+        """
+        from .latency import TransitionLatency
+        latency = TransitionLatency(from_f, to_f, rg, repetitions, timeout,
+                                    cpu=self, msr=msr)
+        latency.run()
+        return latency
+
+    @staticmethod
+    def attach_shared(path=None):
+        """
+        Map the state published by SharedPublisher (cpufreq publish),
+        reading it needs no syscall and no cpuFreq instance:
+            shared = cpuFreq.attach_shared()
+            shared.read()[0].frequency
+
+        path: file backing the segment, default SHARED_PATH
+        return: SharedState
+        """
+        from .shared import SharedState, SHARED_PATH
+        return SharedState(path if path is not None else SHARED_PATH)
+
+    def pinned(self, freq=None, governor=None, rg=None):
+        """
+        Pin a governor and/or a frequency while a block or a function
+        runs, then restore what was changed:
+            with cpu.pinned(2200000, rg="0-3"):
+                work()
+
+            @cpu.pinned(governor="performance")
+            def phase():
+                ...
+
+        freq: frequency in KHz, with the userspace governor
+        governor: governor name, default "userspace" with freq
+        rg: list of range of cores
+        return: Pinned
+        """
+        from .pinning import Pinned
+        return Pinned(freq, governor, rg, cpu=self)
+
+    del __instrumented
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with CpuSet class, a set of cpus kept as an integer bitmask
+    with the kernel cpu list and cpumask formats.
+"""
+
+
+def _popcount(mask):
+    if hasattr(mask, "bit_count"):
+        return mask.bit_count()
+    return bin(mask).count("1")
+
+
+class CpuSet:
+    """
+    Immutable set of cpus backed by an int bitmask, bit n is cpu n.
+    Parses and formats the kernel cpu lists (0-3,8,10-11 and the strided
+    0-15:2/4) and hex cpumasks (00000000,000000ff), supports the set
+    operators and iterates in increasing order. Accepted wherever
+    cpuFreq takes rg.
+        Attributes
+            mask
+        Methods
+            from_bits()
+            parse()
+            from_list()
+            from_mask()
+            format()
+            format_mask()
+            issubset()
+            issuperset()
+            isdisjoint()
+            min()
+            max()
+    """
+
+    __slots__ = ("mask",)
+
+    def __init__(self, cpus=()):
+        """
+        cpus: iterable of cpu numbers or another CpuSet
+        """
+        if isinstance(cpus, CpuSet):
+            self.mask = cpus.mask
+            return
+        mask = 0
+        for cpu in cpus:
+            if cpu < 0:
+                raise ValueError("Invalid cpu number {}".format(cpu))
+            mask |= 1 << cpu
+        self.mask = mask
+
+    @classmethod
+    def from_bits(cls, mask):
+        """
+        Build from an int bitmask
+        """
+        obj = cls.__new__(cls)
+        obj.mask = mask
+        return obj
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse a cpu list, or a cpumask when prefixed with 0x
+        """
+        text = text.strip()
+        if text[:2].lower() == "0x":
+            return cls.from_mask(text[2:])
+        return cls.from_list(text)
+
+    @classmethod
+    def from_list(cls, text):
+        """
+        Parse a kernel cpu list like 0-3,8,10-11 or 0-15:2/4 (the first 2
+        cpus of each group of 4)
+        """
+        mask = 0
+        text = text.strip()
+        if not text:
+            return cls.from_bits(0)
+        try:
+            for part in text.split(","):
+                part, _, stride = part.partition(":")
+                first, _, last = part.partition("-")
+                first = int(first)
+                last = int(last) if last else first
+                if first < 0 or last < first:
+                    raise ValueError
+                if not stride:
+                    mask |= ((1 << (last - first + 1)) - 1) << first
+                    continue
+                used, _, group = stride.partition("/")
+                used, group = int(used), int(group)
+                if used <= 0 or group < used:
+                    raise ValueError
+                bits = (1 << used) - 1
+                for start in range(first, last + 1, group):
+                    width = min(used, last - start + 1)
+                    mask |= (bits >> (used - width)) << start
+        except ValueError:
+            raise ValueError("Invalid cpu list {!r}".format(text))
+        return cls.from_bits(mask)
+
+    @classmethod
+    def from_mask(cls, text):
+        """
+        Parse a hex cpumask, 32 bit words may be separated by commas
+        """
+        try:
+            return cls.from_bits(int(text.replace(",", "").strip() or "0",
+                                     16))
+        except ValueError:
+            raise ValueError("Invalid cpumask {!r}".format(text))
+
+    def __iter__(self):
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def __len__(self):
+        return _popcount(self.mask)
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __contains__(self, cpu):
+        return isinstance(cpu, int) and cpu >= 0 and \
+            bool((self.mask >> cpu) & 1)
+
+    def __eq__(self, other):
+        if isinstance(other, CpuSet):
+            return self.mask == other.mask
+        if isinstance(other, (set, frozenset)):
+            return self.mask == CpuSet(other).mask
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __repr__(self):
+        return "CpuSet({!r})".format(self.format())
+
+    def __str__(self):
+        return self.format()
+
+    @staticmethod
+    def __other(other):
+        if isinstance(other, CpuSet):
+            return other.mask
+        return CpuSet(other).mask
+
+    def __or__(self, other):
+        return CpuSet.from_bits(self.mask | self.__other(other))
+
+    def __and__(self, other):
+        return CpuSet.from_bits(self.mask & self.__other(other))
+
+    def __sub__(self, other):
+        return CpuSet.from_bits(self.mask & ~self.__other(other))
+
+    def __xor__(self, other):
+        return CpuSet.from_bits(self.mask ^ self.__other(other))
+
+    __ror__ = __or__
+    __rand__ = __and__
+    __rxor__ = __xor__
+
+    def __rsub__(self, other):
+        return CpuSet.from_bits(self.__other(other) & ~self.mask)
+
+    # interfaces
+    def issubset(self, other):
+        return self.mask & ~self.__other(other) == 0
+
+    def issuperset(self, other):
+        return self.__other(other) & ~self.mask == 0
+
+    def isdisjoint(self, other):
+        return self.mask & self.__other(other) == 0
+
+    def min(self):
+        """
+        Lowest cpu, ValueError when empty
+        """
+        if not self.mask:
+            raise ValueError("min() of an empty CpuSet")
+        return (self.mask & -self.mask).bit_length() - 1
+
+    def max(self):
+        """
+        Highest cpu, ValueError when empty
+        """
+        if not self.mask:
+            raise ValueError("max() of an empty CpuSet")
+        return self.mask.bit_length() - 1
+
+    def format(self):
+        """
+        Format as a kernel cpu list, like 0-3,8,10-11
+        """
+        parts = []
+        mask = self.mask
+        base = 0
+        while mask:
+            # skip the zeros, then take the run of ones
+            zeros = (mask & -mask).bit_length() - 1
+            mask >>= zeros
+            base += zeros
+            ones = (~mask & (mask + 1)).bit_length() - 1
+            if ones == 1:
+                parts.append(str(base))
+            else:
+                parts.append("%i-%i" % (base, base + ones - 1))
+            mask >>= ones
+            base += ones
+        return ",".join(parts)
+
+    def format_mask(self):
+        """
+        Format as a hex cpumask of comma separated 32 bit words, like
+        00000000,000000ff
+        """
+        words = max(1, -(-self.mask.bit_length() // 32))
+        digits = "%0*x" % (8*words, self.mask)
+        return ",".join(digits[i:i+8] for i in range(0, len(digits), 8))
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with the cpufreq daemon, which keeps a warm cpuFreq instance
+    and serves it over a Unix socket, and the client used by the CLI.
+
+    The protocol is one JSON object per line in each direction:
+        request  {"op": "set_governors", "args": ["powersave"], "kwargs": {}}
+        response {"ok": true, "result": ...} or {"ok": false, "error": "..."}
+"""
+from functools import partial
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from .capabilities import Capabilities
+from .cpufreq import cpuFreq, CPUFreqBaseError, CPUState
+from .cpuset import CpuSet
+from .state import CPUStateArray
+
+
+DEFAULT_SOCKET = os.environ.get("CPUFREQ_SOCKET", "/run/cpufreq.sock")
+
+# methods returning per cpu dicts
+CPU_OPS = ("get_governors", "get_frequencies", "get_max_freq",
+           "get_min_freq", "get_setspeed", "snapshot")
+# setters returning dict cpu -> None or error
+SETTER_OPS = ("set_governors", "set_frequencies", "set_max_frequencies",
+              "set_min_frequencies", "set_frequency_limits")
+# methods whose result is not sent back
+VOID_OPS = ("reset", "enable_cpu", "disable_cpu", "enable_all_cpu",
+            "disable_hyperthread", "invalidate_cache", "enable_stats",
+            "disable_stats")
+# arguments a client may pass to each operation, in the order of the
+# cpuFreq signatures; stats hooks, workers and out buffers stay in process
+ARGS = {"get_governors": (),
+        "get_frequencies": ("rg", "as_array"),
+        "get_max_freq": ("rg", "as_array"),
+        "get_min_freq": ("rg", "as_array"),
+        "get_setspeed": ("rg",),
+        "snapshot": ("rg", "fields"),
+        "set_governors": ("gov", "rg"),
+        "set_frequencies": ("freq", "rg"),
+        "set_max_frequencies": ("freq", "rg"),
+        "set_min_frequencies": ("freq", "rg"),
+        "set_frequency_limits": ("limits", "rg"),
+        "reset": ("rg",),
+        "enable_cpu": ("rg",),
+        "disable_cpu": ("rg",),
+        "enable_all_cpu": (),
+        "disable_hyperthread": (),
+        "invalidate_cache": ("rg",),
+        "enable_stats": (),
+        "disable_stats": (),
+        "get_online_cpus": (),
+        "get_capabilities": ("cpu",),
+        "get_available_governors": ("cpu",),
+        "info": (),
+        "stats": ("clear",)}
+OPS = tuple(ARGS)
+
+
+def encode(obj):
+    """
+    Convert a cpuFreq result into JSON types
+    """
+    if isinstance(obj, CPUState):
+        return list(obj)
+    if isinstance(obj, Capabilities):
+        return encode(obj._asdict())
+    if isinstance(obj, Exception):
+        return str(obj)
+    if isinstance(obj, CPUStateArray):
+        return encode(obj.to_dict())
+    if isinstance(obj, CpuSet):
+        return list(obj)
+    if isinstance(obj, dict):
+        return {str(k): encode(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set, range)):
+        return [encode(v) for v in obj]
+    return obj
+
+
+def decode(op, result):
+    """
+    Convert the JSON result of op back into the types cpuFreq returns
+    """
+    if op in CPU_OPS or op in SETTER_OPS:
+        data = {}
+        for k, v in result.items():
+            if op == "snapshot":
+                v = CPUState(*v)
+            elif op in SETTER_OPS and v is not None:
+                v = CPUFreqBaseError(v)
+            data[int(k)] = v
+        return data
+    if op == "get_capabilities":
+        return Capabilities(**result)
+    if op == "stats" and "cpus" in result:
+        result["cpus"] = {int(k): v for k, v in result["cpus"].items()}
+    return result
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """
+    Serve the requests of one connection
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = {"ok": True,
+                            "result": self.server.dispatch(json.loads(
+                                line.decode("utf-8")))}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response,
+                                        separators=(",", ":")).encode())
+            self.wfile.write(b"\n")
+            self.wfile.flush()
+
+
+class CPUFreqDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server sharing one cpuFreq instance between clients
+        Methods
+            dispatch()
+            serve_forever()
+            close()
+    """
+
+    daemon_threads = True
+
+    def __init__(self, cpu=None, path=DEFAULT_SOCKET):
+        """
+        cpu: cpuFreq instance to serve, default the shared instance with
+            persistent fds
+        path: socket path, created with permissions for the owner only
+        """
+        if os.path.exists(path):
+            client = connect(path)
+            if client is not None:
+                client.close()
+                raise CPUFreqBaseError("ERROR: a daemon is already running "
+                                       "on {}".format(path))
+            os.unlink(path)
+        self.cpu = cpu if cpu is not None else cpuFreq(persistent_fds=True)
+        self.path = path
+        self.__lock = threading.Lock()
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, DaemonHandler)
+        finally:
+            os.umask(umask)
+
+    # private
+    @staticmethod
+    def __arguments(op, args, kwargs):
+        """
+        Check the arguments of a request against ARGS
+
+        return: dict of keyword arguments
+        """
+        names = ARGS[op]
+        if not isinstance(args, list) or not isinstance(kwargs, dict):
+            raise CPUFreqBaseError("ERROR: Malformed arguments for "
+                                   "{}".format(op))
+        if len(args) > len(names):
+            raise CPUFreqBaseError("ERROR: {} takes at most {} "
+                                   "arguments".format(op, len(names)))
+        call = dict(zip(names, args))
+        for name, value in kwargs.items():
+            if name not in names or name in call:
+                raise CPUFreqBaseError("ERROR: Unexpected argument {} for "
+                                       "{}".format(name, op))
+            call[name] = value
+        return call
+
+    # interfaces
+    def dispatch(self, request):
+        """
+        Run a request on the cpuFreq instance and return the encoded
+        result
+        """
+        op = request.get("op")
+        if op not in ARGS:
+            raise CPUFreqBaseError("ERROR: Unknown operation {}".format(op))
+        kwargs = self.__arguments(op, request.get("args", []),
+                                  request.get("kwargs", {}))
+        with self.__lock:
+            if op == "info":
+                return {"driver": self.cpu.driver,
+                        "available_governors": self.cpu.available_governors,
+                        "available_frequencies":
+                            self.cpu.available_frequencies}
+            result = getattr(self.cpu, op)(**kwargs)
+        if op in VOID_OPS:
+            return None
+        return encode(result)
+
+    def close(self):
+        """
+        Stop serving and remove the socket
+        """
+        self.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class DaemonClient:
+    """
+    Client of a running daemon exposing the cpuFreq methods and
+    attributes, so it can replace a cpuFreq instance
+        Attributes
+            driver
+            available_governors
+            available_frequencies
+        Methods
+            call()
+            close()
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=5.0):
+        self.path = path
+        self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__sock.settimeout(timeout)
+        self.__sock.connect(path)
+        self.__file = self.__sock.makefile("rwb")
+        info = self.call("info")
+        self.driver = info["driver"]
+        self.available_governors = info["available_governors"]
+        self.available_frequencies = info["available_frequencies"]
+
+    def __getattr__(self, name):
+        if name in OPS:
+            return partial(self.call, name)
+        raise AttributeError(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def call(self, op, *args, **kwargs):
+        """
+        Run a cpuFreq method on the daemon
+        """
+        request = {"op": op, "args": encode(args), "kwargs": encode(kwargs)}
+        self.__file.write(json.dumps(request,
+                                     separators=(",", ":")).encode())
+        self.__file.write(b"\n")
+        self.__file.flush()
+        line = self.__file.readline()
+        if not line:
+            raise CPUFreqBaseError("ERROR: daemon closed the connection")
+        response = json.loads(line.decode("utf-8"))
+        if not response["ok"]:
+            raise CPUFreqBaseError(response["error"])
+        return decode(op, response["result"])
+
+    def close(self):
+        self.__file.close()
+        self.__sock.close()
+
+
+def connect(path=DEFAULT_SOCKET):
+    """
+    Connect to a running daemon
+
+    return: DaemonClient or None if no daemon answers on path
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return DaemonClient(path)
+    except (OSError, ValueError, CPUFreqBaseError):
+        return None
+
+
+def serve(cpu=None, path=DEFAULT_SOCKET):
+    """
+    Run the daemon until interrupted
+    """
+    server = CPUFreqDaemon(cpu, path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
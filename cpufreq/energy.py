@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with EnergyMeter class that reads the RAPL energy counters of
+    the powercap sysfs, and Measurement that reports the energy and the
+    frequency residency of a window together.
+"""
+from array import array
+from os import path
+import threading
+import time
+
+from .backend import SysfsBackend, SYSFS_POWERCAP
+from .cpufreq import CPUFreqBaseError
+from .residency import ResidencyTracker
+
+
+class EnergyMeter:
+    """
+    Accumulate the energy of the RAPL zones (package, core, uncore, dram)
+    from their energy_uj counters, handling the wraparound at
+    max_energy_range_uj. The counters are kept open, a sample costs one
+    pread per zone. Sample more often than the counters wrap (about a
+    minute at full power on large packages) to not miss a wrap.
+        Attributes
+            domains
+        Methods
+            start()
+            sample()
+            energy()
+            power()
+            elapsed()
+            close()
+    """
+
+    def __init__(self, domains=None, backend=None):
+        """
+        domains: zones to read, by name ("package-0", "package-0/dram")
+            or kind ("package", "core", "dram"), default all
+        backend: Backend of the powercap directory, default the sysfs
+        """
+        self.backend = backend if backend is not None else \
+            SysfsBackend(SYSFS_POWERCAP)
+        zones = self.__discover()
+        if domains is not None:
+            zones = [(zone, name) for zone, name in zones
+                     if self.__match(name, domains)]
+        if not zones:
+            raise CPUFreqBaseError("ERROR: No RAPL powercap domain found")
+        self.domains = [name for _, name in zones]
+        self.__files = []
+        ranges = []
+        try:
+            for zone, _ in zones:
+                ranges.append(int(self.backend.read(path.join(
+                    zone, "max_energy_range_uj"))))
+                self.__files.append(self.backend.open(path.join(
+                    zone, "energy_uj")))
+        except (IOError, OSError) as e:
+            self.close()
+            raise CPUFreqBaseError("ERROR: Cannot read the RAPL energy "
+                                   "counters: {}".format(e))
+        self.__ranges = array("Q", ranges)
+        self.__last = array("Q", [0])*len(zones)
+        self.__acc = array("Q", [0])*len(zones)
+        self.__lock = threading.Lock()
+        self.start()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # private
+    def __discover(self):
+        """
+        List the zones as (directory, name), subzones are named after
+        their package like "package-0/core"
+        """
+        try:
+            entries = self.backend.listdir("")
+        except (IOError, OSError):
+            return []
+        names = {}
+        for entry in entries:
+            if not self.backend.isfile(path.join(entry, "energy_uj")):
+                continue
+            try:
+                names[entry] = self.backend.read(path.join(
+                    entry, "name")).strip()
+            except (IOError, OSError):
+                names[entry] = entry
+        zones = []
+        for entry in sorted(names):
+            parent = entry.rsplit(":", 1)[0]
+            if entry.count(":") > 1 and parent in names:
+                zones.append((entry, names[parent] + "/" + names[entry]))
+            else:
+                zones.append((entry, names[entry]))
+        return zones
+
+    @staticmethod
+    def __match(name, domains):
+        leaf = name.rsplit("/", 1)[-1]
+        return any(d in (name, leaf, leaf.split("-", 1)[0])
+                   for d in domains)
+
+    # interfaces
+    def start(self):
+        """
+        Take the baseline, the accumulated energy restarts from zero
+        """
+        with self.__lock:
+            for i, f in enumerate(self.__files):
+                self.__last[i] = int(f.read())
+                self.__acc[i] = 0
+            self.__start = self.__time = time.monotonic()
+
+    def sample(self):
+        """
+        Read the counters and accumulate the energy since the last sample
+
+        return: dict domain -> joules since the start
+        """
+        with self.__lock:
+            for i, f in enumerate(self.__files):
+                cur = int(f.read())
+                delta = cur - self.__last[i]
+                if delta < 0:
+                    # max_energy_range_uj is the last value before 0
+                    delta += self.__ranges[i] + 1
+                self.__acc[i] += delta
+                self.__last[i] = cur
+            self.__time = time.monotonic()
+        return self.energy()
+
+    def energy(self):
+        """
+        Get the energy up to the last sample
+
+        return: dict domain -> joules
+        """
+        return {name: self.__acc[i]/1e6
+                for i, name in enumerate(self.domains)}
+
+    def elapsed(self):
+        """
+        Get the seconds between the start and the last sample
+        """
+        return self.__time - self.__start
+
+    def power(self):
+        """
+        Get the average power between the start and the last sample
+
+        return: dict domain -> watts
+        """
+        elapsed = self.elapsed()
+        return {name: (j/elapsed if elapsed > 0 else 0.0)
+                for name, j in self.energy().items()}
+
+    def close(self):
+        """
+        Close the energy counters
+        """
+        for f in self.__files:
+            f.close()
+        self.__files = []
+
+
+class Measurement:
+    """
+    Window measuring the energy and the frequency residency of a set of
+    cpus, see cpuFreq.measure()
+        Attributes
+            elapsed
+            joules
+            watts
+            residency
+            mean_frequency
+        Methods
+            start()
+            stop()
+            close()
+    """
+
+    def __init__(self, cpu, rg=None, meter=None, interval=1.0):
+        """
+        cpu: cpuFreq instance
+        rg: list of range of cores for the residency, default all online
+            cpus
+        meter: EnergyMeter, default one reading every RAPL zone, False
+            to only measure the residency
+        interval: seconds between the samples taken in the background so
+            the energy counters cannot wrap twice unnoticed
+        """
+        # the default meter is owned by the window, closed with it
+        self.__own_meter = meter is None
+        if meter is None:
+            meter = EnergyMeter()
+        self.__meter = meter if meter is not False else None
+        try:
+            self.__tracker = ResidencyTracker(rg, cpu)
+        except CPUFreqBaseError:
+            self.__tracker = None
+        self.interval = interval
+        self.elapsed = 0.0
+        self.joules = {}
+        self.watts = {}
+        self.residency = None
+        self.mean_frequency = None
+        self.__start = 0.0
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        self.close()
+
+    # private
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            self.__meter.sample()
+
+    # interfaces
+    def start(self):
+        """
+        Start the window
+        """
+        if self.__tracker is not None:
+            try:
+                self.__tracker.start()
+            except CPUFreqBaseError:
+                # no cpufreq stats, only the energy is measured
+                self.__tracker = None
+        self.__start = time.monotonic()
+        if self.__meter is None:
+            return
+        self.__meter.start()
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="Measurement", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        End the window and fill the results
+        """
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
+        if self.__meter is not None:
+            self.joules = self.__meter.sample()
+            self.watts = self.__meter.power()
+            self.elapsed = self.__meter.elapsed()
+        else:
+            self.elapsed = time.monotonic() - self.__start
+        if self.__tracker is not None:
+            self.__tracker.stop()
+            self.residency = self.__tracker.residency()
+            self.mean_frequency = self.__tracker.mean_frequency()
+
+    def close(self):
+        """
+        Close the energy counters of the default EnergyMeter, a meter
+        given by the caller is left open
+        """
+        if self.__own_meter and self.__meter is not None:
+            self.__meter.close()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with the Prometheus/OpenMetrics exporter: MetricsCollector
+    sweeps sysfs at most once per ttl and keeps the exposition text
+    formatted, MetricsServer serves it over HTTP and write_textfile()
+    writes it for the node_exporter textfile collector.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+import socketserver
+import threading
+import time
+
+from .backend import user_hz
+from .cpufreq import cpuFreq
+
+
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# name, type, help, CPUState field (None for the time_in_state counters)
+FAMILIES = (
+    ("cpufreq_frequency_hertz", "gauge",
+     "Current frequency of the cpu.", "frequency"),
+    ("cpufreq_min_frequency_hertz", "gauge",
+     "Minimum frequency allowed to the cpu.", "min_freq"),
+    ("cpufreq_max_frequency_hertz", "gauge",
+     "Maximum frequency allowed to the cpu.", "max_freq"),
+    ("cpufreq_governor", "gauge",
+     "Governor of the cpu, 1 for the current one.", "governor"),
+    ("cpufreq_time_in_state_seconds", "counter",
+     "Time the cpufreq policy spent at each frequency.", None),
+)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class MetricsCollector:
+    """
+    Per cpu frequency, limits and governor gauges and per policy
+    time_in_state counters. A sweep reads the cpus once (snapshot) and
+    the stats of each policy once; scrapes within ttl of it share its
+    result. Every sample line is kept formatted with its value and only
+    the lines whose value changed are formatted again, the whole text is
+    reused when nothing changed.
+        Attributes
+            ttl
+            sweeps
+        Methods
+            collect()
+            render()
+    """
+
+    def __init__(self, cpu=None, ttl=1.0):
+        """
+        cpu: cpuFreq instance, default the shared instance
+        ttl: seconds a sweep is served before sysfs is read again
+        """
+        self.__cpu = cpu if cpu is not None else cpuFreq()
+        self.ttl = ttl
+        self.sweeps = 0
+        # time_in_state counts in USER_HZ
+        self.__hz = user_hz()
+        self.__lock = threading.Lock()
+        self.__stamp = None
+        # family -> {key: (value, line)}, family -> formatted text
+        self.__lines = {f[0]: {} for f in FAMILIES}
+        self.__texts = {}
+        self.__bodies = {}
+
+    # private
+    def __sweep(self):
+        """
+        Read the cpus and the policy stats
+
+        return: dict family -> {key: (sort key, value, labels)}
+        """
+        cpu = self.__cpu
+        states = cpu.snapshot()
+        samples = {f[0]: {} for f in FAMILIES}
+        for name, _, _, field in FAMILIES:
+            if field is None:
+                continue
+            for c, state in states.items():
+                value = getattr(state, field)
+                if field == "governor":
+                    labels = 'cpu="%i",governor="%s"' % (c, value)
+                    samples[name][c] = (c, 1, labels)
+                else:
+                    samples[name][c] = (c, value*1000, 'cpu="%i"' % c)
+        topology = cpu.get_topology()
+        seen = set()
+        counters = samples["cpufreq_time_in_state_seconds"]
+        for c in sorted(states):
+            policy = topology.policy_of(c)
+            policy = c if policy is None else policy
+            if policy in seen:
+                continue
+            seen.add(policy)
+            try:
+                text = cpu.backend.read("cpu%i/cpufreq/stats/time_in_state"
+                                        % c)
+            except (IOError, OSError):
+                continue
+            for line in text.splitlines():
+                fields = line.split()
+                if len(fields) != 2:
+                    continue
+                freq = int(fields[0])
+                labels = 'policy="%i",frequency="%i"' % (policy, freq*1000)
+                counters[(policy, freq)] = ((policy, freq),
+                                            int(fields[1])/self.__hz, labels)
+        return samples
+
+    def __update(self, samples):
+        """
+        Format the lines whose value changed and the families holding them
+        """
+        for name, kind, _, _ in FAMILIES:
+            lines = self.__lines[name]
+            current = samples[name]
+            changed = len(lines) != len(current)
+            sample = name + "_total" if kind == "counter" else name
+            for key, (_, value, labels) in current.items():
+                cached = lines.get(key)
+                if cached is not None and cached[0] == (value, labels):
+                    continue
+                lines[key] = ((value, labels), "%s{%s} %s\n" % (
+                    sample, labels, _format_value(value)))
+                changed = True
+            for key in [k for k in lines if k not in current]:
+                del lines[key]
+            if changed or name not in self.__texts:
+                self.__texts[name] = "".join(
+                    lines[key][1] for key in sorted(
+                        lines, key=lambda k: current[k][0]))
+                self.__bodies.clear()
+
+    # interfaces
+    def collect(self):
+        """
+        Sweep sysfs unless the last sweep is younger than ttl, concurrent
+        callers wait for the same sweep
+        """
+        with self.__lock:
+            now = time.monotonic()
+            if self.__stamp is not None and now - self.__stamp < self.ttl:
+                return
+            self.__update(self.__sweep())
+            self.__stamp = time.monotonic()
+            self.sweeps += 1
+
+    def render(self, openmetrics=False):
+        """
+        Collect if needed and get the exposition text
+
+        openmetrics: OpenMetrics format instead of the Prometheus text
+            format
+        return: bytes
+        """
+        self.collect()
+        with self.__lock:
+            body = self.__bodies.get(openmetrics)
+            if body is not None:
+                return body
+            parts = []
+            for name, kind, help_text, _ in FAMILIES:
+                family = name if openmetrics or kind != "counter" \
+                    else name + "_total"
+                parts.append("# HELP %s %s\n# TYPE %s %s\n" % (
+                    family, help_text, family, kind))
+                parts.append(self.__texts.get(name, ""))
+            if openmetrics:
+                parts.append("# EOF\n")
+            body = self.__bodies[openmetrics] = "".join(parts).encode()
+            return body
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serve /metrics from the collector of the server
+    """
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        openmetrics = "application/openmetrics-text" in \
+            self.headers.get("Accept", "")
+        try:
+            body = self.server.collector.render(openmetrics)
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", OPENMETRICS_TYPE if openmetrics
+                         else PROMETHEUS_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    HTTP server exposing a MetricsCollector
+        Attributes
+            collector
+    """
+
+    daemon_threads = True
+
+    def __init__(self, collector, address=("", 9880)):
+        """
+        collector: MetricsCollector
+        address: (host, port) to listen on
+        """
+        self.collector = collector
+        super().__init__(address, MetricsHandler)
+
+
+def write_textfile(collector, fpath):
+    """
+    Write the metrics for the textfile collector, atomically: the file is
+    written aside and renamed over fpath
+    """
+    tmp = "%s.%i.tmp" % (fpath, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(collector.render())
+    os.replace(tmp, fpath)
+
+
+def serve_metrics(cpu=None, address=("", 9880), ttl=1.0):
+    """
+    Serve the metrics until interrupted
+    """
+    server = MetricsServer(MetricsCollector(cpu, ttl), address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with TransitionLatency class that measures how long the
+    hardware takes to reach a frequency after it is written.
+"""
+from os import path
+import os
+import struct
+import time
+
+from .backend import SYSFS_CPU
+from .cpufreq import cpuFreq, CPUFreqBaseError
+from .sampler import percentile
+
+
+MSR_MPERF = 0xE7
+MSR_APERF = 0xE8
+
+
+class MSRFrequency:
+    """
+    Effective frequency of a cpu from its APERF/MPERF counters read
+    through /dev/cpu/N/msr, over the interval between two reads. The
+    counters only run while the cpu is active, so the reading cpu
+    should be the measured one.
+    """
+
+    def __init__(self, cpu, base_freq):
+        """
+        cpu: cpu number
+        base_freq: frequency MPERF counts at in KHz
+        """
+        self.fd = os.open("/dev/cpu/%i/msr" % cpu, os.O_RDONLY)
+        self.base_freq = base_freq
+        self.__last = self.__counters()
+
+    def __counters(self):
+        aperf = struct.unpack("<Q", os.pread(self.fd, 8, MSR_APERF))[0]
+        mperf = struct.unpack("<Q", os.pread(self.fd, 8, MSR_MPERF))[0]
+        return aperf, mperf
+
+    def read(self):
+        """
+        return: frequency in KHz since the previous read, 0 if the cpu
+            was idle
+        """
+        aperf, mperf = self.__counters()
+        last_aperf, last_mperf = self.__last
+        self.__last = (aperf, mperf)
+        if mperf <= last_mperf:
+            return 0
+        return int(self.base_freq*(aperf - last_aperf)/(mperf - last_mperf))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TransitionLatency:
+    """
+    Measure the frequency transition latency of cpufreq policies: write
+    a frequency with set_frequencies, then poll the current frequency
+    until it is within tolerance of the target. The frequency is read
+    from scaling_cur_freq, or from APERF/MPERF when the msr driver is
+    available. The polling thread is pinned to the measured cpu.
+        Attributes
+            pairs
+            cpus
+            samples
+            timeouts
+            source
+        Methods
+            run()
+            summary()
+    """
+
+    def __init__(self, from_f=None, to_f=None, rg=None, repetitions=10,
+                 timeout=0.05, tolerance=0.02, cpu=None, msr=None):
+        """
+        from_f: starting frequency or list of them in KHz, default all
+            available
+        to_f: target frequency or list of them, default all available
+        rg: list of range of cores, one cpu per cpufreq policy is
+            measured, default all online cpus
+        repetitions: measures of each pair on each cpu
+        timeout: seconds to wait for a frequency to be reached
+        tolerance: relative distance to the target counted as reached
+        cpu: cpuFreq instance, default the shared instance
+        msr: read APERF/MPERF, default when /dev/cpu/N/msr is readable and
+            the instance uses the real sysfs
+        """
+        self.__cpu = cpu if cpu is not None else cpuFreq()
+        freqs = sorted(self.__cpu.available_frequencies)
+        if not freqs:
+            # no frequency table, measure between the hardware limits
+            caps = self.__cpu.get_capabilities()
+            freqs = [f for f in (caps.min_freq, caps.max_freq)
+                     if f is not None]
+        from_f = freqs if from_f is None else from_f
+        to_f = freqs if to_f is None else to_f
+        from_f = [from_f] if isinstance(from_f, int) else list(from_f)
+        to_f = [to_f] if isinstance(to_f, int) else list(to_f)
+        self.pairs = [(a, b) for a in from_f for b in to_f if a != b]
+        if not self.pairs:
+            raise CPUFreqBaseError("ERROR: No frequency pair to measure")
+        topology = self.__cpu.get_topology()
+        leaders = {}
+        for c in self.__cpu.select_cpus(rg):
+            p = topology.policy_of(c)
+            leaders.setdefault(("cpu", c) if p is None else ("policy", p), c)
+        self.cpus = sorted(leaders.values())
+        self.repetitions = repetitions
+        self.timeout = timeout
+        self.tolerance = tolerance
+        if msr is None:
+            msr = getattr(self.__cpu.backend, "basedir", None) == SYSFS_CPU \
+                and all(os.access("/dev/cpu/%i/msr" % c, os.R_OK)
+                        for c in self.cpus)
+        self.source = "msr" if msr else "scaling_cur_freq"
+        # (cpu, from, to) -> list of (latency, write time) in seconds
+        self.samples = {}
+        self.timeouts = {}
+
+    # private
+    def __reader(self, c):
+        if self.source == "msr":
+            try:
+                base = int(self.__cpu.backend.read(path.join(
+                    "cpu%i" % c, "cpufreq", "base_frequency")))
+            except (IOError, OSError, ValueError):
+                base = int(self.__cpu.backend.read(path.join(
+                    "cpu%i" % c, "cpufreq", "cpuinfo_max_freq")))
+            return MSRFrequency(c, base)
+        return self.__cpu.backend.open(path.join("cpu%i" % c, "cpufreq",
+                                                 "scaling_cur_freq"))
+
+    def __set(self, freq, c):
+        err = self.__cpu.set_frequencies(freq, rg=[c]).get(c)
+        if err is not None:
+            raise err
+
+    def __wait(self, reader, target, begin):
+        """
+        Poll until target is reached
+
+        return: time it was reached, None on timeout
+        """
+        margin = self.tolerance*target
+        clock = time.perf_counter
+        read = reader.read
+        while True:
+            now = clock()
+            if abs(int(read()) - target) <= margin:
+                return now
+            if now - begin > self.timeout:
+                return None
+
+    def __measure_cpu(self, c):
+        reader = self.__reader(c)
+        try:
+            for from_f, to_f in self.pairs:
+                key = (c, from_f, to_f)
+                samples = self.samples.setdefault(key, [])
+                self.timeouts.setdefault(key, 0)
+                for _ in range(self.repetitions):
+                    self.__set(from_f, c)
+                    if self.__wait(reader, from_f,
+                                   time.perf_counter()) is None:
+                        self.timeouts[key] += 1
+                        continue
+                    begin = time.perf_counter()
+                    self.__set(to_f, c)
+                    written = time.perf_counter()
+                    reached = self.__wait(reader, to_f, begin)
+                    if reached is None:
+                        self.timeouts[key] += 1
+                        continue
+                    samples.append((max(reached, written) - begin,
+                                    written - begin))
+        finally:
+            reader.close()
+
+    # interfaces
+    def run(self):
+        """
+        Measure every pair on every cpu, the governors and frequencies
+        are restored after
+
+        return: see summary()
+        """
+        cpu = self.__cpu
+        previous = cpu.snapshot(rg=self.cpus, fields=("governor",))
+        # the speed requested, scaling_cur_freq may be measured
+        speeds = cpu.get_setspeed(rg=self.cpus)
+        affinity = None
+        if hasattr(os, "sched_getaffinity"):
+            affinity = os.sched_getaffinity(0)
+        self.samples = {}
+        self.timeouts = {}
+        try:
+            res = cpu.set_governors("userspace", rg=self.cpus)
+            for err in res.values():
+                if err is not None:
+                    raise err
+            for c in self.cpus:
+                if affinity is not None and c in affinity:
+                    os.sched_setaffinity(0, [c])
+                self.__measure_cpu(c)
+        finally:
+            if affinity is not None:
+                os.sched_setaffinity(0, affinity)
+            for c, state in previous.items():
+                cpu.set_governors(state.governor, rg=[c])
+                if speeds.get(c) is not None:
+                    cpu.set_frequencies(speeds[c], rg=[c])
+        return self.summary()
+
+    def summary(self, per_cpu=False):
+        """
+        Get the latency distributions in seconds
+
+        per_cpu: keep the cpus apart, otherwise merge them
+        return: dict (from, to) (or (cpu, from, to)) -> dict with count,
+            timeouts, min, mean, p50, p90, p99, max and write (mean time
+            spent in the write)
+        """
+        merged = {}
+        for (c, from_f, to_f), samples in self.samples.items():
+            key = (c, from_f, to_f) if per_cpu else (from_f, to_f)
+            entry = merged.setdefault(key, ([], [0]))
+            entry[0].extend(samples)
+            entry[1][0] += self.timeouts.get((c, from_f, to_f), 0)
+        data = {}
+        for key, (samples, timeouts) in merged.items():
+            lat = sorted(s[0] for s in samples)
+            stats = {"count": len(lat), "timeouts": timeouts[0]}
+            if lat:
+                stats.update({"min": lat[0], "max": lat[-1],
+                              "mean": sum(lat)/len(lat),
+                              "p50": percentile(lat, 50),
+                              "p90": percentile(lat, 90),
+                              "p99": percentile(lat, 99),
+                              "write": sum(s[1] for s in samples)
+                              / len(samples)})
+            data[key] = stats
+        return data
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with Pinned class that sets a governor and/or a fixed
+    frequency for a code region and restores the previous state after.
+"""
+from contextlib import ContextDecorator
+
+from .cpufreq import cpuFreq, CPUFreqBaseError
+
+
+class Pinned(ContextDecorator):
+    """
+    Pin the policies of a set of cpus to a governor and/or a frequency
+    (with the userspace governor) while a block or a decorated function
+    runs. Only the attributes that differ are written, one cpu per
+    policy, and only those are restored on exit, exceptions included, so
+    nested and repeated uses of the same setting cost the state read
+    only.
+        Attributes
+            freq
+            governor
+            writes
+        Methods
+            enter()
+            exit()
+    """
+
+    def __init__(self, freq=None, governor=None, rg=None, cpu=None):
+        """
+        freq: frequency in KHz, sets the userspace governor unless
+            governor is given
+        governor: governor name, default "userspace" with freq
+        rg: list of range of cores, default all online cpus
+        cpu: cpuFreq instance, default the shared instance when entered
+        """
+        if freq is None and governor is None:
+            raise CPUFreqBaseError("ERROR: Nothing to pin, give freq "
+                                   "and/or governor")
+        if governor is None:
+            governor = "userspace"
+        if freq is not None and governor != "userspace":
+            raise CPUFreqBaseError("ERROR: A fixed frequency needs the "
+                                   "userspace governor")
+        self.freq = freq
+        self.governor = governor
+        self.rg = rg
+        self.__cpu = cpu
+        # writes made by the last enter, restored ones not counted
+        self.writes = 0
+        # one entry per active enter, the decorator can recurse
+        self.__saved = []
+
+    def __enter__(self):
+        self.enter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.exit(raise_errors=exc_type is None)
+        return False
+
+    # private
+    def __leaders(self, cpu):
+        """
+        One cpu per cpufreq policy of rg
+        """
+        topology = cpu.get_topology()
+        leaders = {}
+        for c in cpu.select_cpus(self.rg):
+            p = topology.policy_of(c)
+            leaders.setdefault(("cpu", c) if p is None else ("policy", p), c)
+        return sorted(leaders.values())
+
+    @staticmethod
+    def __check(res):
+        for err in res.values():
+            if err is not None:
+                raise err
+
+    def __restore(self, cpu, governors, freqs):
+        errors = {}
+        if governors:
+            errors.update(cpu.set_governors(governors))
+        if freqs:
+            errors.update(cpu.set_frequencies(freqs))
+        return errors
+
+    # interfaces
+    def enter(self):
+        """
+        Write the attributes that differ from the wanted state and save
+        their previous values
+        """
+        cpu = self.__cpu if self.__cpu is not None else cpuFreq()
+        leaders = self.__leaders(cpu)
+        previous = cpu.snapshot(leaders, fields=("governor",))
+        # the speeds requested, scaling_cur_freq is measured on x86 and
+        # rarely equals them
+        speeds = {}
+        if self.freq is not None or any(s.governor == "userspace"
+                                        for s in previous.values()):
+            speeds = cpu.get_setspeed(leaders)
+        # previous values of what is changed, to restore in this order
+        governors = {}
+        freqs = {}
+        for c, state in previous.items():
+            if state.governor != self.governor:
+                governors[c] = state.governor
+                if speeds.get(c) is not None:
+                    freqs[c] = speeds[c]
+            elif self.freq is not None and speeds.get(c) != self.freq:
+                freqs[c] = speeds[c]
+        self.__saved.append((cpu, governors, freqs))
+        self.writes = 0
+        try:
+            if governors:
+                self.__check(cpu.set_governors(self.governor,
+                                               rg=list(governors)))
+                self.writes += len(governors)
+            to_set = [c for c in previous
+                      if c in governors or c in freqs]
+            if self.freq is not None and to_set:
+                self.__check(cpu.set_frequencies(self.freq, rg=to_set))
+                self.writes += len(to_set)
+        except Exception:
+            self.exit(raise_errors=False)
+            raise
+
+    def exit(self, raise_errors=True):
+        """
+        Restore the values saved by the matching enter()
+
+        raise_errors: raise the first restore error, if any
+        """
+        cpu, governors, freqs = self.__saved.pop()
+        errors = self.__restore(cpu, governors, freqs)
+        if raise_errors:
+            self.__check(errors)
+
+
+def pinned(freq=None, governor=None, rg=None, cpu=None):
+    """
+    Get a Pinned, usable as a context manager or a decorator:
+        @pinned(2200000, rg="0-3")
+        def phase():
+            ...
+    """
+    return Pinned(freq, governor, rg, cpu)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with Placement class that pins threads and processes with
+    sched_setaffinity onto the cpus whose frequency matches their
+    performance class.
+"""
+from collections import deque, namedtuple
+import os
+import threading
+import time
+
+from .cpufreq import cpuFreq, CPUFreqBaseError
+from .cpuset import CpuSet
+from .watch import HotplugWatcher
+
+
+PlacementDecision = namedtuple("PlacementDecision", ["time", "tid", "cls",
+                                                     "cpus", "reason"])
+PlacementDecision.__doc__ = """Affinity change of a task: reason is
+"placed" (first placement), "moved" (its class maps to other cpus for
+hysteresis rebalances in a row), "fallback" (no cpu matches its class,
+the closest are used), "exited" or "error: ..."."""
+
+
+class Placement:
+    """
+    Place tasks (pids or tids) by performance class. A class is a range
+    of frequencies; its cpus are the online cpus whose scaling_max_freq
+    is in the range, or the closest ones when none matches, the
+    scaling_cur_freq only breaking the ties. rebalance() takes one
+    snapshot of the cpus and changes the affinity of the tasks whose
+    cpus changed; start() runs it periodically and on hotplug, governor
+    and limits changes.
+        Attributes
+            classes
+            tasks
+            decisions
+        Methods
+            add()
+            add_threads()
+            remove()
+            targets()
+            rebalance()
+            report()
+            start()
+            stop()
+    """
+
+    def __init__(self, classes, cpu=None, setaffinity=None, history=1000,
+                 hysteresis=3):
+        """
+        classes: dict name -> (min, max) frequencies in KHz, either may
+            be None for no bound. Ex: {"latency": (2600000, None),
+            "batch": (None, 1800000)}
+        cpu: cpuFreq instance, default the shared instance
+        setaffinity: function(tid, cpus) applying an affinity, default
+            os.sched_setaffinity
+        history: decisions kept
+        hysteresis: rebalances in a row a task must be given the same new
+            cpus before it is moved, 1 moves it at once
+        """
+        self.__cpu = cpu if cpu is not None else cpuFreq()
+        self.classes = {}
+        for name, (low, high) in classes.items():
+            if low is not None and high is not None and low > high:
+                raise CPUFreqBaseError("ERROR: Class {} has min frequency "
+                                       "above max frequency".format(name))
+            self.classes[name] = (low or 0, high)
+        if setaffinity is None:
+            if not hasattr(os, "sched_setaffinity"):
+                raise CPUFreqBaseError("ERROR: sched_setaffinity is not "
+                                       "available")
+            setaffinity = os.sched_setaffinity
+        self.__setaffinity = setaffinity
+        self.hysteresis = max(1, hysteresis)
+        # tid -> class, tid -> CpuSet applied last, tid -> (CpuSet, count)
+        # of a move waiting for the hysteresis
+        self.tasks = {}
+        self.__placed = {}
+        self.__pending = {}
+        self.decisions = deque(maxlen=history)
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__watcher = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # private
+    @staticmethod
+    def __distance(freq, low, high):
+        if freq < low:
+            return low - freq
+        if high is not None and freq > high:
+            return freq - high
+        return 0
+
+    def __match(self, states, low, high):
+        """
+        Cpus of a class, by their limits which do not follow the load;
+        the current frequency only breaks the ties of the fallback
+
+        return: (CpuSet, fallback)
+        """
+        limits = {c: self.__distance(s.max_freq, low, high)
+                  for c, s in states.items()}
+        cpus = CpuSet(c for c, d in limits.items() if d == 0)
+        if cpus or not states:
+            return cpus, False
+        best = min(limits.values())
+        tied = {c: self.__distance(states[c].frequency, low, high)
+                for c, d in limits.items() if d == best}
+        best = min(tied.values())
+        return CpuSet(c for c, d in tied.items() if d == best), True
+
+    def __targets(self, states):
+        return {name: self.__match(states, low, high)
+                for name, (low, high) in self.classes.items()}
+
+    def __settled(self, tid, cpus, online):
+        """
+        Check if a task given new cpus may move now
+        """
+        placed = self.__placed.get(tid)
+        if placed is None or self.hysteresis == 1 or \
+                not placed.issubset(online):
+            self.__pending.pop(tid, None)
+            return True
+        last, count = self.__pending.get(tid, (None, 0))
+        count = count + 1 if last == cpus else 1
+        if count < self.hysteresis:
+            self.__pending[tid] = (cpus, count)
+            return False
+        del self.__pending[tid]
+        return True
+
+    def __notify(self, event):
+        self.__wake.set()
+
+    def __run(self, interval):
+        while not self.__stop.is_set():
+            try:
+                self.rebalance()
+            except (IOError, OSError, CPUFreqBaseError):
+                pass
+            self.__wake.wait(interval)
+            self.__wake.clear()
+
+    # interfaces
+    def add(self, tid, cls):
+        """
+        Place a task in a class at the next rebalance()
+
+        tid: pid or thread id
+        cls: class name
+        """
+        if cls not in self.classes:
+            raise CPUFreqBaseError("ERROR: Unknown class {}".format(cls))
+        with self.__lock:
+            self.tasks[tid] = cls
+            self.__placed.pop(tid, None)
+            self.__pending.pop(tid, None)
+
+    def add_threads(self, cls, pid=None, proc="/proc"):
+        """
+        Place every thread of a process in a class
+
+        pid: process id, default the current process
+        proc: procfs mount point
+        """
+        pid = os.getpid() if pid is None else pid
+        try:
+            tids = os.listdir(os.path.join(proc, str(pid), "task"))
+        except OSError as e:
+            raise CPUFreqBaseError("ERROR: Could not list the threads of "
+                                   "{}: {}".format(pid, e))
+        for tid in tids:
+            self.add(int(tid), cls)
+
+    def remove(self, tid):
+        """
+        Stop placing a task, its affinity is left as is
+        """
+        with self.__lock:
+            self.tasks.pop(tid, None)
+            self.__placed.pop(tid, None)
+            self.__pending.pop(tid, None)
+
+    def targets(self):
+        """
+        Get the cpus of each class from one snapshot of the online cpus
+
+        return: dict class -> (CpuSet, fallback)
+        """
+        return self.__targets(self.__cpu.snapshot(
+            fields=("frequency", "max_freq")))
+
+    def rebalance(self):
+        """
+        Apply the affinity of the tasks whose class maps to new cpus
+
+        return: list of PlacementDecision made
+        """
+        states = self.__cpu.snapshot(fields=("frequency", "max_freq"))
+        targets = self.__targets(states)
+        online = CpuSet(states)
+        made = []
+        with self.__lock:
+            for tid, cls in list(self.tasks.items()):
+                cpus, fallback = targets[cls]
+                if not cpus:
+                    continue
+                if self.__placed.get(tid) == cpus:
+                    self.__pending.pop(tid, None)
+                    continue
+                if not self.__settled(tid, cpus, online):
+                    continue
+                if fallback:
+                    reason = "fallback"
+                elif tid in self.__placed:
+                    reason = "moved"
+                else:
+                    reason = "placed"
+                try:
+                    self.__setaffinity(tid, set(cpus))
+                    self.__placed[tid] = cpus
+                except ProcessLookupError:
+                    reason = "exited"
+                    del self.tasks[tid]
+                    self.__placed.pop(tid, None)
+                except OSError as e:
+                    # not applied, tried again at the next rebalance
+                    reason = "error: {}".format(e)
+                decision = PlacementDecision(time.time(), tid, cls, cpus,
+                                             reason)
+                made.append(decision)
+                self.decisions.append(decision)
+        return made
+
+    def report(self):
+        """
+        Get the current placement
+
+        return: dict class -> dict with "cpus" (CpuSet, union of the
+            affinities applied to its tasks) and "tasks" (list of tids)
+        """
+        with self.__lock:
+            data = {name: {"cpus": CpuSet(), "tasks": []}
+                    for name in self.classes}
+            for tid, cls in sorted(self.tasks.items()):
+                data[cls]["tasks"].append(tid)
+                if tid in self.__placed:
+                    data[cls]["cpus"] = data[cls]["cpus"] | self.__placed[tid]
+        return data
+
+    def start(self, interval=1.0, watch=True):
+        """
+        Rebalance every interval seconds in a background thread
+
+        watch: also rebalance at once on hotplug, governor and limits
+            changes, seen by a HotplugWatcher of the placement
+        """
+        if self.__thread is not None:
+            return
+        if watch:
+            self.__watcher = HotplugWatcher(self.__cpu)
+            self.__watcher.subscribe(self.__notify)
+            self.__watcher.start()
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run,
+                                         args=(interval,), daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        if self.__watcher is not None:
+            # only the watcher started here, the one of cpuFreq is kept
+            self.__watcher.stop()
+            self.__watcher = None
+        self.__stop.set()
+        self.__wake.set()
+        self.__thread.join()
+        self.__thread = None
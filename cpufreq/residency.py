@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with ResidencyTracker class that accounts the time spent at
+    each frequency from the cpufreq stats (time_in_state, total_trans and
+    trans_table).
+"""
+from array import array
+from os import path
+
+from .backend import user_hz
+from .cpufreq import cpuFreq, CPUFreqBaseError
+
+
+class _PolicyCounters:
+    """
+    Counters of one cpufreq policy. Times are kept in preallocated arrays
+    indexed by frequency, parsed in place on every update.
+    """
+
+    def __init__(self, leader, cpus):
+        self.leader = leader
+        self.cpus = cpus
+        self.stats = path.join("cpu%i" % leader, "cpufreq", "stats")
+        self.freqs = []
+        self.index = {}
+        # accumulated, baseline, previous update and current readings
+        self.acc = array("Q")
+        self.base = array("Q")
+        self.last = array("Q")
+        self.cur = array("Q")
+        self.trans_acc = 0
+        self.trans_base = 0
+        self.trans_last = 0
+        self.trans_cur = 0
+        self.table_base = None
+        self.table_cur = None
+
+    def grow(self, freq):
+        self.index[freq] = len(self.freqs)
+        self.freqs.append(freq)
+        for arr in (self.acc, self.base, self.last, self.cur):
+            arr.append(0)
+
+    def parse_times(self, text):
+        cur = self.cur
+        for line in text.splitlines():
+            fields = line.split()
+            if len(fields) != 2:
+                continue
+            freq = int(fields[0])
+            i = self.index.get(freq)
+            if i is None:
+                self.grow(freq)
+                i = self.index[freq]
+            cur[i] = int(fields[1])
+
+    def parse_table(self, text):
+        """
+        Parse trans_table into a dict (from, to) -> transitions
+        """
+        table = {}
+        lines = text.splitlines()
+        header = None
+        for line in lines:
+            left, sep, right = line.partition(":")
+            if not sep:
+                continue
+            left = left.strip()
+            if not left:
+                header = [int(f) for f in right.split()]
+            elif left.isdigit() and header:
+                for to, n in zip(header, right.split()):
+                    n = int(n)
+                    if n:
+                        table[(int(left), to)] = n
+        return table
+
+
+class ResidencyTracker:
+    """
+    Track the time each cpu spends at each frequency and the number of
+    transitions, as deltas from a baseline. Counters are read once per
+    cpufreq policy, so tracking costs a few reads per policy per update.
+        Attributes
+            cpus
+        Methods
+            start()
+            update()
+            stop()
+            residency()
+            fractions()
+            mean_frequency()
+            transitions()
+            trans_table()
+            aggregate()
+    """
+
+    def __init__(self, rg=None, cpu=None, trans_table=False):
+        """
+        rg: list of range of cores, default all online cpus
+        cpu: cpuFreq instance, default the shared instance
+        trans_table: also track the transitions between each pair of
+            frequencies (the kernel only provides it on small tables)
+        """
+        self.__cpu = cpu if cpu is not None else cpuFreq()
+        self.__trans_table = trans_table
+        self.__hz = user_hz()
+        self.cpus = self.__cpu.select_cpus(rg)
+        topology = self.__cpu.get_topology()
+        groups = {}
+        for c in self.cpus:
+            policy = topology.policy_of(c)
+            key = ("cpu", c) if policy is None else ("policy", policy)
+            groups.setdefault(key, []).append(c)
+        self.__policies = [_PolicyCounters(members[0], members)
+                           for members in groups.values()]
+        self.__by_cpu = {}
+        for pc in self.__policies:
+            for c in pc.cpus:
+                self.__by_cpu[c] = pc
+        self.__started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # private
+    def __read(self, pc):
+        backend = self.__cpu.backend
+        try:
+            pc.parse_times(backend.read(path.join(pc.stats,
+                                                  "time_in_state")))
+            pc.trans_cur = int(backend.read(path.join(pc.stats,
+                                                      "total_trans")))
+        except (IOError, OSError) as e:
+            raise CPUFreqBaseError("ERROR: cpufreq stats not available for "
+                                   "cpu {}: {}".format(pc.leader, e))
+        if self.__trans_table:
+            try:
+                pc.table_cur = pc.parse_table(backend.read(path.join(
+                    pc.stats, "trans_table")))
+            except (IOError, OSError):
+                pc.table_cur = None
+
+    def __cpus(self, rg):
+        if rg is None:
+            return self.cpus
+        return [c for c in self.__cpu.select_cpus(rg) if c in self.__by_cpu]
+
+    # interfaces
+    def start(self):
+        """
+        Take the baseline
+        """
+        for pc in self.__policies:
+            self.__read(pc)
+            for i in range(len(pc.freqs)):
+                pc.acc[i] = 0
+                pc.base[i] = pc.last[i] = pc.cur[i]
+            pc.trans_acc = 0
+            pc.trans_base = pc.trans_last = pc.trans_cur
+            pc.table_base = pc.table_cur
+        self.__started = True
+
+    def update(self):
+        """
+        Read the counters again
+
+        return: dict cpu -> dict frequency -> seconds since the previous
+            update (or the baseline)
+        """
+        if not self.__started:
+            raise CPUFreqBaseError("ERROR: ResidencyTracker not started")
+        data = {}
+        for pc in self.__policies:
+            self.__read(pc)
+            # counters going back means the stats were reset (policy
+            # recreated on hotplug), keep what was accounted so far
+            if any(pc.cur[i] < pc.last[i] for i in range(len(pc.freqs))) \
+               or pc.trans_cur < pc.trans_last:
+                for i in range(len(pc.freqs)):
+                    pc.acc[i] += pc.last[i] - pc.base[i]
+                    pc.base[i] = pc.last[i] = 0
+                pc.trans_acc += pc.trans_last - pc.trans_base
+                pc.trans_base = pc.trans_last = 0
+                pc.table_base = None
+            delta = {}
+            for i, f in enumerate(pc.freqs):
+                delta[f] = (pc.cur[i] - pc.last[i])/self.__hz
+                pc.last[i] = pc.cur[i]
+            pc.trans_last = pc.trans_cur
+            for c in pc.cpus:
+                data[c] = dict(delta)
+        return data
+
+    def stop(self):
+        """
+        Read the counters a last time
+        """
+        if self.__started:
+            self.update()
+
+    def residency(self, rg=None):
+        """
+        Get the time spent at each frequency since the baseline, up to the
+        last update
+
+        rg: list of range of cores, default all tracked cpus
+        return: dict cpu -> dict frequency -> seconds
+        """
+        data = {}
+        for c in self.__cpus(rg):
+            pc = self.__by_cpu[c]
+            data[c] = {f: (pc.acc[i] + pc.last[i] - pc.base[i])/self.__hz
+                       for i, f in enumerate(pc.freqs)}
+        return data
+
+    def fractions(self, rg=None):
+        """
+        Get the fraction of time spent at each frequency
+
+        rg: list of range of cores, default all tracked cpus
+        return: dict cpu -> dict frequency -> fraction
+        """
+        data = {}
+        for c, res in self.residency(rg).items():
+            total = sum(res.values())
+            data[c] = {f: (t/total if total else 0.0) for f, t in res.items()}
+        return data
+
+    def mean_frequency(self, rg=None):
+        """
+        Get the time weighted mean frequency
+
+        rg: list of range of cores, default all tracked cpus
+        return: dict cpu -> frequency in KHz
+        """
+        data = {}
+        for c, res in self.residency(rg).items():
+            total = sum(res.values())
+            data[c] = (sum(f*t for f, t in res.items())/total
+                       if total else 0.0)
+        return data
+
+    def transitions(self, rg=None):
+        """
+        Get the number of frequency transitions since the baseline
+
+        rg: list of range of cores, default all tracked cpus
+        return: dict cpu -> transitions
+        """
+        data = {}
+        for c in self.__cpus(rg):
+            pc = self.__by_cpu[c]
+            data[c] = pc.trans_acc + pc.trans_last - pc.trans_base
+        return data
+
+    def trans_table(self, rg=None):
+        """
+        Get the transitions between each pair of frequencies since the
+        baseline, needs trans_table=True
+
+        rg: list of range of cores, default all tracked cpus
+        return: dict cpu -> dict (from, to) -> transitions, None if the
+            kernel does not provide the table
+        """
+        data = {}
+        for c in self.__cpus(rg):
+            pc = self.__by_cpu[c]
+            if pc.table_cur is None:
+                data[c] = None
+                continue
+            base = pc.table_base or {}
+            data[c] = {k: n - base.get(k, 0)
+                       for k, n in pc.table_cur.items()
+                       if n - base.get(k, 0)}
+        return data
+
+    def aggregate(self, rg=None):
+        """
+        Get the time spent at each frequency summed over a set of cpus
+
+        rg: list of range of cores, default all tracked cpus
+        return: dict frequency -> cpu seconds
+        """
+        data = {}
+        for res in self.residency(rg).values():
+            for f, t in res.items():
+                data[f] = data.get(f, 0.0) + t
+        return data
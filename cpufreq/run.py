@@ -6,7 +6,12 @@
 """
 
 import argparse
-from cpufreq import cpuFreq,CPUFreqErrorInit
+import sys
+import time
+from cpufreq import cpuFreq,CPUFreqErrorInit,CPUFreqBaseError
+from cpufreq.cpuset import CpuSet
+# the modules of the subcommands and of the daemon are imported when used,
+# import cpufreq loads this module and must stay fast
 
 
 def argsparselist(txt):
@@ -33,13 +38,62 @@ def argsparseintlist(txt):
     listarg = [int(i) for i in txt]
     return listarg
 
-def argsparsevalidation(avail_govs):
+def argsparsecpus(txt):
+    """
+    Validate a list of cpus.
+
+    :param txt: cpu list with ranges (0-63,128-191) or hex cpumask (0xff).
+    :return: CpuSet of the cpus.
+    """
+
+    try:
+        return CpuSet.parse(txt)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+def argsparsegroups(txt):
+    """
+    Validate a list of cpu groups.
+
+    :param txt: groups separated by ";", each a cpu list with ranges or a
+        selector. Ex: 0-3;4-7 or package:0;package:1
+    :return: list of cpu lists or selector strings.
+    """
+
+    groups = []
+    for group in txt.split(";"):
+        group = group.strip()
+        if group and all(ch.isdigit() or ch in ",-" for ch in group):
+            groups.append(argsparsecpus(group))
+        else:
+            groups.append(group)
+    return groups
+
+def argsparseaddress(txt):
+    """
+    Validate a listen address.
+
+    :param txt: [host:]port. Ex: 9880, :9880 or 127.0.0.1:9880
+    :return: (host, port) tuple.
+    """
+
+    host, _, port = txt.rpartition(":")
+    try:
+        return host.strip("[]"), int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid address {!r}".format(txt))
+
+def argsparsevalidation(avail_govs=None):
     """
     Validation of script arguments passed via console.
 
+    :param avail_govs: governors accepted by setgovernor, None to check them
+        after parsing.
     :return: argparse object with validated arguments.
     """
 
+    from cpufreq.daemon import DEFAULT_SOCKET
+
     parser = argparse.ArgumentParser(description="Script to get and set "
                                                  "frequencies configurations"
                                                  "of cpus by command line")
@@ -48,6 +102,8 @@ def argsparsevalidation(avail_govs):
                                    help="Print status of governors and frequencies")
     p_group.add_argument("--reset", action="store_true",
                                     help="Reset the governors and max and min frequencies")
+    parser.add_argument("--stats", action="store_true",
+                        help="Print call counts and latencies of the sysfs accesses")
     subparsers = parser.add_subparsers(help="Available commands")
 
     parse_setgovernor = subparsers.add_parser("setgovernor", help="Set the governor for all online cpus or "
@@ -57,9 +113,9 @@ def argsparsevalidation(avail_govs):
     p_setgovernor_group = parse_setgovernor.add_mutually_exclusive_group()
     p_setgovernor_group.add_argument("--all", action="store_true",
                                               help="Set the governor for all online cpus.")
-    p_setgovernor_group.add_argument("--cpus", type=argsparseintlist,
+    p_setgovernor_group.add_argument("--cpus", type=argsparsecpus,
                                                help="List of CPUs numbers (first=0) to set gorvernor "
-                                                    "Ex: 0,1,3,5")
+                                                    "Ex: 0-3,8")
 
     parse_setfrequency = subparsers.add_parser("setfrequency", help="Set the frequency for all online cpus or "
                                         "with optional specific cpus. Ex: cpufreq setfrequency 2100000")
@@ -67,13 +123,329 @@ def argsparsevalidation(avail_govs):
     p_setfrequency_group = parse_setfrequency.add_mutually_exclusive_group()
     p_setfrequency_group.add_argument("--all", action="store_true",
                                             help="Set the frequency for all online cpus.")
-    p_setfrequency_group.add_argument("--cpus", type=argsparseintlist,
+    p_setfrequency_group.add_argument("--cpus", type=argsparsecpus,
                                                help="List of CPUs numbers (first=0) to set frequency "
-                                                    "Ex: 0,1,3,5")
+                                                    "Ex: 0-3,8")
+
+    parse_daemon = subparsers.add_parser("daemon", help="Keep cpufreq running and serve "
+                                        "requests on a Unix socket, later commands are forwarded to it. "
+                                        "Set CPUFREQ_SOCKET to change the socket or to an empty value to "
+                                        "bypass the daemon.")
+    parse_daemon.add_argument("--socket", default=DEFAULT_SOCKET,
+                                          help="Socket path. Default: {}".format(DEFAULT_SOCKET))
+
+    parse_control = subparsers.add_parser("control", help="Run a userspace governor from the cpu "
+                                        "utilization until interrupted. Ex: cpufreq control target --target 0.6")
+    parse_control.add_argument("policy", choices=sorted(POLICIES),
+                                         help="ondemand: highest frequency above the threshold; "
+                                              "target: PI control of the utilization; "
+                                              "budget: lowest frequency finishing the work within the budget")
+    parse_control.add_argument("--period", type=float, default=0.1,
+                                           help="Control period in seconds. Default: 0.1")
+    parse_control.add_argument("--target", type=float,
+                                           help="Threshold (ondemand), utilization (target) or "
+                                                "fraction of the period (budget)")
+    parse_control.add_argument("--pid", type=int,
+                                        help="Also follow the utilization of this process")
+    parse_control.add_argument("--cpus", type=argsparsecpus,
+                                         help="List of CPUs numbers (first=0) to control Ex: 0-3,8")
+    parse_control.add_argument("--duration", type=float,
+                                             help="Seconds to run. Default: until interrupted")
+
+    parse_sweep = subparsers.add_parser("sweep", help="Run a command at each frequency and/or governor "
+                                        "and report wall time, achieved frequency and energy. "
+                                        "Ex: cpufreq sweep --cpus 2,3 -- ./bench --quick")
+    parse_sweep.add_argument("--frequencies", type=argsparseintlist,
+                                              help="Frequencies to sweep. Default: all available "
+                                                   "frequencies without --governors")
+    parse_sweep.add_argument("--governors", type=argsparselist,
+                                            help="Governors to sweep Ex: ondemand,performance")
+    p_sweep_group = parse_sweep.add_mutually_exclusive_group()
+    p_sweep_group.add_argument("--cpus", type=argsparsecpus,
+                                         help="List of CPUs numbers (first=0) the command is pinned to "
+                                              "Ex: 0-3,8")
+    p_sweep_group.add_argument("--groups", type=argsparsegroups,
+                                           help="Independent groups of cpus sweeping in parallel "
+                                                "Ex: \"0-3;4-7\" or \"package:0;package:1\"")
+    parse_sweep.add_argument("--warmup", type=int, default=1,
+                                         help="Unmeasured runs after each change. Default: 1")
+    parse_sweep.add_argument("--repetitions", type=int, default=3,
+                                              help="Measured runs of each setting. Default: 3")
+    parse_sweep.add_argument("--settle", type=float, default=1.0,
+                                         help="Maximum seconds waited for the frequency to "
+                                              "settle. Default: 1.0")
+    parse_sweep.add_argument("--output",
+                             help="Write the results to a .json or .csv file, \"-\" for CSV "
+                                  "on stdout")
+    parse_latency = subparsers.add_parser("latency", help="Measure the time to reach a frequency after "
+                                        "writing it. Ex: cpufreq latency --from 1000000 --to 3000000")
+    parse_latency.add_argument("--from", dest="from_f", type=argsparseintlist,
+                                         help="Starting frequencies. Default: all available")
+    parse_latency.add_argument("--to", dest="to_f", type=argsparseintlist,
+                                       help="Target frequencies. Default: all available")
+    parse_latency.add_argument("--cpus", type=argsparsecpus,
+                                         help="List of CPUs numbers (first=0), one per policy is "
+                                              "measured Ex: 0,4-7")
+    parse_latency.add_argument("--repetitions", type=int, default=10,
+                                                help="Measures of each pair. Default: 10")
+    parse_latency.add_argument("--timeout", type=float, default=0.05,
+                                            help="Seconds to wait for a frequency. Default: 0.05")
+    parse_latency.add_argument("--msr", action="store_true", default=None,
+                                        help="Read APERF/MPERF from /dev/cpu/N/msr. Default: when "
+                                             "available")
+
+    parse_apply = subparsers.add_parser("apply", help="Validate then apply the operations of a file "
+                                        "(JSON or one \"governor|frequency|max|min VALUE [CPUS]\" or "
+                                        "\"enable|disable CPUS\" per line) as one batch. "
+                                        "Ex: cpufreq apply --dry-run setup.txt")
+    parse_apply.add_argument("file", help="File of operations, \"-\" for stdin")
+    parse_apply.add_argument("--dry-run", action="store_true",
+                                          help="Print the writes without performing them")
+
+    parse_export = subparsers.add_parser("export", help="Export the frequencies, limits, governors "
+                                        "and time in state as Prometheus metrics. "
+                                        "Ex: cpufreq export --listen :9880")
+    p_export_group = parse_export.add_mutually_exclusive_group(required=True)
+    p_export_group.add_argument("--listen", type=argsparseaddress,
+                                            help="Serve /metrics over HTTP on [host:]port")
+    p_export_group.add_argument("--textfile",
+                                help="Write the metrics to this file for the node_exporter "
+                                     "textfile collector")
+    parse_export.add_argument("--interval", type=float, default=15.0,
+                                            help="Seconds between textfile writes, 0 to write once. "
+                                                 "Default: 15")
+    parse_export.add_argument("--ttl", type=float, default=1.0,
+                                       help="Seconds scrapes reuse the last sysfs sweep. Default: 1")
+
+    parse_publish = subparsers.add_parser("publish", help="Sample the cpus and publish their state in "
+                                        "shared memory for cpuFreq.attach_shared() readers. "
+                                        "Ex: cpufreq publish --interval 0.05")
+    parse_publish.add_argument("--path", default=None,
+                                         help="File backing the segment. Default: /dev/shm/cpufreq, "
+                                              "or cpufreq.shm in the temporary directory")
+    parse_publish.add_argument("--interval", dest="publish_interval", type=float, default=0.1,
+                                             help="Seconds between samples. Default: 0.1")
+
+    parse_sweep.add_argument("command", nargs=argparse.REMAINDER,
+                                        help="Command to run, after --")
 
     args = parser.parse_args()
     return args
 
+def print_errors(res):
+    """
+    Print the failed cpus of a setter result.
+
+    :param res: dict cpu -> None or error returned by the setters.
+    :return: True if some cpu failed.
+    """
+
+    failed = False
+    for cpu in sorted(res):
+        if res[cpu] is not None:
+            print("CPU {}: {}".format(cpu, res[cpu]))
+            failed = True
+    return failed
+
+def print_stats(stats):
+    """
+    Print the summary returned by cpuFreq.stats().
+
+    :param stats: dict with methods, attributes and cpus counters.
+    """
+
+    print("{:^28} - {:^7} - {:^7} - {:^10} - {:^10}".format(
+        "Operation", "Count", "Errors", "Mean (us)", "Max (us)"))
+    for group in ("methods", "attributes"):
+        for name in sorted(stats.get(group, {})):
+            st = stats[group][name]
+            print("{:>28} - {:7d} - {:7d} - {:10.1f} - {:10.1f}".format(
+                name, st["count"], st["errors"], st["mean"]*1e6, st["max"]*1e6))
+    cpus = stats.get("cpus", {})
+    if cpus:
+        print("{:^4} - {:^7} - {:^7} - {:^10}".format("CPU", "Reads", "Writes", "Time (us)"))
+    for cpu in sorted(cpus):
+        ops = cpus[cpu]
+        total = sum(st["total"] for st in ops.values())
+        print("{:4d} - {:7d} - {:7d} - {:10.1f}".format(
+            cpu, ops.get("read", {}).get("count", 0),
+            ops.get("write", {}).get("count", 0), total*1e6))
+
+# policy name -> class of cpufreq.controller
+POLICIES = {"ondemand": "OndemandPolicy",
+            "target": "TargetUtilizationPolicy",
+            "budget": "BudgetPolicy"}
+
+def connect():
+    """
+    Connect to the running daemon.
+
+    :return: DaemonClient, or None when no daemon answers.
+    """
+
+    from cpufreq.daemon import connect as connect_daemon
+    return connect_daemon()
+
+def control(c, args):
+    """
+    Run the controller of the control command and print its overhead.
+
+    :param c: cpuFreq instance.
+    :param args: parsed arguments of the control command.
+    """
+
+    from cpufreq import controller as module
+    from cpufreq.controller import Controller
+
+    policy_class = getattr(module, POLICIES[args.policy])
+    policy = policy_class() if args.target is None else policy_class(args.target)
+    controller = Controller(policy, rg=args.cpus, period=args.period, cpu=c, pid=args.pid)
+    controller.start()
+    try:
+        if args.duration is None:
+            while True:
+                time.sleep(3600)
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        controller.close()
+    st = controller.overhead()
+    print("Ticks: {}, frequency changes: {}, overruns: {}".format(
+        controller.ticks, controller.writes, controller.overruns))
+    print("Tick overhead (us): mean {:.1f}, max {:.1f}, over budget {}".format(
+        st["mean"]*1e6, st["max"]*1e6, st["errors"]))
+
+def sweep(c, args):
+    """
+    Run the sweep command and print the summary and best settings.
+
+    :param c: cpuFreq instance.
+    :param args: parsed arguments of the sweep command.
+    """
+
+    from cpufreq.sweep import Sweep
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        print("ERROR: a command to run is required.")
+        exit(1)
+    s = Sweep(command, frequencies=args.frequencies, governors=args.governors,
+              rg=args.cpus, groups=args.groups, warmup=args.warmup,
+              repetitions=args.repetitions, settle=args.settle, cpu=c)
+    results = s.run()
+    if args.output == "-":
+        s.write_csv(sys.stdout)
+        return
+    if args.output:
+        with open(args.output, "w") as f:
+            if args.output.endswith(".json"):
+                s.write_json(f)
+            else:
+                s.write_csv(f)
+    print("{:^12} - {:^10} - {:^10} - {:^10} - {:^10}".format(
+        "Governor", "Frequency", "Wall (s)", "Achieved", "Joules"))
+    for r in results:
+        print("{:>12} - {:>10} - {:10.4f} - {:>10} - {:>10}".format(
+            r.governor, r.frequency or "", r.wall,
+            "" if r.achieved is None else "{:.0f}".format(r.achieved),
+            "" if r.joules is None else "{:.3f}".format(r.joules)))
+    for metric, r in sorted(s.best().items()):
+        print("Best {}: {} {}".format(metric, r.governor, r.frequency or ""))
+
+def latency(c, args):
+    """
+    Run the latency command and print the distributions in microseconds.
+
+    :param c: cpuFreq instance.
+    :param args: parsed arguments of the latency command.
+    """
+
+    res = c.measure_transition_latency(args.from_f, args.to_f, args.cpus,
+                                       args.repetitions, args.timeout, args.msr)
+    print("Source: {}".format(res.source))
+    print("{:>9} -> {:<9} - {:^5} - {:^8} - {:^8} - {:^8} - {:^8} - {:^8} - {:^8}".format(
+        "From", "To", "Count", "Timeouts", "Min", "p50", "p90", "Max", "Write"))
+    for (from_f, to_f), st in sorted(res.summary().items()):
+        if not st["count"]:
+            print("{:>9} -> {:<9} - {:5d} - {:8d}".format(from_f, to_f, 0, st["timeouts"]))
+            continue
+        print("{:>9} -> {:<9} - {:5d} - {:8d} - {:8.1f} - {:8.1f} - {:8.1f} - {:8.1f} - {:8.1f}".format(
+            from_f, to_f, st["count"], st["timeouts"], st["min"]*1e6, st["p50"]*1e6,
+            st["p90"]*1e6, st["max"]*1e6, st["write"]*1e6))
+
+def apply(c, args):
+    """
+    Run the apply command and print the writes performed.
+
+    :param c: cpuFreq instance.
+    :param args: parsed arguments of the apply command.
+    :return: True if some cpu failed.
+    """
+
+    from cpufreq.batch import Batch
+
+    if args.file == "-":
+        batch = Batch.load(c, sys.stdin)
+    else:
+        with open(args.file) as f:
+            batch = Batch.load(c, f)
+    res = batch.apply(dry_run=args.dry_run)
+    for w in res["writes"]:
+        print("{}{} = {} on cpus {}".format("Would write " if args.dry_run else "",
+                                            w.attr, w.value, w.cpus))
+    failed = print_errors(res["errors"])
+    print("{} operations, {} writes{}{}.".format(
+        len(batch.ops), len(res["writes"]), " planned" if args.dry_run else "",
+        ", {} cpus failed".format(len(res["errors"])) if failed else ""))
+    return failed
+
+def export(c, args):
+    """
+    Run the export command until interrupted.
+
+    :param c: cpuFreq instance.
+    :param args: parsed arguments of the export command.
+    """
+
+    from cpufreq.exporter import MetricsCollector, MetricsServer, write_textfile
+
+    collector = MetricsCollector(c, ttl=args.ttl)
+    try:
+        if args.listen is not None:
+            server = MetricsServer(collector, args.listen)
+            try:
+                server.serve_forever()
+            finally:
+                server.server_close()
+            return
+        while True:
+            write_textfile(collector, args.textfile)
+            if args.interval <= 0:
+                return
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+def publish(c, args):
+    """
+    Run the publish command until interrupted.
+
+    :param c: cpuFreq instance.
+    :param args: parsed arguments of the publish command.
+    """
+
+    from cpufreq.shared import SharedPublisher, SHARED_PATH
+
+    path = args.path if args.path is not None else SHARED_PATH
+    with SharedPublisher(c, path, args.publish_interval) as publisher:
+        publisher.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
 def set_governors(c,governor, cpus=None):
     try:
         c = cpuFreq()
@@ -86,59 +458,119 @@ def info(c):
     print("Informations about the System:")
     print("Driver: {}".format(c.driver))
     print("Available Governors: {}".format(", ".join(c.available_governors)))
-    print("Available Frequencies: {}".format(", ".join(str(i) for i in c.available_frequencies)))
+    if c.available_frequencies:
+        print("Available Frequencies: {}".format(", ".join(str(i) for i in c.available_frequencies)))
+    else:
+        caps = c.get_capabilities()
+        print("Frequency Range: {} - {}".format(caps.min_freq, caps.max_freq))
     print("Status of CPUs:")
-    govs = c.get_governors()
-    freqs = c.get_frequencies()
-    minfreq = c.get_min_freq()
-    maxfreq = c.get_max_freq()
+    states = c.snapshot()
     print("{:^4} - {:^12} - {:^10} - {:^9} - {:^9}".format("CPU","Governor","Frequencie", "Min Freq.", "Max Freq."))
-    for c in govs.keys():
-        print("{:4d} - {:>12} - {:10d} - {:9d} - {:9d}".format(c,govs[c],freqs[c],minfreq[c],maxfreq[c]))
+    for c, st in states.items():
+        print("{:4d} - {:>12} - {:10d} - {:9d} - {:9d}".format(c,st.governor,st.frequency,st.min_freq,st.max_freq))
 
 def main():
     """
     Main function executed from console run.
     """    
+    from cpufreq.daemon import DaemonClient, serve
+
+    # parsed before touching sysfs, so --help and usage errors are instant
+    args = argsparsevalidation()
+    c = connect()
+    if c is None:
+        try:
+            c = cpuFreq()
+        except CPUFreqErrorInit as err:
+            print("{}".format(err))    
+            exit()
+
+    if hasattr(args, "governor") and args.governor not in c.available_governors:
+        print("ERROR: governor should be one of: {}".format(", ".join(c.available_governors)))
+        exit(1)
+    if hasattr(args, "socket"):
+        if isinstance(c, DaemonClient):
+            print("ERROR: a daemon is already running on {}.".format(c.path))
+            exit(1)
+        try:
+            serve(cpuFreq(persistent_fds=True), args.socket)
+        except CPUFreqBaseError as err:
+            print("{}".format(err))
+            exit(1)
+        return
+    if hasattr(args, "policy") or hasattr(args, "command") or hasattr(args, "from_f") or \
+       hasattr(args, "dry_run") or hasattr(args, "listen") or hasattr(args, "publish_interval"):
+        if isinstance(c, DaemonClient):
+            c.close()
+            c = cpuFreq()
+        try:
+            if hasattr(args, "policy"):
+                control(c, args)
+            elif hasattr(args, "from_f"):
+                latency(c, args)
+            elif hasattr(args, "dry_run"):
+                if apply(c, args):
+                    exit(1)
+            elif hasattr(args, "listen"):
+                export(c, args)
+            elif hasattr(args, "publish_interval"):
+                publish(c, args)
+            else:
+                sweep(c, args)
+        except (CPUFreqBaseError, IOError) as err:
+            print("{}".format(err))
+            exit(1)
+        return
+    # a daemon serves other clients too, stats enabled here are disabled
+    # once reported so they do not keep paying for them
+    own_stats = args.stats and not c.stats()
+    if args.stats:
+        c.enable_stats()
     try:
-        c = cpuFreq()
-    except CPUFreqErrorInit as err:
-        print("{}".format(err))    
-        exit()
-
-    args = argsparsevalidation(c.available_governors)
-
-    if args.info is True:
-        info(c)
-    elif args.reset is True:
-        c.reset()
-        print("Governors, maximum and minimum frequencies reset successfully.")
-    elif hasattr(args, "governor"):
-        if args.all == True:
-            rg = None
-        else:
-            avail_cpus = c.get_online_cpus() 
-            if not set(args.cpus).issubset(set(avail_cpus)):
-                print("ERROR: cpu list has cpu number(s) that not in online cpus list.")
+        if args.info is True:
+            info(c)
+        elif args.reset is True:
+            try:
+                c.reset()
+            except CPUFreqBaseError as err:
+                print("{}".format(err))
                 exit(1)
-            rg = args.cpus
-        c.set_governors(gov=args.governor,rg=rg)
-        print("Governor set successfully to cpus.")
-    elif hasattr(args, "frequency"):
-        if not args.frequency in c.available_frequencies:
-            print("ERROR: frequency should be a value in list availabe frequencies: ")
-            print("   ",c.available_frequencies)
-            exit(1)
-        if args.all == True:
-            rg = None
-        else:
-            avail_cpus = c.get_online_cpus() 
-            if not set(args.cpus).issubset(set(avail_cpus)):
-                print("ERROR: cpu list has cpu number(s) that not in online cpus list.")
+            print("Governors, maximum and minimum frequencies reset successfully.")
+        elif hasattr(args, "governor"):
+            if args.all == True:
+                rg = None
+            else:
+                avail_cpus = c.get_online_cpus() 
+                if not set(args.cpus).issubset(set(avail_cpus)):
+                    print("ERROR: cpu list has cpu number(s) that not in online cpus list.")
+                    exit(1)
+                rg = args.cpus
+            res = c.set_governors(gov=args.governor,rg=rg)
+            if print_errors(res):
+                exit(1)
+            print("Governor set successfully to cpus.")
+        elif hasattr(args, "frequency"):
+            if c.available_frequencies and not args.frequency in c.available_frequencies:
+                print("ERROR: frequency should be a value in list availabe frequencies: ")
+                print("   ",c.available_frequencies)
+                exit(1)
+            if args.all == True:
+                rg = None
+            else:
+                avail_cpus = c.get_online_cpus() 
+                if not set(args.cpus).issubset(set(avail_cpus)):
+                    print("ERROR: cpu list has cpu number(s) that not in online cpus list.")
+                    exit(1)
+                rg = args.cpus
+            res = c.set_frequencies(freq=args.frequency,rg=rg)
+            if print_errors(res):
                 exit(1)
-            rg = args.cpus
-        c.set_frequencies(freq=args.frequency,rg=rg)
-        print("Frequency set successfully to cpus.")
+            print("Frequency set successfully to cpus.")
+        if args.stats:
+            print_stats(c.stats())
+    finally:
+        if own_stats:
+            c.disable_stats()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with FrequencySampler class that samples the cpus frequencies
+    at a fixed rate.
+"""
+from array import array
+import math
+from os import path
+import threading
+import time
+
+from .cpufreq import cpuFreq, CPUFreqBaseError
+
+
+def percentile(values, p):
+    """
+    Nearest rank percentile: the smallest of the sorted values with at
+    least p percent of values at or below it
+
+    values: sorted list, not empty
+    p: percentile between 0 and 100
+    """
+    rank = math.ceil(p/100*len(values)) - 1
+    return values[max(0, min(len(values)-1, rank))]
+
+
+class FrequencySampler:
+    """
+    Sample cpufreq attributes of a set of cpus at a fixed rate on a
+    background thread, storing them in a preallocated ring buffer
+        Attributes
+            cpus
+            attrs
+            rate
+            capacity
+            missed
+            error
+        Methods
+            start()
+            stop()
+            samples()
+            timestamps()
+            values()
+            mean()
+            percentiles()
+            residency()
+    """
+
+    def __init__(self, rate=1000, rg=None, attrs=("scaling_cur_freq",),
+                 capacity=60000, cpu=None):
+        """
+        rate: samples per second
+        rg: list of range of cores, default all online cpus
+        attrs: cpufreq attributes to sample, values must be integers
+        capacity: number of samples kept in the ring buffer
+        cpu: cpuFreq instance whose backend is sampled, default the
+            shared instance
+        """
+        if rate <= 0 or capacity <= 0:
+            raise CPUFreqBaseError("ERROR: rate and capacity should be "
+                                   "positive values")
+        self.__cpu = cpu if cpu is not None else cpuFreq()
+        self.cpus = self.__cpu.select_cpus(rg)
+        self.attrs = list(attrs)
+        self.rate = rate
+        self.capacity = capacity
+        self.missed = 0
+        # CPUFreqBaseError that stopped the sampling thread
+        self.error = None
+        self.__width = len(self.cpus)*len(self.attrs)
+        self.__times = array("d", [0.0])*capacity
+        self.__values = array("q", [0])*(capacity*self.__width)
+        self.__count = 0
+        self.__files = []
+        self.__lock = threading.Lock()
+        self.__cond = threading.Condition(self.__lock)
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # private
+    def __open(self):
+        backend = self.__cpu.backend
+        for attr in self.attrs:
+            for cpu in self.cpus:
+                fpath = path.join("cpu%i" % cpu, "cpufreq", attr)
+                self.__files.append(backend.open(fpath))
+
+    def __close(self):
+        for f in self.__files:
+            f.close()
+        self.__files = []
+
+    def __sample(self, now):
+        # read before taking the lock, readers only wait for the copy
+        data = [int(f.read()) for f in self.__files]
+        with self.__lock:
+            slot = self.__count % self.capacity
+            base = slot*self.__width
+            self.__times[slot] = now
+            self.__values[base:base+self.__width] = array("q", data)
+            self.__count += 1
+            self.__cond.notify_all()
+
+    def __run(self):
+        period = 1.0/self.rate
+        clock = time.monotonic
+        start = clock()
+        tick = 0
+        while not self.__stop.is_set():
+            deadline = start + tick*period
+            now = clock()
+            if now < deadline:
+                time.sleep(deadline - now)
+                now = clock()
+            try:
+                self.__sample(now)
+            except (IOError, OSError, ValueError) as e:
+                # kept for the readers, blocked ones are woken to raise it
+                with self.__cond:
+                    self.error = CPUFreqBaseError("ERROR: Sampling "
+                                                  "failed: {}".format(e))
+                    self.__stop.set()
+                    self.__cond.notify_all()
+                return
+            # schedule against the start time so the sleep jitter does not
+            # accumulate, ticks already missed are skipped and counted
+            late = int((clock() - start)/period)
+            if late > tick + 1:
+                self.missed += late - tick - 1
+                tick = late
+            else:
+                tick += 1
+
+    def __column(self, attr, idx):
+        offset = self.attrs.index(attr)*len(self.cpus) + idx
+        col = []
+        # under the lock so a sample is never copied half written
+        with self.__lock:
+            n = min(self.__count, self.capacity)
+            for k in range(self.__count - n, self.__count):
+                slot = k % self.capacity
+                col.append(self.__values[slot*self.__width + offset])
+        return col
+
+    # interfaces
+    def start(self):
+        """
+        Start sampling on a background thread
+        """
+        if self.__thread is not None:
+            return
+        self.__open()
+        self.error = None
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="FrequencySampler",
+                                         daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and close the sysfs attributes
+        """
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+        self.__close()
+        with self.__cond:
+            self.__cond.notify_all()
+
+    def samples(self, block=True):
+        """
+        Iterate over the samples as (timestamp, values) tuples, values
+        ordered by attrs then cpus. Samples overwritten before being
+        consumed are skipped. The error that stopped the sampling is
+        raised once the samples taken before it are consumed.
+
+        block: wait for new samples while the sampler is running
+        """
+        pos = None
+        while True:
+            with self.__cond:
+                if pos is None:
+                    pos = max(0, self.__count - self.capacity)
+                while (block and pos >= self.__count
+                       and self.__thread is not None
+                       and not self.__stop.is_set()):
+                    self.__cond.wait(1.0)
+                if pos >= self.__count:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                pos = max(pos, self.__count - self.capacity)
+                slot = pos % self.capacity
+                base = slot*self.__width
+                item = (self.__times[slot],
+                        tuple(self.__values[base:base+self.__width]))
+            pos += 1
+            yield item
+
+    def __iter__(self):
+        return self.samples()
+
+    def timestamps(self):
+        """
+        Get the timestamps of the samples in the buffer, oldest first
+        """
+        with self.__lock:
+            n = min(self.__count, self.capacity)
+            return [self.__times[k % self.capacity]
+                    for k in range(self.__count - n, self.__count)]
+
+    def values(self, attr="scaling_cur_freq"):
+        """
+        Get the samples in the buffer
+
+        attr: sampled attribute
+        return: dict cpu -> list of values, oldest first
+        """
+        return {cpu: self.__column(attr, i)
+                for i, cpu in enumerate(self.cpus)}
+
+    def mean(self, attr="scaling_cur_freq"):
+        """
+        Get the mean value by cpu
+
+        attr: sampled attribute
+        """
+        data = {}
+        for cpu, col in self.values(attr).items():
+            data[cpu] = sum(col)/len(col) if col else 0.0
+        return data
+
+    def percentiles(self, ps=(50, 90, 99), attr="scaling_cur_freq"):
+        """
+        Get percentiles (nearest rank) by cpu
+
+        ps: percentiles to compute, between 0 and 100
+        attr: sampled attribute
+        return: dict cpu -> dict percentile -> value
+        """
+        data = {}
+        for cpu, col in self.values(attr).items():
+            col.sort()
+            data[cpu] = {}
+            for p in ps:
+                data[cpu][p] = percentile(col, p) if col else 0
+        return data
+
+    def residency(self, attr="scaling_cur_freq"):
+        """
+        Get the fraction of samples spent at each value by cpu
+
+        attr: sampled attribute
+        return: dict cpu -> dict value -> fraction
+        """
+        data = {}
+        for cpu, col in self.values(attr).items():
+            hist = {}
+            for v in col:
+                hist[v] = hist.get(v, 0) + 1
+            data[cpu] = {v: c/len(col) for v, c in sorted(hist.items())}
+        return data
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with the shared memory state segment: SharedPublisher samples
+    the cpus and writes them into a memory mapped file, SharedState maps
+    it in other processes and reads consistent states without any
+    syscall.
+
+    Layout, little endian:
+        header   magic "CPUFREQ1", seq u64, stamp f64, slots u32, count u32
+        governors 16 names of 16 bytes, NUL padded
+        records  slots x (cpu, frequency, min_freq, max_freq, governor
+                 index) u32, record n holds cpu n, cpu is 0xffffffff
+                 for the cpus not online
+    seq is a seqlock: odd while the publisher writes, readers retry when
+    it is odd or changed during their copy.
+
+    The publisher creates the segment aside (O_EXCL, no symlink
+    followed) and renames it into place, so an existing file is never
+    truncated under the readers mapping it; readers only accept a file
+    owned by root or by themselves and not writable by others.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from .cpufreq import CPUState, CPUFreqBaseError
+from .cpuset import CpuSet
+
+
+MAGIC = b"CPUFREQ1"
+HEADER = struct.Struct("<8sQdII")
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+GOVERNORS = 16
+GOVERNOR = struct.Struct("<16s")
+RECORD = struct.Struct("<IIIII")
+RECORDS_OFFSET = HEADER.size + GOVERNORS*GOVERNOR.size
+NO_GOVERNOR = 0xFFFFFFFF
+NO_CPU = 0xFFFFFFFF
+
+if os.path.isdir("/dev/shm"):
+    SHARED_PATH = "/dev/shm/cpufreq"
+else:
+    SHARED_PATH = os.path.join(tempfile.gettempdir(), "cpufreq.shm")
+
+
+def segment_size(slots):
+    return RECORDS_OFFSET + slots*RECORD.size
+
+
+class SharedPublisher:
+    """
+    Sample the state of the online cpus with one snapshot per interval
+    and publish it in a shared memory segment, for any number of
+    SharedState readers. There should be one publisher per path.
+        Attributes
+            path
+            interval
+            slots
+            seq
+        Methods
+            publish()
+            start()
+            stop()
+            close()
+    """
+
+    def __init__(self, cpu, path=SHARED_PATH, interval=0.1):
+        """
+        cpu: cpuFreq instance
+        path: file backing the segment, in a tmpfs like /dev/shm
+        interval: seconds between samples of start()
+        """
+        self.__cpu = cpu
+        self.path = path
+        self.interval = interval
+        try:
+            possible = CpuSet.parse(cpu.backend.read("possible"))
+        except (IOError, OSError, ValueError):
+            possible = CpuSet(cpu.get_online_cpus())
+        self.slots = possible.max() + 1 if possible else 1
+        self.seq = 0
+        self.__governors = []
+        self.__empty = RECORD.pack(NO_CPU, 0, 0, 0, NO_GOVERNOR)*self.slots
+        # mkstemp opens with O_CREAT | O_EXCL | O_NOFOLLOW, in a world
+        # writable directory nothing planted there is opened
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".",
+                                       dir=os.path.dirname(path) or ".")
+        except OSError as e:
+            raise CPUFreqBaseError("ERROR: Could not create the shared "
+                                   "state {}: {}".format(path, e))
+        mm = None
+        try:
+            os.fchmod(fd, 0o644)
+            os.ftruncate(fd, segment_size(self.slots))
+            mm = mmap.mmap(fd, segment_size(self.slots))
+            mm[:HEADER.size] = HEADER.pack(MAGIC, 0, 0.0, self.slots, 0)
+            mm[RECORDS_OFFSET:] = self.__empty
+            # readers of a previous segment keep their mapping of it
+            os.rename(tmp, path)
+        except OSError as e:
+            if mm is not None:
+                mm.close()
+            os.unlink(tmp)
+            raise CPUFreqBaseError("ERROR: Could not create the shared "
+                                   "state {}: {}".format(path, e))
+        finally:
+            os.close(fd)
+        self.__mm = mm
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # private
+    def __governor(self, name):
+        try:
+            return self.__governors.index(name)
+        except ValueError:
+            pass
+        if name is None or len(self.__governors) >= GOVERNORS:
+            return NO_GOVERNOR
+        GOVERNOR.pack_into(self.__mm, HEADER.size +
+                           len(self.__governors)*GOVERNOR.size,
+                           name.encode()[:GOVERNOR.size])
+        self.__governors.append(name)
+        return len(self.__governors) - 1
+
+    def __run(self):
+        while not self.__stop.is_set():
+            begin = time.monotonic()
+            try:
+                self.publish()
+            except (IOError, OSError, CPUFreqBaseError):
+                pass
+            self.__stop.wait(max(0.0, self.interval -
+                                 (time.monotonic() - begin)))
+
+    # interfaces
+    def publish(self):
+        """
+        Take one snapshot and publish it
+        """
+        states = self.__cpu.snapshot()
+        mm = self.__mm
+        data = bytearray(self.__empty)
+        count = 0
+        for c, s in states.items():
+            if c < self.slots:
+                RECORD.pack_into(data, c*RECORD.size, c, s.frequency or 0,
+                                 s.min_freq or 0, s.max_freq or 0,
+                                 self.__governor(s.governor))
+                count += 1
+        SEQ.pack_into(mm, SEQ_OFFSET, self.seq + 1)
+        mm[RECORDS_OFFSET:] = data
+        HEADER.pack_into(mm, 0, MAGIC, self.seq + 1, time.time(), self.slots,
+                         count)
+        self.seq += 2
+        SEQ.pack_into(mm, SEQ_OFFSET, self.seq)
+
+    def start(self):
+        """
+        Publish every interval in a background thread
+        """
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def close(self):
+        """
+        Stop and unmap, the file is left for the readers attached
+        """
+        self.stop()
+        self.__mm.close()
+
+
+class SharedState:
+    """
+    Reader of a segment published by SharedPublisher, see
+    cpuFreq.attach_shared(). Reads are memory copies of the mapping. A
+    restarted publisher replaces the file, attach again to follow it.
+        Attributes
+            path
+            slots
+        Methods
+            read()
+            get()
+            stamp()
+            close()
+    """
+
+    def __init__(self, path=SHARED_PATH, retries=1000, owners=None):
+        """
+        path: file backing the segment
+        retries: copies tried while the publisher is writing
+        owners: uids trusted to publish, default root and the current
+            user
+        """
+        self.path = path
+        self.retries = retries
+        if owners is None:
+            owners = (0, os.geteuid())
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+        except OSError as e:
+            raise CPUFreqBaseError("ERROR: No shared state at {}: {}".format(
+                path, e))
+        try:
+            st = os.fstat(fd)
+            if st.st_uid not in owners or st.st_mode & 0o022:
+                raise CPUFreqBaseError("ERROR: Untrusted shared state {}: "
+                                       "owned by uid {} with mode "
+                                       "{:o}".format(path, st.st_uid,
+                                                     st.st_mode & 0o777))
+            size = st.st_size
+            if size < RECORDS_OFFSET:
+                raise CPUFreqBaseError("ERROR: Invalid shared state "
+                                       "{}".format(path))
+            self.__mm = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, _, _, self.slots, _ = HEADER.unpack_from(self.__mm, 0)
+        if magic != MAGIC or size < segment_size(self.slots):
+            self.__mm.close()
+            raise CPUFreqBaseError("ERROR: Invalid shared state "
+                                   "{}".format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # private
+    def __copy(self, first=0, last=None):
+        """
+        Consistent copy of the header and of the records of cpus first
+        to last
+
+        return: (header fields, records bytes, governors bytes)
+        """
+        mm = self.__mm
+        begin = RECORDS_OFFSET + first*RECORD.size
+        end = RECORDS_OFFSET + (self.slots if last is None
+                                else last + 1)*RECORD.size
+        for _ in range(self.retries):
+            seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+            if not seq & 1:
+                header = HEADER.unpack_from(mm, 0)
+                data = mm[begin:end]
+                names = mm[HEADER.size:RECORDS_OFFSET]
+                if SEQ.unpack_from(mm, SEQ_OFFSET)[0] == seq == header[1]:
+                    return header, data, names
+            # let the publisher finish, it may be a thread of this process
+            time.sleep(0)
+        raise CPUFreqBaseError("ERROR: Shared state kept changing during "
+                               "{} reads".format(self.retries))
+
+    @staticmethod
+    def __governors(names, indexes):
+        govs = {NO_GOVERNOR: None}
+        for index in indexes:
+            if index not in govs:
+                off = index*GOVERNOR.size
+                govs[index] = names[off:off + GOVERNOR.size].rstrip(
+                    b"\0").decode()
+        return govs
+
+    # interfaces
+    def read(self):
+        """
+        Get the last published state
+
+        return: dict cpu -> CPUState
+        """
+        _, data, names = self.__copy()
+        records = [r for r in RECORD.iter_unpack(data) if r[0] != NO_CPU]
+        govs = self.__governors(names, set(r[4] for r in records))
+        return {c: CPUState(govs[g], freq, fmin, fmax)
+                for c, freq, fmin, fmax, g in records}
+
+    def get(self, cpu):
+        """
+        Get the last published state of one cpu, copying its record only
+
+        return: CPUState, None if the cpu was not online
+        """
+        if not 0 <= cpu < self.slots:
+            return None
+        _, data, names = self.__copy(cpu, cpu)
+        c, freq, fmin, fmax, g = RECORD.unpack(data)
+        if c == NO_CPU:
+            return None
+        return CPUState(self.__governors(names, [g])[g], freq, fmin, fmax)
+
+    def stamp(self):
+        """
+        Get the time.time() of the last publication, 0 before the first
+        """
+        return self.__copy()[0][2]
+
+    def close(self):
+        self.__mm.close()
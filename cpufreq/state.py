@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with CPUStateArray class, the compact return format of the
+    cpuFreq integer getters.
+"""
+from array import array
+from collections.abc import Mapping
+
+
+class CPUStateArray(Mapping):
+    """
+    Integer values of a set of cpus kept in two parallel array("I"): cpus
+    (sorted cpu numbers) and data. It reads like a dict cpu -> value, and
+    can be passed back to the getters as out= so polling reuses the same
+    buffers instead of building a dict on every call.
+        Attributes
+            cpus
+            data
+        Methods
+            matches()
+            index()
+            to_dict()
+            numpy()
+    """
+
+    def __init__(self, cpus, data=None):
+        """
+        cpus: cpu numbers, sorted
+        data: values, default zeros
+        """
+        self.cpus = array("I", cpus)
+        if data is None:
+            self.data = array("I", [0])*len(self.cpus)
+        else:
+            self.data = array("I", data)
+        self.__pos = None
+
+    def __getitem__(self, cpu):
+        return self.data[self.index(cpu)]
+
+    def __iter__(self):
+        return iter(self.cpus)
+
+    def __len__(self):
+        return len(self.cpus)
+
+    def __repr__(self):
+        return "CPUStateArray({!r})".format(self.to_dict())
+
+    # interfaces
+    def matches(self, cpus):
+        """
+        Check if the array holds exactly cpus, in this order
+        """
+        return len(cpus) == len(self.cpus) and \
+            all(a == b for a, b in zip(cpus, self.cpus))
+
+    def index(self, cpu):
+        """
+        Get the position of cpu in the arrays, KeyError if absent
+        """
+        if self.__pos is None:
+            self.__pos = {c: i for i, c in enumerate(self.cpus)}
+        return self.__pos[cpu]
+
+    def to_dict(self):
+        """
+        Get the values as dict cpu -> value
+        """
+        return dict(zip(self.cpus, self.data))
+
+    def numpy(self):
+        """
+        Get numpy views of the arrays, without copy: they follow the
+        updates made when the array is reused as out=
+
+        return: (cpus, data) numpy.uint32 arrays
+        """
+        # imported here, numpy takes longer to load than the package
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("numpy is required for CPUStateArray.numpy()")
+        return (numpy.frombuffer(self.cpus, dtype=numpy.uint32),
+                numpy.frombuffer(self.data, dtype=numpy.uint32))
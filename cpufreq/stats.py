@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with the opt-in instrumentation of cpuFreq: call counts, bytes
+    and latency histograms per sysfs attribute, per cpu and per method.
+"""
+from array import array
+import threading
+import time
+
+from .backend import Backend
+
+
+class OperationStats:
+    """
+    Counters of one kind of operation. The latency histogram has power
+    of two buckets in microseconds, bucket i counts latencies below 2**i.
+    """
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.nbytes = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hist = array("L", [0])*OperationStats.BUCKETS
+
+    def add(self, elapsed, nbytes=0, error=False):
+        self.count += 1
+        self.errors += bool(error)
+        self.nbytes += nbytes
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        bucket = min(int(elapsed*1e6).bit_length(), OperationStats.BUCKETS-1)
+        self.hist[bucket] += 1
+
+    def summary(self):
+        """
+        Get the counters as a dict, latencies in seconds and the histogram
+        as upper bound in microseconds -> count
+        """
+        return {"count": self.count,
+                "errors": self.errors,
+                "bytes": self.nbytes,
+                "total": self.total,
+                "mean": self.total/self.count if self.count else 0.0,
+                "max": self.max,
+                "hist": {2**i: n for i, n in enumerate(self.hist) if n}}
+
+
+class Stats:
+    """
+    Collector of the cpuFreq instrumentation
+        Methods
+            add_hooks()
+            record_io()
+            record_call()
+            summary()
+            clear()
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.pre_hooks = []
+        self.post_hooks = []
+        self.clear()
+
+    # private
+    @staticmethod
+    def __cpu_of(fname):
+        head = fname.split("/", 1)[0]
+        if head.startswith("cpu") and head[3:].isdigit():
+            return int(head[3:])
+        return None
+
+    @staticmethod
+    def __get(table, key):
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = OperationStats()
+        return entry
+
+    # interfaces
+    def add_hooks(self, pre=None, post=None):
+        """
+        Register callbacks around every instrumented operation
+
+        pre: called as pre(op, name) before the operation
+        post: called as post(op, name, elapsed, error) after it, error is
+            the exception raised or None
+        op is "read", "write" or "call", name the file or method name
+        """
+        if pre is not None:
+            self.pre_hooks.append(pre)
+        if post is not None:
+            self.post_hooks.append(post)
+
+    def record_io(self, op, fname, elapsed, nbytes, error=None):
+        """
+        Record a sysfs read or write
+        """
+        attr = fname.rsplit("/", 1)[-1]
+        cpu = self.__cpu_of(fname)
+        with self.__lock:
+            self.__get(self.attributes, "%s:%s" % (op, attr)).add(
+                elapsed, nbytes, error is not None)
+            if cpu is not None:
+                self.__get(self.cpus, (cpu, op)).add(
+                    elapsed, nbytes, error is not None)
+
+    def record_call(self, name, elapsed, error=None):
+        """
+        Record a call of a public method
+        """
+        with self.__lock:
+            self.__get(self.methods, name).add(elapsed, 0, error is not None)
+
+    def summary(self):
+        """
+        Get every counter as dicts
+        return: dict with "methods" (name -> counters), "attributes"
+            ("op:attribute" -> counters) and "cpus" (cpu -> op -> counters)
+        """
+        with self.__lock:
+            cpus = {}
+            for (cpu, op), entry in self.cpus.items():
+                cpus.setdefault(cpu, {})[op] = entry.summary()
+            return {"methods": {k: v.summary()
+                                for k, v in self.methods.items()},
+                    "attributes": {k: v.summary()
+                                   for k, v in self.attributes.items()},
+                    "cpus": cpus}
+
+    def clear(self):
+        """
+        Reset every counter, hooks are kept
+        """
+        with self.__lock:
+            self.methods = {}
+            self.attributes = {}
+            self.cpus = {}
+
+
+class InstrumentedBackend(Backend):
+    """
+    Backend wrapper recording the reads and writes of another backend,
+    the other attributes (basedir, files, ...) are the ones of the inner
+    backend
+    """
+
+    def __init__(self, inner, stats):
+        self.inner = inner
+        self.stats = stats
+
+    def __getattr__(self, name):
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    @property
+    def persistent_fds(self):
+        return self.inner.persistent_fds
+
+    @persistent_fds.setter
+    def persistent_fds(self, value):
+        self.inner.persistent_fds = value
+
+    # private
+    def __run(self, op, fname, fn, *args):
+        stats = self.stats
+        for hook in stats.pre_hooks:
+            hook(op, fname)
+        error = None
+        data = None
+        start = time.perf_counter()
+        try:
+            data = fn(fname, *args)
+            return data
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            nbytes = len(args[0]) if args else len(data or "")
+            stats.record_io(op, fname, elapsed, nbytes, error)
+            for hook in stats.post_hooks:
+                hook(op, fname, elapsed, error)
+
+    # interfaces
+    def read(self, fname):
+        return self.__run("read", fname, self.inner.read)
+
+    def write(self, fname, data):
+        return self.__run("write", fname, self.inner.write, data)
+
+    def isfile(self, fname):
+        return self.inner.isfile(fname)
+
+    def listdir(self, fname):
+        return self.inner.listdir(fname)
+
+    def open(self, fname):
+        return self.inner.open(fname)
+
+    def drop(self, prefixes):
+        self.inner.drop(prefixes)
+
+    def close(self):
+        self.inner.close()
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with Sweep class that benchmarks a workload at each frequency
+    and/or governor, with warmup, repetitions, cpu pinning and settle
+    detection.
+"""
+from collections import namedtuple
+import csv
+import json
+import os
+import subprocess
+import threading
+import time
+
+from .cpufreq import cpuFreq, CPUFreqBaseError
+from .energy import EnergyMeter, Measurement
+from .sampler import FrequencySampler
+
+
+SweepRun = namedtuple("SweepRun", ["group", "governor", "frequency",
+                                   "repetition", "wall", "achieved",
+                                   "joules", "settle"])
+SweepRun.__doc__ = """One run of a sweep: wall time in seconds, achieved
+frequency (time weighted mean over the cpus of the group) in KHz, joules
+of the RAPL packages or None, seconds waited for the setting to settle."""
+
+SweepResult = namedtuple("SweepResult", ["group", "governor", "frequency",
+                                         "runs", "wall", "achieved",
+                                         "joules", "edp", "settle"])
+SweepResult.__doc__ = """Summary of the repetitions of one setting: median
+wall time, mean achieved frequency and joules, energy delay product."""
+
+# metric -> (field, lower is better)
+METRICS = {"wall": ("wall", True),
+           "joules": ("joules", True),
+           "edp": ("edp", True),
+           "achieved": ("achieved", False)}
+
+
+def _median(values):
+    values = sorted(values)
+    n = len(values)
+    if not n:
+        return None
+    if n % 2:
+        return values[n//2]
+    return (values[n//2-1] + values[n//2])/2
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return sum(values)/len(values) if values else None
+
+
+class Sweep:
+    """
+    Run a workload at each setting (a frequency with the userspace
+    governor, or a governor) on a group of cpus and record the wall
+    time, achieved frequency and energy. With several independent groups
+    (not sharing a cpufreq policy) the settings are split between them
+    and run in parallel.
+        Attributes
+            settings
+            groups
+            runs
+        Methods
+            run()
+            summary()
+            best()
+            write_csv()
+            write_json()
+    """
+
+    def __init__(self, workload, frequencies=None, governors=None, rg=None,
+                 groups=None, warmup=1, repetitions=3, settle=1.0,
+                 cpu=None, meter=None):
+        """
+        workload: callable, or command as a list or a shell string
+        frequencies: frequencies to sweep in KHz, default all available
+            when no governors are given
+        governors: governors to sweep
+        rg: cpus to run on (pinned), default all online cpus
+        groups: list of rg run in parallel, instead of rg
+        warmup: unmeasured runs after each change of setting
+        repetitions: measured runs of each setting
+        settle: seconds to wait at most for the frequency to settle
+        cpu: cpuFreq instance, default the shared instance
+        meter: EnergyMeter, default one reading the RAPL zones when
+            available, False to not measure energy. Energy is not
+            measured with parallel groups since the packages are shared.
+        """
+        self.__cpu = cpu if cpu is not None else cpuFreq()
+        if frequencies is None and governors is None:
+            frequencies = self.__cpu.available_frequencies
+            if not frequencies:
+                # no frequency table, sweep the hardware limits
+                caps = self.__cpu.get_capabilities()
+                frequencies = [f for f in (caps.min_freq, caps.max_freq)
+                               if f is not None]
+        self.settings = [("userspace", int(f))
+                         for f in sorted(frequencies or [], reverse=True)]
+        self.settings += [(g, None) for g in governors or []]
+        if not self.settings:
+            raise CPUFreqBaseError("ERROR: Nothing to sweep")
+        self.groups = [self.__cpu.select_cpus(g)
+                       for g in (groups if groups else [rg])]
+        self.__check_groups()
+        self.workload = workload
+        self.warmup = warmup
+        self.repetitions = repetitions
+        self.settle = settle
+        if meter is None and len(self.groups) == 1:
+            try:
+                meter = EnergyMeter(["package", "psys"])
+            except CPUFreqBaseError:
+                meter = False
+        self.__meter = meter if len(self.groups) == 1 else False
+        self.__lock = threading.Lock()
+        self.runs = []
+
+    # private
+    def __check_groups(self):
+        topology = self.__cpu.get_topology()
+        seen = {}
+        for i, cpus in enumerate(self.groups):
+            if not cpus:
+                raise CPUFreqBaseError("ERROR: Empty group of cpus")
+            for c in cpus:
+                p = topology.policy_of(c)
+                key = ("cpu", c) if p is None else ("policy", p)
+                if seen.setdefault(key, i) != i:
+                    raise CPUFreqBaseError(
+                        "ERROR: Groups share the cpufreq policy of cpu "
+                        "{}".format(c))
+
+    def __apply(self, governor, freq, cpus):
+        with self.__lock:
+            res = self.__cpu.set_governors(governor, rg=cpus)
+            if freq is not None:
+                res.update(self.__cpu.set_frequencies(freq, rg=cpus))
+        for err in res.values():
+            if err is not None:
+                raise err
+
+    def __wait_settled(self, freq, cpus, tolerance=0.02, stable=3,
+                       interval=0.01):
+        """
+        Wait until scaling_cur_freq of every cpu is within tolerance of
+        freq, or stops moving for a governor, at most settle seconds
+
+        return: seconds waited
+        """
+        backend = self.__cpu.backend
+        files = [backend.open("cpu%i/cpufreq/scaling_cur_freq" % c)
+                 for c in cpus]
+        begin = time.monotonic()
+        try:
+            last = None
+            count = 0
+            while time.monotonic() - begin < self.settle:
+                cur = [int(f.read()) for f in files]
+                if freq is not None:
+                    ok = all(abs(v - freq) <= tolerance*freq for v in cur)
+                else:
+                    ok = last is not None and all(
+                        abs(v - w) <= tolerance*w for v, w in zip(cur, last))
+                count = count + 1 if ok else 0
+                if count >= stable:
+                    break
+                last = cur
+                time.sleep(interval)
+        finally:
+            for f in files:
+                f.close()
+        return time.monotonic() - begin
+
+    def __call(self):
+        if callable(self.workload):
+            self.workload()
+            return
+        try:
+            subprocess.run(self.workload,
+                           shell=isinstance(self.workload, str),
+                           check=True, stdout=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise CPUFreqBaseError("ERROR: Workload failed: {}".format(e))
+
+    def __measure(self, cpus):
+        """
+        Run the workload once
+
+        return: (wall, achieved, joules)
+        """
+        m = Measurement(self.__cpu, cpus, self.__meter)
+        sampler = None
+        if not self.__cpu.backend.isfile(
+                "cpu%i/cpufreq/stats/time_in_state" % cpus[0]):
+            # without the cpufreq stats the frequency is sampled
+            sampler = FrequencySampler(rate=100, rg=cpus, cpu=self.__cpu)
+            sampler.start()
+        m.start()
+        begin = time.perf_counter()
+        try:
+            self.__call()
+        finally:
+            wall = time.perf_counter() - begin
+            if sampler is not None:
+                sampler.stop()
+            m.stop()
+        if sampler is not None:
+            achieved = _mean(sampler.mean().values())
+        else:
+            achieved = _mean(m.mean_frequency.values())
+        if not achieved:
+            # run shorter than the accounting tick, take the current one
+            achieved = _mean(self.__cpu.get_frequencies(cpus).values())
+        joules = sum(m.joules.values()) if m.joules else None
+        return wall, achieved, joules
+
+    def __run_group(self, index, settings, errors):
+        cpus = self.groups[index]
+        affinity = None
+        try:
+            if hasattr(os, "sched_setaffinity"):
+                # pins this thread, commands started from it inherit it
+                allowed = os.sched_getaffinity(0)
+                if allowed & set(cpus):
+                    affinity = allowed
+                    os.sched_setaffinity(0, allowed & set(cpus))
+            for governor, freq in settings:
+                self.__apply(governor, freq, cpus)
+                settle = self.__wait_settled(freq, cpus)
+                for _ in range(self.warmup):
+                    self.__call()
+                for rep in range(self.repetitions):
+                    wall, achieved, joules = self.__measure(cpus)
+                    with self.__lock:
+                        self.runs.append(SweepRun(
+                            index, governor, freq, rep, wall, achieved,
+                            joules, settle))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if affinity is not None:
+                os.sched_setaffinity(0, affinity)
+
+    # interfaces
+    def run(self):
+        """
+        Run the sweep, the governors and frequencies are restored after
+
+        return: list of SweepResult, see summary()
+        """
+        previous = self.__cpu.snapshot(fields=("governor",))
+        # the speed requested, scaling_cur_freq may be measured
+        speeds = self.__cpu.get_setspeed(
+            rg=[c for g in self.groups for c in g])
+        self.runs = []
+        errors = []
+        ngroups = len(self.groups)
+        shares = [self.settings[i::ngroups] for i in range(ngroups)]
+        try:
+            if ngroups == 1:
+                self.__run_group(0, shares[0], errors)
+            else:
+                threads = [threading.Thread(target=self.__run_group,
+                                            args=(i, shares[i], errors))
+                           for i in range(ngroups)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+        finally:
+            by_gov = {}
+            for c in (c for g in self.groups for c in g):
+                if c in previous:
+                    by_gov.setdefault(previous[c].governor, []).append(c)
+            for governor, cpus in by_gov.items():
+                self.__cpu.set_governors(governor, rg=cpus)
+            for c in by_gov.get("userspace", []):
+                if speeds.get(c) is not None:
+                    self.__cpu.set_frequencies(speeds[c], rg=[c])
+        if errors:
+            raise errors[0]
+        return self.summary()
+
+    def summary(self):
+        """
+        Summarize the repetitions of each setting
+
+        return: list of SweepResult, in the order of the settings
+        """
+        by_setting = {}
+        for run in self.runs:
+            key = (run.governor, run.frequency)
+            by_setting.setdefault(key, []).append(run)
+        results = []
+        for governor, freq in self.settings:
+            runs = by_setting.get((governor, freq))
+            if not runs:
+                continue
+            wall = _median([r.wall for r in runs])
+            joules = _mean([r.joules for r in runs])
+            results.append(SweepResult(
+                runs[0].group, governor, freq, len(runs), wall,
+                _mean([r.achieved for r in runs]), joules,
+                joules*wall if joules is not None else None,
+                _mean([r.settle for r in runs])))
+        return results
+
+    def best(self):
+        """
+        Get the best setting for each metric measured
+
+        return: dict metric ("wall", "joules", "edp", "achieved") ->
+            SweepResult
+        """
+        results = self.summary()
+        best = {}
+        for metric, (field, lower) in METRICS.items():
+            candidates = [r for r in results
+                          if getattr(r, field) is not None]
+            if not candidates:
+                continue
+            pick = min if lower else max
+            best[metric] = pick(candidates,
+                                key=lambda r: getattr(r, field))
+        return best
+
+    def write_csv(self, fobj):
+        """
+        Write the summary as CSV to a file object
+        """
+        writer = csv.writer(fobj)
+        writer.writerow(SweepResult._fields)
+        for r in self.summary():
+            writer.writerow(["" if v is None else v for v in r])
+
+    def write_json(self, fobj):
+        """
+        Write the runs, summary and best settings as JSON to a file object
+        """
+        json.dump({"runs": [r._asdict() for r in self.runs],
+                   "summary": [r._asdict() for r in self.summary()],
+                   "best": {k: r._asdict()
+                            for k, r in self.best().items()}},
+                  fobj, indent=1)
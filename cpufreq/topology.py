@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with Topology class that indexes packages, cores, NUMA nodes,
+    cpufreq policies and SMT siblings of the cpus.
+"""
+from array import array
+from os import path
+
+from .cpuset import CpuSet
+
+
+class Topology:
+    """
+    Index of the cpus topology built once from sysfs. Lookups by cpu are
+    array accesses and groups are precomputed tuples.
+        Attributes
+            cpus
+            key
+        Methods
+            package_of()
+            core_of()
+            node_of()
+            policy_of()
+            siblings()
+            package()
+            node()
+            policy()
+            packages()
+            nodes()
+            policies()
+            primary_threads()
+            secondary_threads()
+            select()
+    """
+
+    SELECTORS = ("package", "node", "policy", "primary", "secondary")
+
+    def __init__(self, cpus, read, listdir, key=None):
+        """
+        cpus: cpus to index, cpus without readable topology are skipped
+        read: function returning the content of a file relative to the
+            cpu sysfs directory
+        listdir: function listing a directory relative to the cpu sysfs
+            directory
+        key: value identifying the state the topology was built from
+        """
+        self.key = key
+        size = max(cpus) + 1 if cpus else 0
+        self.__package = array("i", [-1])*size
+        self.__core = array("i", [-1])*size
+        self.__node = array("i", [-1])*size
+        self.__policy = array("i", [-1])*size
+        self.__siblings = {}
+        self.__packages = {}
+        self.__nodes = {}
+        self.__policies = {}
+        self.__primary = []
+        self.__secondary = []
+        self.cpus = []
+
+        for cpu in cpus:
+            base = "cpu%i" % cpu
+            try:
+                names = listdir(base)
+            except (IOError, OSError):
+                continue
+            self.cpus.append(cpu)
+            if "topology" in names:
+                tdir = path.join(base, "topology")
+                self.__package[cpu] = self.__read_int(
+                    read, path.join(tdir, "physical_package_id"))
+                self.__core[cpu] = self.__read_int(
+                    read, path.join(tdir, "core_id"))
+                try:
+                    siblings = list(CpuSet.from_list(read(path.join(
+                        tdir, "thread_siblings_list"))))
+                except (IOError, OSError):
+                    siblings = []
+            else:
+                siblings = []
+            self.__siblings[cpu] = tuple(siblings or [cpu])
+            for name in names:
+                if name.startswith("node") and name[4:].isdigit():
+                    self.__node[cpu] = int(name[4:])
+                    break
+
+        try:
+            names = listdir("cpufreq")
+        except (IOError, OSError):
+            names = []
+        for name in names:
+            if not name.startswith("policy") or not name[6:].isdigit():
+                continue
+            try:
+                related = read(path.join("cpufreq", name, "related_cpus"))
+            except (IOError, OSError):
+                continue
+            for cpu in related.split():
+                cpu = int(cpu)
+                if cpu < size:
+                    self.__policy[cpu] = int(name[6:])
+
+        for cpu in self.cpus:
+            self.__group(self.__packages, self.__package[cpu], cpu)
+            self.__group(self.__nodes, self.__node[cpu], cpu)
+            self.__group(self.__policies, self.__policy[cpu], cpu)
+            if cpu == self.__siblings[cpu][0]:
+                self.__primary.append(cpu)
+            else:
+                self.__secondary.append(cpu)
+        for groups in (self.__packages, self.__nodes, self.__policies):
+            for k in groups:
+                groups[k] = tuple(groups[k])
+        self.__primary = tuple(self.__primary)
+        self.__secondary = tuple(self.__secondary)
+
+    # private
+    @staticmethod
+    def __read_int(read, fname):
+        try:
+            return int(read(fname))
+        except (IOError, OSError, ValueError):
+            return -1
+
+    @staticmethod
+    def __group(groups, k, cpu):
+        if k >= 0:
+            groups.setdefault(k, []).append(cpu)
+
+    @staticmethod
+    def __lookup(index, cpu):
+        if 0 <= cpu < len(index) and index[cpu] >= 0:
+            return index[cpu]
+        return None
+
+    # interfaces
+    def package_of(self, cpu):
+        """
+        Get the physical package id of cpu, None if unknown
+        """
+        return self.__lookup(self.__package, cpu)
+
+    def core_of(self, cpu):
+        """
+        Get the core id of cpu inside its package, None if unknown
+        """
+        return self.__lookup(self.__core, cpu)
+
+    def node_of(self, cpu):
+        """
+        Get the NUMA node of cpu, None if unknown
+        """
+        return self.__lookup(self.__node, cpu)
+
+    def policy_of(self, cpu):
+        """
+        Get the cpufreq policy number of cpu, None if unknown
+        """
+        return self.__lookup(self.__policy, cpu)
+
+    def siblings(self, cpu):
+        """
+        Get the SMT threads sharing the core of cpu, cpu included
+        """
+        return self.__siblings.get(cpu, (cpu,))
+
+    def package(self, n):
+        """
+        Get the cpus of package n
+        """
+        return self.__packages.get(n, ())
+
+    def node(self, n):
+        """
+        Get the cpus of NUMA node n
+        """
+        return self.__nodes.get(n, ())
+
+    def policy(self, n):
+        """
+        Get the cpus of cpufreq policy n
+        """
+        return self.__policies.get(n, ())
+
+    def packages(self):
+        """
+        Get the package ids
+        """
+        return sorted(self.__packages)
+
+    def nodes(self):
+        """
+        Get the NUMA node ids
+        """
+        return sorted(self.__nodes)
+
+    def policies(self):
+        """
+        Get the cpufreq policy numbers
+        """
+        return sorted(self.__policies)
+
+    def primary_threads(self):
+        """
+        Get the first thread of every core
+        """
+        return self.__primary
+
+    def secondary_threads(self):
+        """
+        Get the threads that are not the first of their core
+        """
+        return self.__secondary
+
+    def select(self, selector):
+        """
+        Get the cpus of a selector: "primary", "secondary", "package:N",
+        "node:N" or "policy:N"
+        """
+        kind, _, n = selector.partition(":")
+        kind = kind.strip()
+        if kind == "primary" and not n:
+            return self.__primary
+        if kind == "secondary" and not n:
+            return self.__secondary
+        if kind in ("package", "node", "policy") and n.strip().isdigit():
+            return getattr(self, kind)(int(n))
+        raise ValueError("Invalid cpu selector {!r}, expected one of "
+                         "{}".format(selector, ", ".join(Topology.SELECTORS)))
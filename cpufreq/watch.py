@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+    Module with HotplugWatcher class that keeps the online, offline and
+    present cpu masks up to date from kernel uevents, and notifies cpu
+    hotplug and governor/limit changes.
+"""
+from collections import namedtuple
+from os import path
+import select
+import socket
+import threading
+import time
+
+from .cpuset import CpuSet
+
+
+WatchEvent = namedtuple("WatchEvent", ["kind", "cpu", "attr", "old", "new"])
+WatchEvent.__doc__ = """Change seen by a HotplugWatcher. kind is "hotplug"
+(attr "online", old/new booleans), "governor" or "limits" (attr is the
+cpufreq file, cpu the first cpu of the policy)."""
+
+NETLINK_KOBJECT_UEVENT = 15
+
+
+class HotplugWatcher:
+    """
+    Watch cpu hotplug through netlink uevents, with a polling fallback,
+    and poll the governors and limits of the policies. The masks are kept
+    in memory so cpuFreq can use them without reading sysfs.
+        Attributes
+            netlink
+            poll_interval
+        Methods
+            start()
+            stop()
+            subscribe()
+            unsubscribe()
+            mask()
+            refresh()
+            poll()
+    """
+
+    MASKS = ("online", "offline", "present")
+    ATTRS = {"scaling_governor": "governor",
+             "scaling_min_freq": "limits",
+             "scaling_max_freq": "limits"}
+
+    def __init__(self, cpu, poll_interval=1.0, netlink=True,
+                 watch_attrs=True):
+        """
+        cpu: cpuFreq instance watched
+        poll_interval: seconds between polls of the masks (without
+            netlink) and of the governors and limits
+        netlink: listen to kernel uevents for hotplug
+        watch_attrs: poll governors and limits to notify their changes
+        """
+        self.poll_interval = poll_interval
+        self.netlink = netlink
+        self.__cpu = cpu
+        self.__watch_attrs = watch_attrs
+        self.__lock = threading.RLock()
+        self.__masks = {}
+        self.__attrs = {}
+        self.__callbacks = []
+        self.__sock = None
+        self.__thread = None
+        self.__stop = threading.Event()
+        self.refresh(notify=False)
+        self.__poll_attrs(notify=False)
+
+    # private
+    def __notify(self, events):
+        for callback, kinds in list(self.__callbacks):
+            for event in events:
+                if kinds is None or event.kind in kinds:
+                    callback(event)
+
+    def __leaders(self, online):
+        """
+        First online cpu of each policy
+        """
+        topology = self.__cpu.get_topology()
+        leaders = {}
+        for cpu in CpuSet.from_list(online):
+            policy = topology.policy_of(cpu)
+            key = ("cpu", cpu) if policy is None else ("policy", policy)
+            leaders.setdefault(key, cpu)
+        return sorted(leaders.values())
+
+    def __poll_attrs(self, notify=True):
+        if not self.__watch_attrs:
+            return
+        events = []
+        with self.__lock:
+            online = self.__masks["online"]
+        # outside of the lock: the cpuFreq lock is taken, and cpuFreq
+        # calls take this one while holding it
+        leaders = self.__leaders(online)
+        with self.__lock:
+            current = {}
+            for cpu in leaders:
+                for attr, kind in HotplugWatcher.ATTRS.items():
+                    try:
+                        value = self.__cpu.backend.read(path.join(
+                            "cpu%i" % cpu, "cpufreq", attr)).strip()
+                    except (IOError, OSError):
+                        continue
+                    current[(cpu, attr)] = value
+                    old = self.__attrs.get((cpu, attr))
+                    if old is not None and old != value:
+                        events.append(WatchEvent(kind, cpu, attr, old, value))
+            self.__attrs = current
+        if notify and events:
+            self.__notify(events)
+
+    def __open_netlink(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                 NETLINK_KOBJECT_UEVENT)
+            sock.bind((0, 1))
+        except (AttributeError, OSError):
+            return None
+        return sock
+
+    def __uevent(self, msg):
+        """
+        Check if an uevent is a cpu hotplug
+        """
+        fields = msg.split(b"\0")
+        env = dict(f.split(b"=", 1) for f in fields[1:] if b"=" in f)
+        return env.get(b"SUBSYSTEM") == b"cpu" and \
+            env.get(b"ACTION") in (b"online", b"offline", b"add", b"remove")
+
+    def __run(self):
+        # the polls follow their own clock, uevents of other subsystems
+        # arriving faster than poll_interval must not delay them
+        deadline = time.monotonic() + self.poll_interval
+        while not self.__stop.is_set():
+            now = time.monotonic()
+            if now >= deadline:
+                if self.__sock is None:
+                    self.refresh()
+                self.__poll_attrs()
+                deadline += self.poll_interval
+                if deadline <= now:
+                    # polls missed, restart the clock instead of bursting
+                    deadline = now + self.poll_interval
+                continue
+            if self.__sock is None:
+                self.__stop.wait(deadline - now)
+                continue
+            ready, _, _ = select.select([self.__sock], [], [], deadline - now)
+            if not ready:
+                continue
+            try:
+                msg = self.__sock.recv(65536)
+            except OSError:
+                # uevents were dropped (ENOBUFS), read the masks again
+                self.refresh()
+                continue
+            if self.__uevent(msg):
+                self.refresh()
+
+    # interfaces
+    def start(self):
+        """
+        Start watching on a background thread
+        """
+        if self.__thread is not None:
+            return
+        if self.netlink:
+            self.__sock = self.__open_netlink()
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run,
+                                         name="HotplugWatcher", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop watching
+        """
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+        if self.__sock is not None:
+            self.__sock.close()
+            self.__sock = None
+
+    def subscribe(self, callback, kinds=None):
+        """
+        Call callback(WatchEvent) on changes, from the watcher thread
+
+        kinds: event kinds to receive ("hotplug", "governor", "limits"),
+            default all
+        """
+        self.__callbacks.append((callback, kinds))
+
+    def unsubscribe(self, callback):
+        """
+        Remove every subscription of callback
+        """
+        self.__callbacks = [(cb, kinds) for cb, kinds in self.__callbacks
+                            if cb != callback]
+
+    def mask(self, name):
+        """
+        Get the cached content of the online, offline or present file
+        """
+        with self.__lock:
+            return self.__masks[name]
+
+    def refresh(self, notify=True):
+        """
+        Read the masks again and notify the cpus that changed state
+        """
+        with self.__lock:
+            old = CpuSet.from_list(self.__masks.get("online", ""))
+            backend = self.__cpu.backend
+            for name in HotplugWatcher.MASKS:
+                try:
+                    self.__masks[name] = backend.read(name).strip()
+                except (IOError, OSError):
+                    self.__masks[name] = ""
+            new = CpuSet.from_list(self.__masks["online"])
+        if notify:
+            events = [WatchEvent("hotplug", cpu, "online",
+                                 cpu in old, cpu in new)
+                      for cpu in sorted(old ^ new)]
+            if events:
+                self.__notify(events)
+
+    def poll(self):
+        """
+        Check the masks, governors and limits once
+        """
+        self.refresh()
+        self.__poll_attrs()
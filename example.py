@@ -1,5 +1,4 @@
-from cpufreq import cpuFreq
-from collections import Counter
+from cpufreq import cpuFreq, FrequencySampler
 import time
 
 cpu= cpuFreq()
@@ -33,12 +32,9 @@ print(govs)
 available_freqs= cpu.available_frequencies
 for f in available_freqs[1:]:
     cpu.set_frequencies(f)
-    mfreq= []
-    for _ in range(10):
-        freqs= cpu.get_frequencies()
-        mfreq.append(Counter(freqs))
-        time.sleep(0.1)
-    print(sum(mfreq,Counter()))
+    with FrequencySampler(rate=100) as sampler:
+        time.sleep(1)
+    print(sampler.residency())
     
 cpu.disable_cpu(2)
 print(cpu.get_online_cpus())
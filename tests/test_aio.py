@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+import cpufreq
+from cpufreq.aio import AsyncCPUFreq
+
+
+class TestAsyncCPUFreq(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(8, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+
+    def run_async(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_setters(self):
+        async def main():
+            async with AsyncCPUFreq(self.cpu, max_workers=2) as acpu:
+                res = await acpu.set_governors("userspace")
+                self.assertEqual(res, dict.fromkeys(range(8)))
+                res = await acpu.set_frequencies({"0-3": 2200000,
+                                                  "4-7": 1400000})
+                self.assertEqual(set(res.values()), {None})
+                freqs = await acpu.get_frequencies()
+                states = await acpu.snapshot([0], fields=("governor",))
+                await acpu.reset()
+                return freqs, states
+
+        writes = self.backend.writes
+        freqs, states = self.run_async(main())
+        self.assertEqual(freqs, {c: 2200000 if c < 4 else 1400000
+                                 for c in range(8)})
+        self.assertEqual(states[0].governor, "userspace")
+        # one governor and one frequency write per policy, then the reset
+        self.assertGreaterEqual(self.backend.writes - writes, 8)
+        self.assertEqual(set(self.cpu.get_governors().values()), {"ondemand"})
+
+    def test_write_pool(self):
+        names = set()
+        write = self.backend.write
+
+        def record(fname, data):
+            names.add(threading.current_thread().name)
+            return write(fname, data)
+
+        async def main():
+            async with AsyncCPUFreq(self.cpu, max_workers=2) as acpu:
+                await acpu.set_governors("userspace")
+                for f in (1400000, 1800000, 2200000) * 5:
+                    await acpu.set_frequencies(f)
+
+        with mock.patch.object(self.backend, "write", side_effect=record):
+            self.run_async(main())
+        # the policies are written by the threads of one pool
+        self.assertLessEqual(len(names), 2)
+
+    def test_sample(self):
+        async def main():
+            acpu = AsyncCPUFreq(self.cpu)
+            samples = []
+            async for stamp, states in acpu.sample(0.01, rg=[0, 1],
+                                                   count=3):
+                samples.append((stamp, states))
+            acpu.close()
+            return samples
+
+        samples = self.run_async(main())
+        self.assertEqual(len(samples), 3)
+        self.assertEqual(sorted(samples[0][1]), [0, 1])
+        self.assertAlmostEqual(samples[2][0] - samples[0][0], 0.02)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,327 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import cpufreq
+
+
+class TestMemoryBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(8, policy_size=2, smt=2,
+                                                  packages=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+        self.online = self.cpu.get_online_cpus()
+
+    def test_init(self):
+        self.assertEqual(self.cpu.driver, "acpi-cpufreq")
+        self.assertEqual(self.cpu.available_frequencies,
+                         cpufreq.backend.FAKE_FREQUENCIES)
+        self.assertEqual(self.online, list(range(8)))
+        self.assertIsNot(self.cpu, cpufreq.cpuFreq(
+            backend=cpufreq.MemoryBackend.fake(2)))
+
+    def test_min_max(self):
+        self.cpu.reset()
+        for f in self.cpu.available_frequencies[1:]:
+            self.cpu.set_max_frequencies(f)
+            self.assertEqual(set(self.cpu.get_max_freq().values()), {f})
+        self.cpu.reset()
+        for f in self.cpu.available_frequencies[1:]:
+            self.cpu.set_min_frequencies(f)
+            self.assertEqual(set(self.cpu.get_min_freq().values()), {f})
+
+    def test_set_governors(self):
+        for gov in self.cpu.available_governors:
+            res = self.cpu.set_governors(gov)
+            self.assertEqual(res, dict.fromkeys(self.online))
+            self.assertEqual(self.cpu.get_governors(),
+                             dict.fromkeys(self.online, gov))
+        res = self.cpu.set_governors("nope", rg=[0, 1, 2])
+        self.assertEqual(sorted(res), [0, 1, 2])
+        self.assertTrue(all(isinstance(e, cpufreq.CPUFreqBaseError)
+                            for e in res.values()))
+
+    def test_set_frequencies(self):
+        self.cpu.set_governors("userspace")
+        f = self.cpu.available_frequencies[2]
+        res = self.cpu.set_frequencies(f, rg=[1, 2], workers=2)
+        self.assertEqual(res, {1: None, 2: None})
+        freqs = self.cpu.get_frequencies()
+        # cpus 0-1 and 2-3 share a policy
+        self.assertEqual([freqs[c] for c in range(4)], [f]*4)
+        self.cpu.set_governors("ondemand")
+        res = self.cpu.set_frequencies(f)
+        self.assertTrue(all(e is not None for e in res.values()))
+
+    def test_per_cpu_values(self):
+        # package 0 is cpus 0-1 and 4-5, later keys win
+        res = self.cpu.set_max_frequencies({"package:0": 2600000,
+                                            "package:1": 1800000,
+                                            "4-5": 2200000})
+        self.assertEqual(sorted(res), list(range(8)))
+        self.assertEqual(self.cpu.get_max_freq([0, 2, 4, 6]),
+                         {0: 2600000, 2: 1800000, 4: 2200000, 6: 1800000})
+        self.cpu.set_governors({"0-3": "userspace", "4-7": "performance"})
+        self.assertEqual(self.cpu.get_governors()[2], "userspace")
+        self.assertEqual(self.cpu.get_governors()[7], "performance")
+        # cpus 0 and 1 share a policy
+        res = self.cpu.set_frequencies({0: 1000000, 1: 1400000})
+        self.assertIsInstance(res[0], cpufreq.CPUFreqBaseError)
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            self.cpu.set_min_frequencies({0: "fast"})
+
+    def test_frequency_limits(self):
+        self.cpu.set_max_frequencies(1400000)
+        # raising: max is written before min
+        res = self.cpu.set_frequency_limits({"0-3": (2200000, 2600000),
+                                             "4-7": (None, 3000000)})
+        self.assertEqual(set(res.values()), {None})
+        self.assertEqual(self.cpu.get_min_freq([0, 4]),
+                         {0: 2200000, 4: 1000000})
+        self.assertEqual(self.cpu.get_max_freq([0, 4]),
+                         {0: 2600000, 4: 3000000})
+        # lowering: min is written before max
+        self.cpu.set_frequency_limits((1000000, 1400000), rg=[0, 1])
+        self.assertEqual(self.cpu.get_min_freq([0]), {0: 1000000})
+        self.assertEqual(self.cpu.get_max_freq([0]), {0: 1400000})
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            self.cpu.set_frequency_limits((2600000, 2200000))
+
+    def test_policy_writes(self):
+        writes = self.backend.writes
+        self.cpu.set_governors("performance")
+        self.assertEqual(self.backend.writes - writes, 4)
+
+    def test_policy_groups(self):
+        # one write for the policy of cpus 2-3, one for each other policy
+        writes = self.backend.writes
+        res = self.cpu.set_max_frequencies(1800000, rg=[2, 3, 5])
+        self.assertEqual(res, {2: None, 3: None, 5: None})
+        self.assertEqual(self.backend.writes - writes, 2)
+        # the policy members follow the write, cpu 4 shares it with 5
+        self.assertEqual(self.cpu.get_max_freq([2, 3, 4, 5]),
+                         dict.fromkeys([2, 3, 4, 5], 1800000))
+        res = self.cpu.set_max_frequencies(2200000, workers=4)
+        self.assertEqual(res, dict.fromkeys(self.online))
+        self.assertEqual(set(self.cpu.get_max_freq().values()), {2200000})
+        # an error is reported for every cpu of the policy
+        writes = self.backend.writes
+        res = self.cpu.set_frequencies(1400000, rg=[6, 7], workers=4)
+        self.assertEqual(self.backend.writes - writes, 1)
+        self.assertEqual(sorted(res), [6, 7])
+        self.assertIsInstance(res[7], cpufreq.CPUFreqBaseError)
+        res = self.cpu.set_governors("nope", rg=[0, 1, 7], workers=2)
+        self.assertEqual(sorted(res), [0, 1, 7])
+        self.assertTrue(all(isinstance(e, cpufreq.CPUFreqBaseError)
+                            for e in res.values()))
+
+    def test_write_cache(self):
+        cpu = cpufreq.cpuFreq(backend=self.backend, write_cache=True)
+        cpu.reset()
+        writes = self.backend.writes
+        cpu.reset()
+        self.assertEqual(self.backend.writes, writes)
+        self.assertEqual(cpu.elided_writes, 12)
+        cpu.disable_cpu(3)
+        cpu.reset()
+        self.assertGreater(self.backend.writes, writes)
+
+    def test_write_cache_dependents(self):
+        cpu = cpufreq.cpuFreq(backend=self.backend, write_cache=True)
+        cpu.set_governors("userspace")
+        cpu.set_frequencies(1800000, rg=[0])
+        writes = self.backend.writes
+        cpu.set_frequencies(1800000, rg=[0])
+        self.assertEqual(self.backend.writes, writes)
+        # a new governor resets scaling_setspeed, it is written again
+        cpu.set_governors("performance", rg=[0])
+        cpu.set_governors("userspace", rg=[0])
+        writes = self.backend.writes
+        cpu.set_frequencies(1800000, rg=[0])
+        self.assertEqual(self.backend.writes - writes, 1)
+        self.assertEqual(cpu.get_frequencies([1]), {1: 1800000})
+
+    def test_read_compare(self):
+        cpu = cpufreq.cpuFreq(backend=self.backend, read_compare=True)
+        writes = self.backend.writes
+        cpu.set_governors("conservative")
+        cpu.set_max_frequencies(3000000)
+        self.assertEqual(self.backend.writes, writes)
+        self.assertEqual(cpu.elided_writes, 8)
+        # changed outside of the instance, the value read differs
+        self.backend.write("cpu4/cpufreq/scaling_governor", b"powersave")
+        writes = self.backend.writes
+        cpu.set_governors("conservative")
+        self.assertEqual(self.backend.writes - writes, 1)
+        self.assertEqual(cpu.get_governors()[5], "conservative")
+
+    def test_enable_disable(self):
+        for c in self.online[1:]:
+            self.cpu.disable_cpu(c)
+            self.assertNotIn(c, self.cpu.get_online_cpus())
+            self.cpu.enable_cpu(c)
+            self.assertIn(c, self.cpu.get_online_cpus())
+        self.cpu.disable_cpu(range(1, len(self.online)))
+        self.assertEqual(self.cpu.get_online_cpus(), [0])
+        self.cpu.enable_all_cpu()
+        self.assertEqual(self.cpu.get_online_cpus(), self.online)
+
+    def test_topology(self):
+        topology = self.cpu.get_topology()
+        self.assertEqual(topology.primary_threads(), (0, 1, 2, 3))
+        self.assertEqual(topology.package(1), (2, 3, 6, 7))
+        self.assertEqual(topology.policy(4), (4, 5))
+        self.assertEqual(topology.node_of(6), 1)
+        self.assertEqual(sorted(self.cpu.get_max_freq("package:1")),
+                         [2, 3, 6, 7])
+        self.cpu.disable_hyperthread()
+        self.assertEqual(self.cpu.get_online_cpus(), [0, 1, 2, 3])
+        self.assertIsNot(self.cpu.get_topology(), topology)
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            self.cpu.get_max_freq("socket:0")
+
+    def test_snapshot(self):
+        self.cpu.set_max_frequencies(2200000, rg=[0])
+        snap = self.cpu.snapshot()
+        self.assertEqual(sorted(snap), self.online)
+        self.assertEqual(snap[0].max_freq, 2200000)
+        self.assertEqual(snap[0].governor, "conservative")
+        snap = self.cpu.snapshot(rg=[1], fields=("frequency",))
+        self.assertEqual(snap[1].governor, None)
+
+    def test_snapshot_sweep(self):
+        self.cpu.set_governors("userspace", rg=[2])
+        self.cpu.disable_cpu(5)
+        self.cpu.enable_stats()
+        snap = self.cpu.snapshot()
+        attrs = self.cpu.stats(clear=True)["attributes"]
+        self.cpu.disable_stats()
+        # one read of the online mask and of each attribute per cpu
+        self.assertEqual(attrs["read:online"]["count"], 1)
+        for var in ("scaling_governor", "scaling_cur_freq",
+                    "scaling_min_freq", "scaling_max_freq"):
+            self.assertEqual(attrs["read:" + var]["count"], 7)
+        self.assertNotIn(5, snap)
+        self.assertEqual({c: s.governor for c, s in snap.items()},
+                         self.cpu.get_governors())
+        self.assertEqual({c: s.frequency for c, s in snap.items()},
+                         self.cpu.get_frequencies())
+        self.assertEqual(snap[3].governor, "userspace")
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            self.cpu.snapshot(fields=("voltage",))
+
+    def test_stats(self):
+        self.assertEqual(self.cpu.stats(), {})
+        calls = []
+        self.cpu.enable_stats(post=lambda *args: calls.append(args[:2]))
+        self.cpu.get_frequencies()
+        stats = self.cpu.stats(clear=True)
+        self.assertEqual(stats["methods"]["get_frequencies"]["count"], 1)
+        self.assertEqual(stats["attributes"]["read:scaling_cur_freq"]["count"],
+                         len(self.online))
+        self.assertEqual(sorted(stats["cpus"]), self.online)
+        self.assertIn(("call", "get_frequencies"), calls)
+        self.assertEqual(self.cpu.stats()["methods"], {})
+        self.cpu.disable_stats()
+        self.assertIs(self.cpu.backend, self.backend)
+
+
+class TestSysfsBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        cpufreq.write_fake_sysfs(self.root, 4, policy_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_stats_basedir(self):
+        cpu = cpufreq.cpuFreq(backend=cpufreq.SysfsBackend(self.root))
+        cpu.enable_stats()
+        self.assertEqual(cpu.backend.basedir, self.root)
+        self.assertEqual(cpu.backend.persistent_fds, False)
+        cpu.disable_stats()
+
+    def test_persistent_fds(self):
+        backend = cpufreq.SysfsBackend(self.root)
+        cpu = cpufreq.cpuFreq(backend=backend, persistent_fds=True)
+        self.assertEqual(cpu.get_topology().policy(2), (2, 3))
+        self.assertEqual(set(cpu.get_governors().values()), {"conservative"})
+        cpu.set_max_frequencies(2200000, rg=[3])
+        self.assertEqual(cpu.get_max_freq(rg=[2, 3]), {2: 2200000,
+                                                        3: 2200000})
+        cpu.close_fds()
+
+    def __write(self, fname, value, recreate=False):
+        # the kernel recreates the attributes of a cpu coming back online,
+        # the masks are the same files with a new content
+        fpath = os.path.join(self.root, fname)
+        with open(fpath + ".new" if recreate else fpath, "w") as f:
+            f.write(value)
+        if recreate:
+            os.replace(fpath + ".new", fpath)
+
+    def test_reopen_on_hotplug(self):
+        backend = cpufreq.SysfsBackend(self.root, persistent_fds=True)
+        cpu = cpufreq.cpuFreq(backend=backend)
+        self.assertEqual(cpu.get_max_freq(rg=[3]), {3: 3000000})
+        self.__write("cpu3/cpufreq/scaling_max_freq", "1800000\n", True)
+        # the fd kept open still reads the removed file
+        self.assertEqual(cpu.get_max_freq(rg=[3]), {3: 3000000})
+        self.__write("online", "0-2\n")
+        self.assertEqual(cpu.get_online_cpus(), [0, 1, 2])
+        self.__write("online", "0-3\n")
+        self.assertEqual(cpu.get_max_freq(rg=[3]), {3: 1800000})
+        cpu.close_fds()
+
+    def test_threads(self):
+        backend = cpufreq.SysfsBackend(self.root, persistent_fds=True)
+        cpu = cpufreq.cpuFreq(backend=backend)
+        expected = {"scaling_max_freq": "3000000\n",
+                    "scaling_governor": "conservative\n",
+                    "scaling_available_governors":
+                        " ".join(cpufreq.backend.FAKE_GOVERNORS) + "\n"}
+        errors = []
+
+        def read():
+            try:
+                for i in range(300):
+                    for var, value in expected.items():
+                        fname = "cpu%i/cpufreq/%s" % (i % 4, var)
+                        if backend.read(fname) != value:
+                            errors.append(fname)
+                    cpu.snapshot()
+            except Exception as e:
+                errors.append(e)
+
+        def drop():
+            for i in range(300):
+                backend.drop(["cpu%i" % (i % 4)])
+                cpu.invalidate_cache()
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        threads.append(threading.Thread(target=drop))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        cpu.close_fds()
+        self.assertEqual(errors, [])
+
+    def test_pread_buffer_growth(self):
+        fobj = cpufreq.backend.SysfsFile(
+            os.path.join(self.root, "cpu0", "cpufreq",
+                         "scaling_available_governors"), size=4)
+        try:
+            self.assertEqual(fobj.read().split(),
+                             cpufreq.backend.FAKE_GOVERNORS)
+            self.assertEqual(fobj.read().split(),
+                             cpufreq.backend.FAKE_GOVERNORS)
+        finally:
+            fobj.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
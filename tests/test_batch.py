@@ -0,0 +1,115 @@
+import io
+import unittest
+from unittest import mock
+import cpufreq
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(8, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+
+    def test_clusters(self):
+        # cpus 4-7 are little cores with a lower range
+        for policy in (4, 6):
+            pdir = "cpufreq/policy%i/" % policy
+            self.backend.files[pdir + "scaling_available_frequencies"] = \
+                "1800000 1400000 1000000\n"
+            self.backend.files[pdir + "cpuinfo_max_freq"] = "1800000\n"
+        batch = cpufreq.Batch.parse(self.cpu, """
+            max 0-3=2600000 4-7=1800000
+        """)
+        batch.validate()
+        batch = cpufreq.Batch.parse(self.cpu, "max 2600000 2-5")
+        with self.assertRaisesRegex(cpufreq.CPUFreqBaseError, "on cpu 4"):
+            batch.validate()
+
+    def test_checked_per_policy(self):
+        batch = cpufreq.Batch.parse(self.cpu, """
+            governor userspace
+            governor userspace 0-3
+            max 2600000
+        """)
+        for c in range(8):
+            self.cpu.get_capabilities(c)
+        with mock.patch.object(self.backend, "read",
+                               wraps=self.backend.read) as read:
+            batch.validate()
+        governors = [c for c in read.call_args_list
+                     if c[0][0].endswith("scaling_available_governors")]
+        # one read for each of the 4 policies
+        self.assertEqual(len(governors), 4)
+
+    def test_lines(self):
+        batch = cpufreq.Batch.parse(self.cpu, """
+            # setup
+            governor ondemand
+            governor userspace 0-3
+            frequency 2200000 0-1
+            max 0-3=2600000 4-7=1800000
+            min 1400000 policy:2
+            disable 6-7
+        """)
+        self.assertEqual(len(batch.ops), 6)
+        writes = batch.plan()
+        self.assertEqual([(w.attr, w.value, str(w.cpus)) for w in writes], [
+            ("scaling_governor", "userspace", "0-3"),
+            ("scaling_governor", "ondemand", "4-5"),
+            ("scaling_max_freq", 2600000, "0-3"),
+            ("scaling_min_freq", 1400000, "2-3"),
+            ("scaling_max_freq", 1800000, "4-5"),
+            ("scaling_setspeed", 2200000, "0-1"),
+            ("online", 0, "6-7")])
+        before = self.backend.writes
+        res = batch.apply()
+        self.assertEqual(res["errors"], {})
+        self.assertEqual(self.cpu.get_online_cpus(), list(range(6)))
+        self.assertEqual(self.cpu.get_max_freq(),
+                         {0: 2600000, 1: 2600000, 2: 2600000, 3: 2600000,
+                          4: 1800000, 5: 1800000})
+        self.assertEqual(self.cpu.get_frequencies([0]), {0: 2200000})
+        # one write per policy, plus the two cpus disabled
+        self.assertEqual(self.backend.writes - before, 10)
+        # applied again, nothing is left to write but the frequency
+        again = cpufreq.Batch.parse(self.cpu, "governor userspace 0-3\n"
+                                    "frequency 2200000 0-1\n").plan()
+        self.assertEqual([w.attr for w in again], ["scaling_setspeed"])
+
+    def test_json(self):
+        self.cpu.set_max_frequencies(1400000, rg=[0, 1])
+        text = '[{"op": "disable", "cpus": "6-7"},' \
+               ' {"op": "enable", "cpus": "6-7"},' \
+               ' {"op": "min", "value": 2200000, "cpus": [0, 1]},' \
+               ' {"op": "max", "values": {"0-1": 2600000}}]'
+        batch = cpufreq.Batch.load(self.cpu, io.StringIO(text))
+        writes = batch.plan()
+        # min and max raised: max first keeps min <= max
+        self.assertEqual([w.attr for w in writes],
+                         ["scaling_max_freq", "scaling_min_freq"])
+        before = self.backend.writes
+        res = batch.apply(dry_run=True)
+        self.assertEqual(self.backend.writes, before)
+        self.assertEqual(len(res["writes"]), 2)
+
+    def test_validation(self):
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.Batch.parse(self.cpu, "governor\n")
+        batch = cpufreq.Batch.parse(self.cpu, "governor turbo\n"
+                                    "max 100\n"
+                                    "enable 9\n"
+                                    "min 0=1000000 1=1400000\n"
+                                    "min 3000000 2-3\n"
+                                    "max 1000000 2-3\n")
+        before = self.backend.writes
+        with self.assertRaises(cpufreq.CPUFreqBaseError) as ctx:
+            batch.apply()
+        message = str(ctx.exception)
+        for part in ("turbo", "frequency 100 ", "cpus 9 not present",
+                     "share a policy", "min frequency 3000000"):
+            self.assertIn(part, message)
+        self.assertEqual(self.backend.writes, before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import cpufreq
+from cpufreq.capabilities import CapabilityCache
+
+
+class TestCapabilities(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmp, "cpufreq", "capabilities.json")
+        self.boot_id = os.path.join(self.tmp, "boot_id")
+        with open(self.boot_id, "w") as f:
+            f.write("1234\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_per_policy(self):
+        backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        caps = CapabilityCache(backend)
+        first = caps.get(1)
+        self.assertEqual(first.cpus, [0, 1])
+        self.assertIs(caps.get(0), first)
+        self.assertEqual(first.driver, "acpi-cpufreq")
+        self.assertEqual(first.frequencies, cpufreq.backend.FAKE_FREQUENCIES)
+        self.assertEqual(caps.get(3).cpus, [2, 3])
+
+    def test_no_available_frequencies(self):
+        backend = cpufreq.MemoryBackend.fake(4, driver="intel_pstate",
+                                             available_frequencies=False)
+        cpu = cpufreq.cpuFreq(backend=backend)
+        self.assertEqual(cpu.available_frequencies, [])
+        caps = cpu.get_capabilities()
+        self.assertEqual(caps.min_freq, min(cpufreq.backend.FAKE_FREQUENCIES))
+        self.assertEqual(caps.max_freq, max(cpufreq.backend.FAKE_FREQUENCIES))
+        cpu.set_max_frequencies(caps.min_freq)
+        cpu.reset()
+        self.assertEqual(set(cpu.get_max_freq().values()), {caps.max_freq})
+        self.assertEqual(set(cpu.get_min_freq().values()), {caps.min_freq})
+
+    def test_reset_without_ondemand(self):
+        backend = cpufreq.MemoryBackend.fake(
+            4, driver="intel_pstate", governors=["performance", "powersave"],
+            available_frequencies=False)
+        cpu = cpufreq.cpuFreq(backend=backend)
+        cpu.set_governors("performance")
+        cpu.reset()
+        self.assertEqual(set(cpu.get_governors().values()), {"powersave"})
+        # a governor write refused by the driver is reported
+        real = backend.write
+
+        def write(fname, data):
+            if fname.endswith("scaling_governor"):
+                raise OSError(16, "Device or resource busy")
+            return real(fname, data)
+
+        with mock.patch.object(backend, "write", side_effect=write):
+            with self.assertRaises(cpufreq.CPUFreqBaseError):
+                cpu.reset()
+
+    def test_disk_cache(self):
+        backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        caps = CapabilityCache(backend, self.cache, self.boot_id)
+        expected = caps.get(0)
+        with open(self.cache) as f:
+            self.assertEqual(json.load(f)["key"]["boot_id"], "1234")
+        # same key, the discovery is skipped: the frequencies of the other
+        # tree are not read
+        other = cpufreq.MemoryBackend.fake(4, policy_size=2,
+                                           frequencies=[1000000, 2000000])
+        self.assertEqual(CapabilityCache(other, self.cache,
+                                         self.boot_id).get(1), expected)
+        self.assertEqual(os.listdir(os.path.dirname(self.cache)),
+                         ["capabilities.json"])
+
+    def test_one_write(self):
+        backend = cpufreq.MemoryBackend.fake(8, policy_size=2)
+        caps = CapabilityCache(backend, self.cache, self.boot_id)
+        with mock.patch("os.replace", wraps=os.replace) as replace:
+            for c in range(8):
+                caps.get(c)
+        self.assertEqual(replace.call_count, 1)
+        with open(self.cache) as f:
+            self.assertEqual(len(json.load(f)["policies"]), 4)
+
+    def test_live_governors(self):
+        backend = cpufreq.MemoryBackend.fake(4)
+        CapabilityCache(backend, self.cache, self.boot_id).get(0)
+        cpu = cpufreq.cpuFreq(backend=backend)
+        self.assertNotIn("interactive", cpu.available_governors)
+        # a governor module loaded after the capabilities were cached
+        for c in range(4):
+            backend.write("cpu%i/cpufreq/scaling_available_governors" % c,
+                          b"userspace performance interactive")
+        self.assertIn("interactive", cpu.available_governors)
+        self.assertIn("interactive", cpu.get_capabilities(3).governors)
+        caps = CapabilityCache(backend, self.cache, self.boot_id)
+        self.assertIn("interactive", caps.governors(0))
+        self.assertEqual(caps.get(0).governors,
+                         ["userspace", "performance", "interactive"])
+        with open(self.cache) as f:
+            policies = json.load(f)["policies"]
+        self.assertIn(["userspace", "performance", "interactive"],
+                      [p["governors"] for p in policies if 0 in p["cpus"]])
+
+    def test_invalidation(self):
+        backend = cpufreq.MemoryBackend.fake(2)
+        CapabilityCache(backend, self.cache, self.boot_id).get(0)
+        other = cpufreq.MemoryBackend.fake(2, driver="intel_pstate",
+                                           available_frequencies=False)
+        self.assertEqual(CapabilityCache(other, self.cache,
+                                         self.boot_id).get(0).frequencies, [])
+        with open(self.boot_id, "w") as f:
+            f.write("5678\n")
+        caps = CapabilityCache(backend, self.cache, self.boot_id)
+        self.assertEqual(caps.get(0).driver, "acpi-cpufreq")
+        caps.clear()
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_import_without_sysfs(self):
+        # importing the package must not read the cpu sysfs tree
+        code = ("import builtins, os\n"
+                "seen = []\n"
+                "real = builtins.open\n"
+                "def spy(f, *a, **k):\n"
+                "    seen.append(str(f))\n"
+                "    return real(f, *a, **k)\n"
+                "builtins.open = spy\n"
+                "import cpufreq\n"
+                "print([f for f in seen if f.startswith('/sys')])\n")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.run([sys.executable, "-c", code], cwd=root,
+                             stdout=subprocess.PIPE, check=True)
+        self.assertEqual(out.stdout.strip(), b"[]")
+
+    def test_import_lazy(self):
+        # the optional modules and their heavy dependencies are imported
+        # on first use only
+        heavy = ("asyncio", "http.server", "concurrent.futures", "numpy",
+                 "json", "socket", "cpufreq.aio", "cpufreq.exporter",
+                 "cpufreq.daemon", "cpufreq.controller")
+        code = ("import sys\n"
+                "import cpufreq\n"
+                "print([m for m in {!r} if m in sys.modules])\n"
+                "cpufreq.AsyncCPUFreq, cpufreq.Controller\n"
+                "print('cpufreq.aio' in sys.modules)\n").format(heavy)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.run([sys.executable, "-c", code], cwd=root,
+                             stdout=subprocess.PIPE, check=True)
+        self.assertEqual(out.stdout.split(), [b"[]", b"True"])
+        self.assertIn("Controller", dir(cpufreq))
+        with self.assertRaises(AttributeError):
+            cpufreq.NoSuchName
+
+
+if __name__ == "__main__":
+    unittest.main()
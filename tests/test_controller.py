@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import cpufreq
+from cpufreq.controller import (Controller, OndemandPolicy,
+                                TargetUtilizationPolicy, BudgetPolicy)
+
+FREQS = sorted(cpufreq.backend.FAKE_FREQUENCIES)
+
+
+class TestPolicies(unittest.TestCase):
+
+    def test_ondemand(self):
+        policy = OndemandPolicy(0.8)
+        self.assertEqual(policy.decide(0, 0.9, FREQS[0], FREQS), FREQS[-1])
+        self.assertEqual(policy.decide(0, 0.0, FREQS[-1], FREQS), FREQS[0])
+        self.assertEqual(policy.decide(0, 0.5, FREQS[0], FREQS), 2200000)
+
+    def test_target(self):
+        policy = TargetUtilizationPolicy(0.5)
+        policy.reset(1)
+        freq = FREQS[0]
+        for _ in range(5):
+            freq = policy.decide(0, 1.0, freq, FREQS)
+        self.assertEqual(freq, FREQS[-1])
+
+    def test_budget(self):
+        policy = BudgetPolicy(budget=0.5, hold=2)
+        policy.reset(1)
+        self.assertEqual(policy.decide(0, 0.5, 1800000, FREQS), 1800000)
+        self.assertEqual(policy.decide(0, 0.6, 1800000, FREQS), 2200000)
+        self.assertEqual(policy.decide(0, 0.1, 2200000, FREQS), 2200000)
+        self.assertEqual(policy.decide(0, 0.1, 2200000, FREQS), 1000000)
+
+
+class TestController(unittest.TestCase):
+
+    def setUp(self):
+        self.proc = tempfile.mkdtemp()
+        self.busy = [0]*4
+        self.idle = [0]*4
+        self.write_stat()
+        self.backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+        self.controller = Controller(OndemandPolicy(), cpu=self.cpu,
+                                     proc=self.proc)
+
+    def tearDown(self):
+        self.controller.close()
+        shutil.rmtree(self.proc)
+
+    def write_stat(self):
+        lines = ["cpu  0 0 0 0 0 0 0 0 0 0"]
+        for c in range(4):
+            lines.append("cpu%i %i 0 0 %i 0 0 0 0 0 0" % (c, self.busy[c],
+                                                          self.idle[c]))
+        lines.append("intr 0")
+        with open(os.path.join(self.proc, "stat"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def run_period(self, utils):
+        for c, u in enumerate(utils):
+            self.busy[c] += int(u*100)
+            self.idle[c] += 100 - int(u*100)
+        self.write_stat()
+        return self.controller.tick()
+
+    def test_tick(self):
+        self.controller.start(background=False)
+        self.assertEqual(set(self.cpu.get_governors().values()),
+                         {"userspace"})
+        self.assertEqual(self.run_period([1.0, 0.0, 0.0, 0.0]),
+                         [FREQS[-1], FREQS[0]])
+        self.assertEqual(self.cpu.get_frequencies(),
+                         {0: FREQS[-1], 1: FREQS[-1], 2: FREQS[0],
+                          3: FREQS[0]})
+        writes = self.backend.writes
+        self.run_period([0.0, 0.9, 0.0, 0.0])
+        self.assertEqual(self.backend.writes, writes)
+        self.assertEqual(self.controller.overhead()["count"], 2)
+        self.controller.stop()
+        self.assertEqual(set(self.cpu.get_governors().values()),
+                         {"conservative"})
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            self.controller.tick()
+
+    def test_background(self):
+        controller = Controller(BudgetPolicy(), cpu=self.cpu,
+                                proc=self.proc, period=0.01)
+        with controller:
+            deadline = time.monotonic() + 5
+            while controller.ticks < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        controller.close()
+        self.assertGreaterEqual(controller.ticks, 3)
+        self.assertEqual(set(self.cpu.get_governors().values()),
+                         {"conservative"})
+
+    def test_ladders(self):
+        # the second policy has a shorter frequency table
+        for c in (2, 3):
+            self.backend.write("cpu%i/cpufreq/scaling_available_frequencies"
+                               % c, b"1000000 1400000 1800000")
+        cpu = cpufreq.cpuFreq(backend=self.backend)
+        controller = Controller(OndemandPolicy(), cpu=cpu, proc=self.proc)
+        self.assertEqual(controller.ladders,
+                         [FREQS, [1000000, 1400000, 1800000]])
+        controller.start(background=False)
+        self.controller.close()
+        self.controller = controller
+        self.assertEqual(self.run_period([1.0, 0.0, 1.0, 0.0]),
+                         [FREQS[-1], 1800000])
+        self.assertEqual(cpu.get_frequencies()[3], 1800000)
+
+    def test_loop_error(self):
+        class Broken(OndemandPolicy):
+            def decide(self, group, util, freq, freqs):
+                raise ValueError("broken policy")
+
+        controller = Controller(Broken(), cpu=self.cpu, proc=self.proc,
+                                period=0.01)
+        controller.start()
+        deadline = time.monotonic() + 5
+        while controller.error is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        controller.close()
+        self.assertIsInstance(controller.error, ValueError)
+        self.assertEqual(set(self.cpu.get_governors().values()),
+                         {"conservative"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import cpufreq
+from cpufreq import CpuSet
+
+
+class TestCpuSet(unittest.TestCase):
+
+    def test_parse_format(self):
+        for text in ("0-3,8,10-11", "0", "", "0-63,128-191"):
+            self.assertEqual(CpuSet.parse(text).format(), text)
+        self.assertEqual(list(CpuSet.parse("0-15:2/4")),
+                         [0, 1, 4, 5, 8, 9, 12, 13])
+        cpus = CpuSet.parse("0-7,32")
+        self.assertEqual(cpus.format_mask(), "00000001,000000ff")
+        self.assertEqual(CpuSet.from_mask("00000001,000000ff"), cpus)
+        self.assertEqual(CpuSet.parse("0xff"), CpuSet(range(8)))
+        for text in ("3-1", "a", "1,,2", "0-7:0/2"):
+            with self.assertRaises(ValueError):
+                CpuSet.parse(text)
+
+    def test_algebra(self):
+        a = CpuSet([1, 2, 3])
+        self.assertEqual(list(a | [5]), [1, 2, 3, 5])
+        self.assertEqual(a & {2, 9}, {2})
+        self.assertEqual(a - CpuSet([1]), {2, 3})
+        self.assertEqual(a ^ [3, 4], {1, 2, 4})
+        self.assertEqual([0] | a, {0, 1, 2, 3})
+        self.assertTrue(a.issubset(range(5)))
+        self.assertTrue(a.isdisjoint([0, 4]))
+        self.assertEqual((len(a), a.min(), a.max()), (3, 1, 3))
+        self.assertIn(2, a)
+        self.assertNotIn(4, a)
+        self.assertFalse(CpuSet())
+
+    def test_rg(self):
+        cpu = cpufreq.cpuFreq(backend=cpufreq.MemoryBackend.fake(
+            8, policy_size=2, smt=2, packages=2))
+        self.assertEqual(cpu.select_cpus(CpuSet.parse("2-5")), [2, 3, 4, 5])
+        self.assertEqual(cpu.select_cpus("2-3,6"), [2, 3, 6])
+        self.assertEqual(cpu.select_cpus(["0x3", "package:1", 7]),
+                         [0, 1, 2, 3, 6, 7])
+        res = cpu.set_governors("performance", rg=CpuSet([4, 5, 9]))
+        self.assertEqual(res, {4: None, 5: None})
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpu.select_cpus("1-x")
+
+
+if __name__ == "__main__":
+    unittest.main()
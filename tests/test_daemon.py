@@ -0,0 +1,123 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import cpufreq
+from cpufreq import daemon
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "cpufreq.sock")
+        self.cpu = cpufreq.cpuFreq(backend=cpufreq.MemoryBackend.fake(4))
+        self.server = daemon.CPUFreqDaemon(self.cpu, self.path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = daemon.connect(self.path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.close()
+        shutil.rmtree(self.tmp)
+
+    def test_forward(self):
+        self.assertEqual(self.client.driver, self.cpu.driver)
+        self.assertEqual(self.client.get_frequencies(),
+                         self.cpu.get_frequencies())
+        self.assertEqual(self.client.set_governors("userspace", rg=[1, 2]),
+                         {1: None, 2: None})
+        self.assertEqual(self.cpu.get_governors()[2], "userspace")
+        res = self.client.set_frequencies(1800000, rg=[2, 3])
+        self.assertIsNone(res[2])
+        self.assertIsInstance(res[3], cpufreq.CPUFreqBaseError)
+        self.assertEqual(self.client.snapshot(rg=[2]), self.cpu.snapshot(rg=[2]))
+
+    def test_cpuset(self):
+        res = self.client.set_governors("performance",
+                                        rg=cpufreq.CpuSet([1, 3]))
+        self.assertEqual(res, {1: None, 3: None})
+        self.assertEqual(self.client.get_max_freq(rg=cpufreq.CpuSet([0])),
+                         self.cpu.get_max_freq(rg=[0]))
+        self.assertEqual(self.cpu.get_governors()[3], "performance")
+        out = io.StringIO()
+        argv = ["cpufreq", "setgovernor", "powersave", "--cpus", "0-1"]
+        with mock.patch("sys.argv", argv), \
+                mock.patch("cpufreq.run.connect", return_value=self.client), \
+                contextlib.redirect_stdout(out):
+            cpufreq.run.main()
+        self.assertEqual(self.cpu.get_governors()[1], "powersave")
+
+    def test_cli_stats(self):
+        out = io.StringIO()
+        with mock.patch("sys.argv", ["cpufreq", "--info", "--stats"]), \
+                mock.patch("cpufreq.run.connect", return_value=self.client), \
+                contextlib.redirect_stdout(out):
+            cpufreq.run.main()
+        self.assertIn("read:scaling_cur_freq", out.getvalue())
+        # the daemon does not keep recording for the next clients
+        self.assertEqual(self.cpu.stats(), {})
+        self.cpu.enable_stats()
+        with mock.patch("sys.argv", ["cpufreq", "--info", "--stats"]), \
+                mock.patch("cpufreq.run.connect", return_value=self.client), \
+                contextlib.redirect_stdout(out):
+            cpufreq.run.main()
+        self.assertNotEqual(self.cpu.stats(), {})
+
+    def test_capabilities(self):
+        self.assertEqual(self.client.get_capabilities(cpu=1),
+                         self.cpu.get_capabilities(1))
+        self.assertEqual(self.client.get_available_governors(),
+                         self.cpu.available_governors)
+        # --info asks for the range when the driver lists no frequencies
+        path = os.path.join(self.tmp, "pstate.sock")
+        server = daemon.CPUFreqDaemon(cpufreq.cpuFreq(
+            backend=cpufreq.MemoryBackend.fake(
+                2, driver="intel_pstate", available_frequencies=False)), path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        client = daemon.connect(path)
+        out = io.StringIO()
+        try:
+            with mock.patch("sys.argv", ["cpufreq", "--info"]), \
+                    mock.patch("cpufreq.run.connect", return_value=client), \
+                    contextlib.redirect_stdout(out):
+                cpufreq.run.main()
+        finally:
+            client.close()
+            server.shutdown()
+            thread.join()
+            server.close()
+        self.assertIn("Frequency Range: {} - {}".format(
+            min(cpufreq.backend.FAKE_FREQUENCIES),
+            max(cpufreq.backend.FAKE_FREQUENCIES)), out.getvalue())
+
+    def test_errors(self):
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            self.client.call("close_fds")
+        # only the arguments listed for an operation are accepted
+        for op, args, kwargs in (("enable_stats", [], {"pre": "print"}),
+                                 ("set_governors", ["powersave"],
+                                  {"workers": 1000}),
+                                 ("reset", [None, 2], {}),
+                                 ("set_governors", ["powersave"],
+                                  {"gov": "performance"})):
+            with self.assertRaisesRegex(cpufreq.CPUFreqBaseError, op):
+                self.client.call(op, *args, **kwargs)
+        self.assertEqual(self.cpu.stats(), {})
+        self.assertEqual(set(self.cpu.get_governors().values()),
+                         {"conservative"})
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            daemon.CPUFreqDaemon(self.cpu, self.path)
+        self.assertIsNone(daemon.connect(os.path.join(self.tmp, "none")))
+
+
+if __name__ == "__main__":
+    unittest.main()
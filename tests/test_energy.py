@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import cpufreq
+
+
+class TestEnergyMeter(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend(*cpufreq.fake_powercap(
+            packages=2, max_energy_range_uj=1000000))
+
+    def add(self, zone, uj):
+        fname = zone + "/energy_uj"
+        # the counter goes up to max_energy_range_uj included
+        value = (int(self.backend.read(fname)) + uj) % 1000001
+        self.backend.write(fname, str(value).encode())
+
+    def test_domains(self):
+        meter = cpufreq.EnergyMeter(backend=self.backend)
+        self.assertEqual(meter.domains, [
+            "package-0", "package-0/core", "package-0/dram",
+            "package-1", "package-1/core", "package-1/dram"])
+        meter = cpufreq.EnergyMeter(["package", "package-1/dram"],
+                                    backend=self.backend)
+        self.assertEqual(meter.domains, ["package-0", "package-1",
+                                         "package-1/dram"])
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.EnergyMeter(["gpu"], backend=self.backend)
+
+    def test_wraparound(self):
+        meter = cpufreq.EnergyMeter(["package-0"], backend=self.backend)
+        self.add("intel-rapl:0", 700000)
+        self.assertEqual(meter.sample(), {"package-0": 0.7})
+        self.add("intel-rapl:0", 600000)
+        self.assertAlmostEqual(meter.sample()["package-0"], 1.3)
+        self.assertGreater(meter.power()["package-0"], 0)
+        meter.close()
+
+    def test_measure(self):
+        cpu = cpufreq.cpuFreq(backend=cpufreq.MemoryBackend.fake(4))
+        meter = cpufreq.EnergyMeter(["package"], backend=self.backend)
+        with cpu.measure(meter=meter) as m:
+            self.add("intel-rapl:1", 250000)
+        self.assertEqual(m.joules, {"package-0": 0.0, "package-1": 0.25})
+        self.assertEqual(sorted(m.residency), [0, 1, 2, 3])
+        self.assertGreater(m.elapsed, 0)
+
+
+class TestSysfsPowercap(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        cpufreq.write_fake_powercap(self.root, dram=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_read(self):
+        backend = cpufreq.SysfsBackend(self.root)
+        with cpufreq.EnergyMeter(backend=backend) as meter:
+            backend.write("intel-rapl:0:0/energy_uj", b"1500000")
+            self.assertEqual(meter.sample(), {"package-0": 0.0,
+                                              "package-0/core": 1.5})
+
+    def test_default_meter_closed(self):
+        cpu = cpufreq.cpuFreq(backend=cpufreq.MemoryBackend.fake(2))
+        fds = len(os.listdir("/proc/self/fd"))
+        with mock.patch("cpufreq.energy.SYSFS_POWERCAP", self.root):
+            for _ in range(3):
+                with cpu.measure() as m:
+                    pass
+        self.assertIn("package-0", m.joules)
+        self.assertEqual(len(os.listdir("/proc/self/fd")), fds)
+
+
+if __name__ == "__main__":
+    unittest.main()
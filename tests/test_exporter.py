@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import urllib.request
+import cpufreq
+from cpufreq.exporter import MetricsCollector, MetricsServer, write_textfile
+
+
+class TestExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+
+    def test_render(self):
+        collector = MetricsCollector(self.cpu, ttl=60)
+        text = collector.render().decode()
+        self.assertIn('cpufreq_frequency_hertz{cpu="3"} ', text)
+        self.assertIn('cpufreq_governor{cpu="0",governor="conservative"} 1\n',
+                      text)
+        self.assertIn('cpufreq_max_frequency_hertz{cpu="1"} 3000000000\n',
+                      text)
+        self.assertIn("# TYPE cpufreq_time_in_state_seconds_total counter",
+                      text)
+        self.assertIn('cpufreq_time_in_state_seconds_total{policy="2",'
+                      'frequency="1000000000"} ', text)
+        self.assertNotIn("# EOF", text)
+        om = collector.render(openmetrics=True).decode()
+        self.assertIn("# TYPE cpufreq_time_in_state_seconds counter", om)
+        self.assertTrue(om.endswith("# EOF\n"))
+        # within the ttl the sweep is shared
+        self.assertEqual(collector.sweeps, 1)
+
+    def test_user_hz(self):
+        self.backend.files["cpufreq/policy0/stats/time_in_state"] = \
+            "1000000 500\n3000000 0\n"
+        with mock.patch("os.sysconf", return_value=250):
+            collector = MetricsCollector(self.cpu, ttl=60)
+        text = collector.render().decode()
+        self.assertIn('cpufreq_time_in_state_seconds_total{policy="0",'
+                      'frequency="1000000000"} 2.0\n', text)
+
+    def test_incremental(self):
+        collector = MetricsCollector(self.cpu, ttl=0)
+        body = collector.render()
+        self.assertIs(collector.render(), body)
+        self.assertEqual(collector.sweeps, 2)
+        self.cpu.set_governors("performance", rg=[2])
+        text = collector.render().decode()
+        self.assertIn('cpufreq_governor{cpu="3",governor="performance"} 1',
+                      text)
+        self.assertIn('cpufreq_governor{cpu="0",governor="conservative"} 1',
+                      text)
+
+    def test_http_and_textfile(self):
+        collector = MetricsCollector(self.cpu)
+        server = MetricsServer(collector, ("127.0.0.1", 0))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = "http://127.0.0.1:%i/metrics" % server.server_address[1]
+            with urllib.request.urlopen(url) as r:
+                self.assertIn("text/plain", r.headers["Content-Type"])
+                self.assertEqual(r.read(), collector.render())
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        tmp = tempfile.mkdtemp()
+        try:
+            fpath = os.path.join(tmp, "cpufreq.prom")
+            write_textfile(collector, fpath)
+            with open(fpath, "rb") as f:
+                self.assertEqual(f.read(), collector.render())
+            self.assertEqual(os.listdir(tmp), ["cpufreq.prom"])
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import cpufreq
+from cpufreq.latency import TransitionLatency
+
+
+class TestTransitionLatency(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+
+    def test_pairs(self):
+        res = self.cpu.measure_transition_latency(
+            [1000000, 3000000], [1000000, 3000000], repetitions=3)
+        self.assertEqual(res.source, "scaling_cur_freq")
+        self.assertEqual(res.cpus, [0, 2])
+        summary = res.summary()
+        self.assertEqual(sorted(summary), [(1000000, 3000000),
+                                           (3000000, 1000000)])
+        for st in summary.values():
+            self.assertEqual(st["count"], 6)
+            self.assertEqual(st["timeouts"], 0)
+            self.assertLessEqual(st["min"], st["p50"])
+            self.assertLessEqual(st["write"], st["max"])
+        self.assertEqual(len(res.summary(per_cpu=True)), 4)
+        self.assertEqual(set(self.cpu.get_governors().values()),
+                         {"conservative"})
+
+    def test_summary_percentiles(self):
+        latency = TransitionLatency(1000000, 3000000, rg=[0], cpu=self.cpu)
+        latency.samples = {(0, 1000000, 3000000): [(float(s), 0.0)
+                                                   for s in range(1, 11)]}
+        st = latency.summary()[(1000000, 3000000)]
+        self.assertEqual((st["p50"], st["p90"], st["p99"]), (5.0, 9.0, 10.0))
+
+    def test_restore_setspeed(self):
+        self.cpu.set_governors("userspace", rg=[2])
+        self.cpu.set_frequencies(1800000, rg=[2])
+        # the measured frequency is not the one requested
+        self.backend.write("cpu2/cpufreq/scaling_cur_freq", b"1790000")
+        TransitionLatency(1000000, 3000000, rg=[2], repetitions=1,
+                          cpu=self.cpu).run()
+        self.assertEqual(self.cpu.get_setspeed([2]), {2: 1800000})
+
+    def test_timeout(self):
+        # the limits clamp the target, it is never reached
+        self.cpu.set_max_frequencies(2200000)
+        latency = TransitionLatency(1000000, 3000000, rg=[0],
+                                    repetitions=2, timeout=0.001,
+                                    cpu=self.cpu)
+        summary = latency.run()
+        self.assertEqual(summary[(1000000, 3000000)]["timeouts"], 2)
+        self.assertEqual(summary[(1000000, 3000000)]["count"], 0)
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            TransitionLatency(1000000, 1000000, cpu=self.cpu)
+
+
+if __name__ == "__main__":
+    unittest.main()
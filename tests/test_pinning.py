@@ -0,0 +1,67 @@
+import unittest
+import cpufreq
+
+
+class TestPinned(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+        self.cpu.set_governors({"0-1": "userspace", "2-3": "ondemand"})
+        self.cpu.set_frequencies(1400000, rg=[0, 1])
+
+    def test_restore(self):
+        with self.cpu.pinned(2200000) as p:
+            self.assertEqual(p.writes, 3)
+            self.assertEqual(set(self.cpu.get_governors().values()),
+                             {"userspace"})
+            self.assertEqual(set(self.cpu.get_frequencies().values()),
+                             {2200000})
+        self.assertEqual(self.cpu.get_governors(),
+                         {0: "userspace", 1: "userspace",
+                          2: "ondemand", 3: "ondemand"})
+        self.assertEqual(self.cpu.get_frequencies([0]), {0: 1400000})
+
+    def test_setspeed(self):
+        # the measured frequency is not the one requested
+        self.backend.write("cpu0/cpufreq/scaling_cur_freq", b"1390000")
+        with self.cpu.pinned(1800000, rg=[0]):
+            self.backend.write("cpu0/cpufreq/scaling_cur_freq", b"1790000")
+            with self.cpu.pinned(1800000, rg=[0]) as inner:
+                self.assertEqual(inner.writes, 0)
+        self.assertEqual(self.cpu.get_setspeed([0]), {0: 1400000})
+
+    def test_exception(self):
+        with self.assertRaises(KeyError):
+            with self.cpu.pinned(governor="performance", rg="2-3"):
+                self.assertEqual(self.cpu.get_governors()[2], "performance")
+                raise KeyError
+        self.assertEqual(self.cpu.get_governors()[2], "ondemand")
+
+    def test_nested(self):
+        pin = self.cpu.pinned(3000000)
+        with pin:
+            writes = self.backend.writes
+            with self.cpu.pinned(3000000) as inner:
+                self.assertEqual(inner.writes, 0)
+            self.assertEqual(self.backend.writes, writes)
+            with self.cpu.pinned(1000000, rg=[2]):
+                self.assertEqual(self.cpu.get_frequencies([3]), {3: 1000000})
+            self.assertEqual(self.cpu.get_frequencies([3]), {3: 3000000})
+        self.assertEqual(self.cpu.get_governors()[3], "ondemand")
+
+    def test_decorator(self):
+        @cpufreq.pinned(1800000, rg=[0], cpu=self.cpu)
+        def phase(depth):
+            self.assertEqual(self.cpu.get_frequencies([0]), {0: 1800000})
+            if depth:
+                phase(depth - 1)
+
+        phase(2)
+        self.assertEqual(self.cpu.get_frequencies([0]), {0: 1400000})
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.Pinned(1800000, governor="performance")
+
+
+if __name__ == "__main__":
+    unittest.main()
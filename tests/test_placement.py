@@ -0,0 +1,130 @@
+import os
+import threading
+import unittest
+import cpufreq
+
+
+class TestPlacement(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(8, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+        self.cpu.set_governors("userspace")
+        self.cpu.set_max_frequencies({"0-3": 3000000, "4-7": 1800000})
+        self.cpu.set_frequencies({"0-3": 3000000, "4-7": 1400000})
+        self.affinity = {}
+        self.denied = set()
+
+    def setaffinity(self, tid, cpus):
+        if tid == 99:
+            raise ProcessLookupError
+        if tid in self.denied:
+            raise PermissionError(1, "Operation not permitted")
+        self.affinity[tid] = sorted(cpus)
+
+    def make(self, hysteresis=3):
+        return cpufreq.Placement({"latency": (2600000, None),
+                                  "batch": (None, 1800000)},
+                                 cpu=self.cpu, setaffinity=self.setaffinity,
+                                 hysteresis=hysteresis)
+
+    def test_rebalance(self):
+        placement = self.make()
+        placement.add(10, "latency")
+        placement.add(11, "batch")
+        placement.add(99, "batch")
+        made = placement.rebalance()
+        self.assertEqual(sorted((d.tid, d.reason) for d in made),
+                         [(10, "placed"), (11, "placed"), (99, "exited")])
+        self.assertEqual(self.affinity, {10: [0, 1, 2, 3],
+                                         11: [4, 5, 6, 7]})
+        self.assertEqual(placement.rebalance(), [])
+        # the load changes the current frequencies, not the classes
+        self.cpu.set_frequencies(1000000, rg="0-3")
+        self.assertEqual(placement.rebalance(), [])
+        # the fast cores are capped, the tasks move after the hysteresis
+        self.cpu.set_max_frequencies(1800000, rg="2-3")
+        self.assertEqual(placement.rebalance(), [])
+        self.assertEqual(placement.rebalance(), [])
+        made = placement.rebalance()
+        self.assertEqual([(d.tid, d.reason) for d in made],
+                         [(10, "moved"), (11, "moved")])
+        self.assertEqual(self.affinity[10], [0, 1])
+        self.assertEqual(self.affinity[11], [2, 3, 4, 5, 6, 7])
+        # cpus of a task gone offline, it moves at once
+        self.cpu.disable_cpu([2, 3])
+        made = placement.rebalance()
+        self.assertEqual([(d.tid, d.reason) for d in made], [(11, "moved")])
+        self.assertEqual(self.affinity[11], [4, 5, 6, 7])
+        # no fast core left, the current frequency breaks the tie
+        self.cpu.set_frequencies(1800000, rg="4-5")
+        self.cpu.set_max_frequencies(1800000, rg="0-1")
+        self.assertEqual(placement.rebalance(), [])
+        self.assertEqual(placement.rebalance(), [])
+        made = placement.rebalance()
+        self.assertEqual([(d.tid, d.reason) for d in made],
+                         [(10, "fallback"), (11, "moved")])
+        self.assertEqual(self.affinity[10], [4, 5])
+        self.assertEqual(self.affinity[11], [0, 1, 4, 5, 6, 7])
+        report = placement.report()
+        self.assertEqual(report["latency"]["tasks"], [10])
+        self.assertEqual(len(placement.decisions), 8)
+
+    def test_retry_error(self):
+        placement = self.make()
+        placement.add(12, "latency")
+        self.denied.add(12)
+        made = placement.rebalance()
+        self.assertTrue(made[0].reason.startswith("error: "))
+        self.assertEqual(placement.report()["latency"]["cpus"],
+                         cpufreq.CpuSet())
+        self.denied.clear()
+        made = placement.rebalance()
+        self.assertEqual([(d.tid, d.reason) for d in made], [(12, "placed")])
+        self.assertEqual(self.affinity[12], [0, 1, 2, 3])
+
+    def test_hysteresis(self):
+        placement = self.make()
+        placement.add(10, "batch")
+        placement.rebalance()
+        # a change undone before the hysteresis does not move the task
+        self.cpu.set_max_frequencies(1800000, rg="0-1")
+        self.assertEqual(placement.rebalance(), [])
+        self.assertEqual(placement.rebalance(), [])
+        self.cpu.set_max_frequencies(3000000, rg="0-1")
+        self.assertEqual(placement.rebalance(), [])
+        self.assertEqual(self.affinity[10], [4, 5, 6, 7])
+        placement = self.make(hysteresis=1)
+        placement.add(10, "batch")
+        placement.rebalance()
+        self.cpu.set_max_frequencies(1800000, rg="0-1")
+        self.assertEqual(len(placement.rebalance()), 1)
+
+    def test_watcher(self):
+        watcher = self.cpu.watch(poll_interval=60, netlink=False)
+        placement = self.make()
+        placement.start(interval=60)
+        placement.stop()
+        # the watcher of cpuFreq is left running and subscribed to
+        self.assertIs(self.cpu.watch(), watcher)
+        self.cpu.unwatch()
+        threads = threading.active_count()
+        with self.make() as placement:
+            placement.start(interval=60)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_classes(self):
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.Placement({"bad": (2, 1)}, cpu=self.cpu,
+                              setaffinity=self.setaffinity)
+        placement = self.make()
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            placement.add(1, "unknown")
+        placement.add_threads("batch")
+        self.assertIn(os.getpid(), placement.tasks)
+        placement.remove(os.getpid())
+        self.assertNotIn(os.getpid(), placement.tasks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import cpufreq
+
+
+class TestResidencyTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+
+    def spend(self, policy, freq, ticks):
+        fname = "cpufreq/policy%i/stats/time_in_state" % policy
+        lines = [l.split() for l in self.backend.files[fname].splitlines()]
+        self.backend.files[fname] = "".join(
+            "%s %i\n" % (f, int(t) + (ticks if int(f) == freq else 0))
+            for f, t in lines)
+
+    def test_residency(self):
+        self.spend(0, 3000000, 100)
+        with cpufreq.ResidencyTracker(cpu=self.cpu, trans_table=True) as r:
+            self.spend(0, 3000000, 100)
+            self.spend(0, 1000000, 300)
+            self.spend(2, 2200000, 50)
+            self.cpu.set_governors("powersave", rg=[1])
+        res = r.residency()
+        self.assertEqual(res[0], res[1])
+        self.assertAlmostEqual(res[0][3000000]*3, res[0][1000000])
+        self.assertEqual(r.fractions()[0][1000000], 0.75)
+        self.assertEqual(r.mean_frequency()[0], 1500000)
+        self.assertEqual(r.transitions(), {0: 1, 1: 1, 2: 0, 3: 0})
+        self.assertEqual(r.trans_table()[1], {(3000000, 1000000): 1})
+        self.assertEqual(r.aggregate(rg=[2, 3])[2200000], 2*res[2][2200000])
+
+    def test_reset_counters(self):
+        r = cpufreq.ResidencyTracker(rg=[0], cpu=self.cpu)
+        r.start()
+        self.spend(0, 3000000, 100)
+        first = r.update()[0][3000000]
+        self.backend.files["cpufreq/policy0/stats/time_in_state"] = \
+            "3000000 20\n"
+        r.update()
+        self.assertEqual(r.residency()[0][3000000], first*1.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import time
+import unittest
+import cpufreq
+from cpufreq.sampler import percentile
+
+
+class TestFrequencySampler(unittest.TestCase):
+
+    def setUp(self):
+        self.cpu = cpufreq.cpuFreq(backend=cpufreq.MemoryBackend.fake(2))
+        self.cpu.set_governors("userspace")
+
+    def feed(self, sampler, freqs):
+        # one sample per frequency, without the background thread
+        sampler._FrequencySampler__open()
+        for f in freqs:
+            self.cpu.set_frequencies(f)
+            sampler._FrequencySampler__sample(time.monotonic())
+
+    def test_percentile(self):
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(percentile(list(range(1, 11)), 25), 3)
+        self.assertEqual(percentile(list(range(1, 11)), 90), 9)
+        self.assertEqual(percentile([1, 2, 3], 0), 1)
+        self.assertEqual(percentile([1, 2, 3], 100), 3)
+
+    def test_mean_percentiles(self):
+        sampler = cpufreq.FrequencySampler(capacity=10, cpu=self.cpu)
+        self.feed(sampler, [1000000, 1400000, 1800000, 2200000, 2600000])
+        self.assertEqual(sampler.mean(), {0: 1800000.0, 1: 1800000.0})
+        pct = sampler.percentiles(ps=(0, 25, 50, 100))
+        self.assertEqual(pct[1], {0: 1000000, 25: 1400000, 50: 1800000,
+                                  100: 2600000})
+        self.assertEqual(sampler.residency()[0][2600000], 0.2)
+
+    def test_wraparound(self):
+        sampler = cpufreq.FrequencySampler(capacity=4, cpu=self.cpu)
+        self.assertEqual(sampler.mean(), {0: 0.0, 1: 0.0})
+        freqs = [1000000, 1400000, 1800000, 2200000, 2600000, 3000000]
+        self.feed(sampler, freqs)
+        self.assertEqual(sampler.values()[0], freqs[2:])
+        stamps = sampler.timestamps()
+        self.assertEqual(stamps, sorted(stamps))
+        self.assertEqual(len(stamps), 4)
+        samples = list(sampler.samples(block=False))
+        self.assertEqual([v for _, v in samples],
+                         [(f, f) for f in freqs[2:]])
+
+    def test_thread(self):
+        with cpufreq.FrequencySampler(rate=1000, capacity=8,
+                                      cpu=self.cpu) as sampler:
+            for _ in zip(range(10), sampler.samples()):
+                pass
+        self.assertEqual(len(sampler.values()[0]), 8)
+
+    def test_read_error(self):
+        backend = self.cpu.backend
+        sampler = cpufreq.FrequencySampler(rate=1000, capacity=8,
+                                           cpu=self.cpu)
+        with sampler:
+            samples = sampler.samples()
+            next(samples)
+            # the attribute disappears under the sampling thread
+            del backend.files[backend._MemoryBackend__resolve(
+                "cpu1/cpufreq/scaling_cur_freq")]
+            with self.assertRaises(cpufreq.CPUFreqBaseError):
+                for _ in samples:
+                    pass
+        self.assertIsInstance(sampler.error, cpufreq.CPUFreqBaseError)
+
+
+if __name__ == "__main__":
+    unittest.main()
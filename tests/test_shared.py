@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cpufreq
+
+
+class TestShared(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "cpufreq.shm")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_publish(self):
+        with cpufreq.SharedPublisher(self.cpu, self.path) as publisher:
+            shared = cpufreq.cpuFreq.attach_shared(self.path)
+            self.assertEqual(shared.read(), {})
+            self.assertEqual(shared.stamp(), 0)
+            publisher.publish()
+            self.assertEqual(shared.read(), self.cpu.snapshot())
+            self.cpu.set_governors({"0-1": "userspace", "2-3": "performance"})
+            self.cpu.disable_cpu(3)
+            publisher.publish()
+            states = shared.read()
+            self.assertEqual(sorted(states), [0, 1, 2])
+            self.assertEqual(states[2].governor, "performance")
+            self.assertEqual(states[0], self.cpu.snapshot([0])[0])
+            self.assertEqual(shared.get(2), states[2])
+            self.assertIsNone(shared.get(3))
+            self.assertEqual(publisher.seq, 4)
+            self.assertGreater(shared.stamp(), 0)
+            shared.close()
+
+    def test_replace(self):
+        # a symlink planted at the path is replaced, not followed
+        target = os.path.join(self.tmp, "victim")
+        with open(target, "w") as f:
+            f.write("data")
+        os.symlink(target, self.path)
+        publisher = cpufreq.SharedPublisher(self.cpu, self.path)
+        publisher.publish()
+        with open(target) as f:
+            self.assertEqual(f.read(), "data")
+        self.assertFalse(os.path.islink(self.path))
+        shared = cpufreq.SharedState(self.path)
+        publisher.close()
+        # a restart with fewer slots leaves the old mapping intact
+        small = cpufreq.cpuFreq(backend=cpufreq.MemoryBackend.fake(1))
+        with cpufreq.SharedPublisher(small, self.path) as restarted:
+            restarted.publish()
+            self.assertEqual(sorted(shared.read()), [0, 1, 2, 3])
+            self.assertEqual(restarted.slots, 1)
+        shared.close()
+        self.assertEqual(sorted(os.listdir(self.tmp)),
+                         ["cpufreq.shm", "victim"])
+
+    def test_untrusted(self):
+        cpufreq.SharedPublisher(self.cpu, self.path).close()
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.SharedState(self.path, owners=(os.geteuid() + 1,))
+        os.chmod(self.path, 0o666)
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.SharedState(self.path)
+        os.chmod(self.path, 0o644)
+        os.symlink(self.path, self.path + ".link")
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.SharedState(self.path + ".link")
+        cpufreq.SharedState(self.path).close()
+
+    def test_invalid(self):
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.SharedState(self.path)
+        with open(self.path, "wb") as f:
+            f.write(b"\0"*4096)
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.SharedState(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
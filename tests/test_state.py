@@ -0,0 +1,41 @@
+import unittest
+import importlib.util
+import cpufreq
+from cpufreq import state
+
+
+class TestCPUStateArray(unittest.TestCase):
+
+    def setUp(self):
+        self.cpu = cpufreq.cpuFreq(backend=cpufreq.MemoryBackend.fake(8))
+
+    def test_getters(self):
+        arr = self.cpu.get_max_freq(as_array=True)
+        self.assertIsInstance(arr, cpufreq.CPUStateArray)
+        self.assertEqual(arr, self.cpu.get_max_freq())
+        self.assertEqual(arr.data.typecode, "I")
+        self.assertEqual(list(arr.cpus), list(range(8)))
+        self.cpu.set_max_frequencies(2200000, rg=[3])
+        res = self.cpu.get_max_freq(out=arr)
+        self.assertIs(res, arr)
+        self.assertEqual(arr[3], 2200000)
+        # other cpus, a new array is returned
+        res = self.cpu.get_max_freq(rg=[1, 3], out=arr)
+        self.assertIsNot(res, arr)
+        self.assertEqual(res.to_dict(), {1: 3000000, 3: 2200000})
+        with self.assertRaises(KeyError):
+            res[0]
+
+    @unittest.skipIf(importlib.util.find_spec("numpy") is None,
+                     "numpy is not installed")
+    def test_numpy(self):
+        arr = self.cpu.get_min_freq(as_array=True)
+        cpus, data = arr.numpy()
+        self.assertEqual(cpus.tolist(), list(range(8)))
+        self.cpu.set_min_frequencies(1400000, rg=[0])
+        self.cpu.get_min_freq(out=arr)
+        self.assertEqual(data[0], 1400000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import json
+import unittest
+import cpufreq
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(4, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+        self.calls = 0
+
+    def workload(self):
+        self.calls += 1
+
+    def test_frequencies(self):
+        sweep = cpufreq.Sweep(self.workload, rg=[0, 1], warmup=1,
+                              repetitions=2, settle=0.1, cpu=self.cpu,
+                              meter=False)
+        results = sweep.run()
+        freqs = sorted(self.cpu.available_frequencies, reverse=True)
+        self.assertEqual([r.frequency for r in results], freqs)
+        self.assertEqual([r.achieved for r in results], freqs)
+        self.assertEqual(self.calls, 3*len(freqs))
+        self.assertEqual(len(sweep.runs), 2*len(freqs))
+        self.assertEqual(sweep.best()["achieved"].frequency, freqs[0])
+        self.assertNotIn("joules", sweep.best())
+        # the governors are restored
+        self.assertEqual(set(self.cpu.get_governors().values()),
+                         {"conservative"})
+
+    def test_restore_setspeed(self):
+        self.cpu.set_governors("userspace", rg=[0, 1])
+        self.cpu.set_frequencies(1400000, rg=[0, 1])
+        # the measured frequency is not the one requested
+        self.backend.write("cpu0/cpufreq/scaling_cur_freq", b"1390000")
+        sweep = cpufreq.Sweep(self.workload, rg=[0, 1],
+                              frequencies=[1000000], repetitions=1,
+                              settle=0.1, cpu=self.cpu, meter=False)
+        sweep.run()
+        self.assertEqual(self.cpu.get_governors()[1], "userspace")
+        self.assertEqual(self.cpu.get_setspeed([0, 1, 2]),
+                         {0: 1400000, 1: 1400000, 2: None})
+
+    def test_groups(self):
+        sweep = cpufreq.Sweep(self.workload, frequencies=[1000000, 1400000],
+                              governors=["performance"],
+                              groups=["policy:0", "policy:2"], settle=0.1,
+                              cpu=self.cpu)
+        results = sweep.run()
+        self.assertEqual([(r.group, r.frequency) for r in results],
+                         [(0, 1400000), (1, 1000000), (0, None)])
+        out = io.StringIO()
+        sweep.write_json(out)
+        data = json.loads(out.getvalue())
+        self.assertEqual(len(data["runs"]), 9)
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            cpufreq.Sweep(self.workload, groups=[[0], [1]], cpu=self.cpu)
+
+    def test_command(self):
+        sweep = cpufreq.Sweep(["false"], frequencies=[1000000], settle=0.1,
+                              cpu=self.cpu, meter=False)
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            sweep.run()
+        self.assertEqual(set(self.cpu.get_governors().values()),
+                         {"conservative"})
+
+
+if __name__ == "__main__":
+    unittest.main()
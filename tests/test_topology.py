@@ -0,0 +1,63 @@
+import unittest
+import cpufreq
+
+
+class TestTopology(unittest.TestCase):
+
+    def setUp(self):
+        # 8 cpus, 2 threads per core, 2 packages, policies of 2 cpus
+        self.backend = cpufreq.MemoryBackend.fake(8, policy_size=2, smt=2,
+                                                  packages=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+        self.topology = cpufreq.Topology(range(8), self.backend.read,
+                                         self.backend.listdir)
+
+    def test_ranges(self):
+        # the kernel cpu lists of the tree are written and read by CpuSet
+        self.assertEqual(self.backend.read("online"), "0-7\n")
+        self.assertEqual(self.backend.read("cpu5/topology/"
+                                           "thread_siblings_list"), "1,5\n")
+        self.cpu.disable_cpu([2, 3])
+        self.assertEqual(self.backend.read("offline"), "2-3\n")
+        self.assertEqual(self.backend.read("online"), "0-1,4-7\n")
+
+    def test_index(self):
+        t = self.topology
+        self.assertEqual(t.packages(), [0, 1])
+        self.assertEqual(t.siblings(5), (1, 5))
+        self.assertEqual(t.package_of(5), 0)
+        self.assertEqual(t.policy_of(5), 4)
+        self.assertEqual(t.policies(), [0, 2, 4, 6])
+        self.assertEqual(t.secondary_threads(), (4, 5, 6, 7))
+        self.assertIsNone(t.policy_of(42))
+        self.assertEqual(t.node(3), ())
+
+    def test_select(self):
+        t = self.topology
+        self.assertEqual(t.select("primary"), (0, 1, 2, 3))
+        self.assertEqual(t.select("package:0"), (0, 1, 4, 5))
+        self.assertEqual(t.select("node: 1"), (2, 3, 6, 7))
+        self.assertEqual(t.select("policy:2"), (2, 3))
+        for bad in ("primary:0", "package", "core:1", "policy:x"):
+            with self.assertRaises(ValueError):
+                t.select(bad)
+
+    def test_rg_selectors(self):
+        self.assertEqual(self.cpu.select_cpus("secondary"), [4, 5, 6, 7])
+        self.assertEqual(self.cpu.select_cpus(["policy:0", 6, "3"]),
+                         [0, 1, 3, 6])
+        self.assertEqual(sorted(self.cpu.get_min_freq(rg="package:1")),
+                         [2, 3, 6, 7])
+        self.cpu.set_governors("performance", rg="node:0")
+        govs = self.cpu.get_governors()
+        self.assertEqual([c for c in govs if govs[c] == "performance"],
+                         [0, 1, 4, 5])
+        # selectors only match online cpus
+        self.cpu.disable_cpu(5)
+        self.assertEqual(self.cpu.select_cpus("package:0"), [0, 1, 4])
+        with self.assertRaises(cpufreq.CPUFreqBaseError):
+            self.cpu.select_cpus("core:0")
+
+
+if __name__ == "__main__":
+    unittest.main()
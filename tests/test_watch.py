@@ -0,0 +1,123 @@
+import errno
+import os
+import socket
+import threading
+import time
+import unittest
+import cpufreq
+
+
+class TestHotplugWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = cpufreq.MemoryBackend.fake(8, policy_size=2)
+        self.cpu = cpufreq.cpuFreq(backend=self.backend)
+        self.watcher = self.cpu.watch(poll_interval=60, netlink=False)
+        self.events = []
+        self.cpu.subscribe(self.events.append)
+
+    def tearDown(self):
+        self.cpu.unwatch()
+
+    def test_cached_masks(self):
+        stats = self.cpu.enable_stats()
+        self.assertEqual(self.cpu.get_online_cpus(), list(range(8)))
+        self.assertNotIn("read:online", stats.summary()["attributes"])
+        self.cpu.disable_stats()
+
+    def test_external_hotplug(self):
+        self.backend.write("cpu2/online", b"0")
+        self.assertIn(2, self.cpu.get_online_cpus())
+        self.watcher.poll()
+        self.assertNotIn(2, self.cpu.get_online_cpus())
+        self.assertEqual(self.events, [cpufreq.WatchEvent(
+            "hotplug", 2, "online", True, False)])
+
+    def test_own_hotplug(self):
+        self.cpu.disable_cpu(5)
+        self.assertNotIn(5, self.cpu.get_online_cpus())
+        self.cpu.enable_all_cpu()
+        self.assertEqual(self.cpu.get_online_cpus(), list(range(8)))
+        self.assertEqual([(e.cpu, e.new) for e in self.events],
+                         [(5, False), (5, True)])
+
+    def test_attrs(self):
+        self.backend.write("cpu3/cpufreq/scaling_governor", b"performance")
+        self.backend.write("cpu4/cpufreq/scaling_max_freq", b"2200000")
+        self.watcher.poll()
+        self.assertEqual(sorted(self.events), [
+            ("governor", 2, "scaling_governor", "conservative",
+             "performance"),
+            ("limits", 4, "scaling_max_freq", "3000000", "2200000")])
+        self.cpu.unwatch()
+        self.backend.write("cpu2/online", b"0")
+        self.assertNotIn(2, self.cpu.get_online_cpus())
+
+    def test_attrs_under_uevent_flood(self):
+        self.cpu.unwatch()
+        watcher = cpufreq.HotplugWatcher(self.cpu, poll_interval=0.05)
+        events = []
+        watcher.subscribe(events.append)
+        sock, peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # uevents of another subsystem, more often than the polls
+        watcher._HotplugWatcher__open_netlink = lambda: sock
+        stop = threading.Event()
+
+        def flood():
+            while not stop.is_set():
+                peer.send(b"add@/devices/usb1\0ACTION=add\0SUBSYSTEM=usb")
+                time.sleep(0.001)
+
+        thread = threading.Thread(target=flood)
+        thread.start()
+        watcher.start()
+        try:
+            self.backend.write("cpu6/cpufreq/scaling_governor", b"powersave")
+            deadline = time.monotonic() + 5
+            while not events and time.monotonic() < deadline:
+                time.sleep(0.01)
+            seen = list(events)
+        finally:
+            stop.set()
+            thread.join()
+            watcher.stop()
+            peer.close()
+        self.assertEqual([(e.kind, e.cpu) for e in seen], [("governor", 6)])
+
+    def test_uevents_dropped(self):
+        self.cpu.unwatch()
+        watcher = cpufreq.HotplugWatcher(self.cpu, poll_interval=0.2)
+        events = []
+        watcher.subscribe(events.append)
+        sock, peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+        class Overflowed:
+            # the netlink socket after the kernel dropped uevents
+            def fileno(self):
+                return sock.fileno()
+
+            def recv(self, size):
+                sock.recv(size)
+                raise OSError(errno.ENOBUFS, os.strerror(errno.ENOBUFS))
+
+            def close(self):
+                sock.close()
+
+        watcher._HotplugWatcher__open_netlink = Overflowed
+        watcher.start()
+        try:
+            self.backend.write("cpu3/online", b"0")
+            peer.send(b"lost")
+            deadline = time.monotonic() + 5
+            while not events and time.monotonic() < deadline:
+                time.sleep(0.01)
+            seen = list(events)
+        finally:
+            watcher.stop()
+            peer.close()
+        self.assertEqual(seen, [cpufreq.WatchEvent(
+            "hotplug", 3, "online", True, False)])
+
+
+if __name__ == "__main__":
+    unittest.main()